@@ -1,71 +1,242 @@
 import streamlit as st
+from snowflake.snowpark.exceptions import SnowparkSQLException
 from database import (
-    get_audit_logs, get_response_info, get_response_details, update_response_detail,
+    get_audit_logs, get_response_info, get_response_details, update_response_details,
     get_user_by_username, update_user_allowed_surveys, add_governorate_admin,
     get_health_admins, update_user, update_survey, get_governorates_list, add_user,
-    save_survey, delete_survey, get_all_users, delete_user, get_surveys_list
+    save_survey, delete_survey, get_users_page, delete_user, get_surveys_list,
+    get_survey_response_stats, get_all_regions, get_existing_usernames, bulk_add_users,
+    bulk_update_survey_access, get_audit_daily_summary, get_user_allowed_surveys, get_governorate_admin,
+    get_survey_fields, add_governorate, update_governorate, delete_governorate_from_db,
+    check_governorate_has_regions, add_health_admin, update_health_admin, delete_health_admin_from_db,
+    check_admin_has_users, get_survey_responses, get_survey_info
 )
+from user_import import import_template, read_import_file, validate_import
+from survey_plans import get_survey_plan, compile_field
+from exports import EXPORT_FORMATS, survey_details_frame
+from export_jobs import submit_export_job, get_user_export_jobs, remove_export_job
+from submission_queue import get_submission_queue_stats, retry_failed_submissions
 import json
 import pandas as pd
+import numpy as np
 from datetime import datetime
 
 def show_admin_dashboard():
     st.title("لوحة تحكم النظام")
     
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
-        "إدارة المستخدمين",
-        "إدارة المحافظات", 
-        "إدارة الإدارات الصحية",     
-        "إدارة الاستبيانات", 
-        "عرض البيانات",
-    ])
+    # بخلاف st.tabs التي تنفذ جميع الأقسام في كل تفاعل، لا يُنفذ هنا إلا القسم المختار
+    sections = {
+        "إدارة المستخدمين": manage_users,
+        "إدارة المحافظات": manage_governorates,
+        "إدارة الإدارات الصحية": manage_regions,
+        "إدارة الاستبيانات": manage_surveys,
+        "عرض البيانات": view_data,
+        "سجل التعديلات": view_audit_logs,
+    }
     
-    with tab1:
-        manage_users()
-    
-    with tab2:
-        manage_governorates()
-    
-    with tab3:
-        manage_regions()
+    selected_section = st.radio(
+        "القسم",
+        list(sections),
+        horizontal=True,
+        label_visibility="collapsed",
+        key="admin_section"
+    )
+    st.divider()
     
-    with tab4:
-        manage_surveys()
+    sections[selected_section]()
     
-    with tab5:
-        view_data()
+    display_submission_queue_status()
+
+def display_submission_queue_status():
+    # حالة سجل الإرسال المحلي لهذا الخادم
+    stats = get_submission_queue_stats()
+    st.sidebar.subheader("طابور الإرسال")
+    col1, col2 = st.sidebar.columns(2)
+    col1.metric("بانتظار التسليم", stats['pending'])
+    col2.metric("التأخير (ث)", int(stats['lag_seconds']))
+    col1, col2 = st.sidebar.columns(2)
+    col1.metric("فشل التسليم", stats['failed'])
+    col2.metric("سُلِّم آخر ساعة", stats['delivered_last_hour'])
+    if stats['failed'] and st.sidebar.button("إعادة محاولة الفاشلة", key="retry_failed_submissions"):
+        retry_failed_submissions()
+        st.rerun()
     
+RESPONSE_STATUS_LABELS = {
+    None: "الكل",
+    True: "مكتملة",
+    False: "مسودة"
+}
+
+ROLE_LABELS = {
+    "admin": "مسؤول نظام",
+    "governorate_admin": "مسؤول محافظة",
+    "employee": "موظف"
+}
+
+def reset_page(page_key):
+    # تغيير عوامل التصفية أو حجم الصفحة يعيد الترقيم إلى الصفحة الأولى
+    st.session_state[page_key] = 1
+
+def page_input(page_key):
+    # تصحيح مطلوب من التشغيل السابق يُطبق قبل إنشاء الحقل (لا يمكن تغيير قيمته بعد إنشائه)
+    pending = st.session_state.pop(f"{page_key}_pending", None)
+    if pending is not None:
+        st.session_state[page_key] = pending
+    elif page_key not in st.session_state:
+        st.session_state[page_key] = 1
+    return st.number_input("الصفحة", min_value=1, step=1, key=page_key)
+
+def clamp_page(page_key, page, total_pages):
+    # بعد الحذف أو تغير البيانات قد تتجاوز الصفحة المختارة عدد الصفحات
+    if page > total_pages:
+        st.session_state[f"{page_key}_pending"] = total_pages
+        st.rerun()
+
 def manage_users():
     st.header("إدارة المستخدمين")
     
-    # عرض المستخدمين الحاليين
-    users = get_all_users()
+    # عوامل التصفية (تُطبق في قاعدة البيانات)
+    governorates = get_governorates_list()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        username_filter = st.text_input(
+            "بحث باسم المستخدم", key="users_filter_username", on_change=reset_page, args=("users_page",)
+        )
+    with col2:
+        role_filter = st.selectbox(
+            "الدور",
+            options=[None] + list(ROLE_LABELS),
+            format_func=lambda x: "الكل" if x is None else ROLE_LABELS[x],
+            key="users_filter_role",
+            on_change=reset_page,
+            args=("users_page",)
+        )
+    with col3:
+        gov_filter = st.selectbox(
+            "المحافظة",
+            options=[None] + [g[0] for g in governorates],
+            format_func=lambda x: "الكل" if x is None else next(g[1] for g in governorates if g[0] == x),
+            key="users_filter_gov",
+            on_change=reset_page,
+            args=("users_page",)
+        )
+    with col4:
+        health_admins = get_health_admins(gov_filter) if gov_filter else []
+        admin_filter = st.selectbox(
+            "الإدارة الصحية",
+            options=[None] + [a[0] for a in health_admins],
+            format_func=lambda x: "الكل" if x is None else next(a[1] for a in health_admins if a[0] == x),
+            key="users_filter_admin",
+            on_change=reset_page,
+            args=("users_page",)
+        )
+    
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page_size = st.selectbox(
+            "عدد الصفوف", [25, 50, 100], index=1, key="users_page_size", on_change=reset_page, args=("users_page",)
+        )
+    with col2:
+        page = page_input("users_page")
+    
+    users, total = get_users_page(
+        page=page,
+        page_size=page_size,
+        username=username_filter,
+        role=role_filter,
+        governorate_id=gov_filter,
+        health_admin_id=admin_filter
+    )
+    
+    total_pages = max(1, -(-total // page_size))
+    clamp_page("users_page", page, total_pages)
+    st.caption(f"إجمالي المستخدمين: {total} — الصفحة {page} من {total_pages}")
     
-    # عرض جدول المستخدمين
-    for user in users:
-        col1, col2, col3, col4, col5, col6 = st.columns([2, 2, 2, 2, 1, 1])
+    if not users:
+        st.info("لا يوجد مستخدمون مطابقون")
+    else:
+        df = pd.DataFrame(users)
+        df.insert(0, "select", False)
+        df["role"] = df["role"].map(ROLE_LABELS)
+        df["governorate_name"] = df["governorate_name"].fillna("غير محدد")
+        df["admin_name"] = df["admin_name"].fillna("غير محدد")
+        
+        edited = st.data_editor(
+            df,
+            column_config={
+                "select": st.column_config.CheckboxColumn("تحديد"),
+                "user_id": None,
+                "username": "اسم المستخدم",
+                "role": "الدور",
+                "governorate_name": "المحافظة",
+                "admin_name": "الإدارة الصحية"
+            },
+            disabled=["username", "role", "governorate_name", "admin_name"],
+            hide_index=True,
+            use_container_width=True,
+            key=f"users_grid_{page}_{page_size}"
+        )
+        selected_ids = edited.loc[edited["select"], "user_id"].tolist()
+        
+        col1, col2 = st.columns(2)
         with col1:
-            st.write(user['username'])
+            if st.button("تعديل المحدد", key="edit_selected_user", disabled=len(selected_ids) != 1):
+                st.session_state.editing_user = selected_ids[0]
         with col2:
-            role = "مسؤول نظام" if user['role'] == "admin" else "مسؤول محافظة" if user['role'] == "governorate_admin" else "موظف"
-            st.write(role)
-        with col3:
-            st.write(user['governorate_name'] if user['governorate_name'] else "غير محدد")
-        with col4:
-            st.write(user['admin_name'] if user['admin_name'] else "غير محدد")
-        with col5:
-            if st.button("تعديل", key=f"edit_{user['user_id']}"):
-                st.session_state.editing_user = user['user_id']
-        with col6:
-            if st.button("حذف", key=f"delete_{user['user_id']}"):
-                if delete_user(user['user_id']):
-                    st.rerun()
+            if st.button("حذف المحدد", key="delete_selected_users", disabled=not selected_ids):
+                for user_id in selected_ids:
+                    delete_user(user_id)
+                st.rerun()
     
     if 'editing_user' in st.session_state:
         edit_user_form(st.session_state.editing_user)
     
     with st.expander("إضافة مستخدم جديد"):
         add_user_form()
+    
+    with st.expander("استيراد مستخدمين من ملف"):
+        bulk_import_users_form()
+
+def bulk_import_users_form():
+    st.download_button(
+        "تنزيل نموذج الملف",
+        data=import_template().to_csv(index=False).encode("utf-8-sig"),
+        file_name="users_import_template.csv",
+        mime="text/csv",
+        key="download_import_template"
+    )
+    
+    uploaded_file = st.file_uploader("ملف المستخدمين (CSV أو Excel)", type=["csv", "xlsx", "xls"], key="users_import_file")
+    if not uploaded_file:
+        return
+    
+    try:
+        df = read_import_file(uploaded_file)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    
+    if df.empty:
+        st.warning("الملف لا يحتوي على أي مستخدمين")
+        return
+    
+    existing_usernames = get_existing_usernames(df["username"].unique().tolist())
+    if existing_usernames is None:
+        return
+    
+    errors_df, users_df, user_surveys_df = validate_import(
+        df, get_governorates_list(), get_all_regions(), get_surveys_list(), existing_usernames
+    )
+    
+    if not errors_df.empty:
+        st.error(f"تم العثور على {len(errors_df)} خطأ في الملف، يرجى تصحيحها وإعادة الرفع")
+        st.dataframe(errors_df, use_container_width=True, hide_index=True)
+        return
+    
+    st.success(f"الملف صالح: {len(users_df)} مستخدم و {len(user_surveys_df)} صلاحية استبيان")
+    if st.button("📥 استيراد المستخدمين", key="confirm_users_import"):
+        if bulk_add_users(users_df, user_surveys_df):
+            st.success(f"تم استيراد {len(users_df)} مستخدم بنجاح")
 
 def add_user_form():
     governorates = get_governorates_list()
@@ -332,6 +503,52 @@ def manage_surveys():
     
     with st.expander("إنشاء استبيان جديد"):
         create_survey_form()
+    
+    with st.expander("إتاحة استبيان لمحافظة أو إدارة صحية"):
+        bulk_survey_access_form(surveys)
+
+def bulk_survey_access_form(surveys):
+    governorates = get_governorates_list()
+    if not surveys or not governorates:
+        st.info("يجب وجود استبيانات ومحافظات أولاً")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        survey_id = st.selectbox(
+            "الاستبيان",
+            options=[s[0] for s in surveys],
+            format_func=lambda x: next(s[1] for s in surveys if s[0] == x),
+            key="bulk_access_survey"
+        )
+    with col2:
+        governorate_id = st.selectbox(
+            "المحافظة",
+            options=[g[0] for g in governorates],
+            format_func=lambda x: next(g[1] for g in governorates if g[0] == x),
+            key="bulk_access_gov"
+        )
+    with col3:
+        health_admins = get_health_admins(governorate_id)
+        health_admin_id = st.selectbox(
+            "الإدارة الصحية",
+            options=[None] + [a[0] for a in health_admins],
+            format_func=lambda x: "جميع الإدارات" if x is None else next(a[1] for a in health_admins if a[0] == x),
+            key="bulk_access_admin"
+        )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        grant_clicked = st.button("✅ منح الاستبيان للجميع", key="bulk_access_grant")
+    with col2:
+        revoke_clicked = st.button("🚫 سحب الاستبيان من الجميع", key="bulk_access_revoke")
+    
+    if grant_clicked or revoke_clicked:
+        affected = bulk_update_survey_access(
+            survey_id, grant_clicked, governorate_id=governorate_id, health_admin_id=health_admin_id
+        )
+        if affected is not None:
+            st.success(f"تم تحديث صلاحيات {affected} موظف")
 
 def edit_survey(survey_id):
     survey = get_surveys_list(survey_id=survey_id, include_details=True)
@@ -501,50 +718,100 @@ def create_survey_form():
                     st.rerun()
 
 def display_survey_data(survey_id):
-    survey_info = get_response_info(survey_id)
+    survey_info = get_survey_info(survey_id)
     if not survey_info:
         st.error("الاستبيان المحدد غير موجود")
         return
     
-    survey_name = survey_info[1]
+    survey_name = survey_info[0]
     st.subheader(f"بيانات الاستبيان: {survey_name}")
 
-    # الحصول على عدد الإجابات
-    responses = get_response_details(survey_id)
-    total_responses = len(responses)
+    # عرض الإحصائيات من جداول التجميع
+    stats = get_survey_response_stats(survey_id)
 
-    if total_responses == 0:
+    if stats['total'] == 0:
         st.info("لا توجد بيانات متاحة لهذا الاستبيان بعد")
         return
 
-    # عرض الإحصائيات
-    completed_responses = sum(1 for r in responses if r[5])
-    regions_count = len(set(r[3] for r in responses))
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("إجمالي الإجابات", stats['total'])
+    with col2:
+        st.metric("الإجابات المكتملة", stats['completed'])
+    with col3:
+        st.metric("عدد المناطق", stats['regions'])
 
+    # عوامل التصفية (تُطبق في قاعدة البيانات)
+    governorates = get_governorates_list()
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("إجمالي الإجابات", total_responses)
+        date_range = st.date_input("الفترة", value=(), key=f"data_filter_dates_{survey_id}")
     with col2:
-        st.metric("الإجابات المكتملة", completed_responses)
+        gov_filter = st.selectbox(
+            "المحافظة",
+            options=[None] + [g[0] for g in governorates],
+            format_func=lambda x: "الكل" if x is None else next(g[1] for g in governorates if g[0] == x),
+            key=f"data_filter_gov_{survey_id}"
+        )
     with col3:
-        st.metric("عدد المناطق", regions_count)
+        health_admins = get_health_admins(gov_filter) if gov_filter else []
+        admin_filter = st.selectbox(
+            "الإدارة الصحية",
+            options=[None] + [a[0] for a in health_admins],
+            format_func=lambda x: "الكل" if x is None else next(a[1] for a in health_admins if a[0] == x),
+            key=f"data_filter_admin_{survey_id}"
+        )
+    col1, col2 = st.columns(2)
+    with col1:
+        username_filter = st.text_input("المستخدم", key=f"data_filter_user_{survey_id}")
+    with col2:
+        status_filter = st.selectbox(
+            "الحالة",
+            options=list(RESPONSE_STATUS_LABELS),
+            format_func=RESPONSE_STATUS_LABELS.get,
+            key=f"data_filter_status_{survey_id}"
+        )
+    start_date, end_date = (date_range + (None, None))[:2] if isinstance(date_range, tuple) else (date_range, None)
 
-    # تحضير البيانات للعرض
-    df = pd.DataFrame(
-        [(r[0], r[2], r[3], r[4], r[6], "مكتملة" if r[5] else "مسودة") for r in responses],
-        columns=["ID", "المستخدم", "الإدارة الصحية", "المحافظة", "تاريخ التقديم", "الحالة"]
+    responses = get_survey_responses(
+        survey_id,
+        governorate_id=gov_filter,
+        health_admin_id=admin_filter,
+        username=username_filter,
+        start_date=start_date,
+        end_date=end_date,
+        is_completed=status_filter
     )
+
+    st.caption(f"الإجابات المطابقة: {len(responses)}")
+    if responses.empty:
+        st.info("لا توجد إجابات مطابقة لعوامل التصفية")
+        return
+
+    # تحضير البيانات للعرض
+    st.dataframe(response_summary_frame(responses))
     
-    st.dataframe(df)
+    # تصدير شامل لجميع البيانات
+    export_format = st.radio(
+        "صيغة التصدير",
+        ["excel", "csv", "parquet"],
+        format_func=lambda x: {"excel": "Excel", "csv": "CSV", "parquet": "Parquet"}[x],
+        horizontal=True,
+        key=f"export_format_{survey_id}"
+    )
+    if st.button("تصدير شامل لجميع البيانات", key=f"export_excel_{survey_id}"):
+        if export_format == "excel":
+            export_survey_data_to_excel(survey_id, survey_name, responses)
+        else:
+            if submit_export_job(st.session_state.user_id, survey_id, survey_name, export_format):
+                st.success("تمت إضافة مهمة التصدير، يمكنك متابعة العمل أثناء تجهيز الملف")
     
-    # زر تصدير شامل لجميع البيانات
-    if st.button("تصدير شامل لجميع البيانات إلى Excel", key=f"export_excel_{survey_id}"):
-        export_survey_data_to_excel(survey_id, survey_name, responses)
+    display_export_jobs()
 
     # عرض تفاصيل إجابة محددة
     selected_response_id = st.selectbox(
         "اختر إجابة لعرض وتعديل تفاصيلها",
-        options=[r[0] for r in responses],
+        options=responses["RESPONSE_ID"].tolist(),
         format_func=lambda x: f"إجابة #{x}",
         key=f"select_response_{survey_id}"
     )
@@ -552,38 +819,39 @@ def display_survey_data(survey_id):
     if selected_response_id:
         response_details = get_response_details(selected_response_id)
         if response_details:
-            display_response_details(selected_response_id, response_details)
+            display_response_details(survey_id, selected_response_id, response_details)
+
+def response_summary_frame(responses):
+    # بناء الجدول عموداً بعمود من نتيجة get_survey_responses دون المرور على الصفوف
+    return pd.DataFrame({
+        "ID": responses["RESPONSE_ID"],
+        "المستخدم": responses["USERNAME"],
+        "الإدارة الصحية": responses["ADMIN_NAME"],
+        "المحافظة": responses["GOVERNORATE_NAME"],
+        "تاريخ التقديم": responses["SUBMISSION_DATE"],
+        "الحالة": np.where(responses["IS_COMPLETED"], "مكتملة", "مسودة")
+    })
 
 def export_survey_data_to_excel(survey_id, survey_name, responses):
     import re
     from io import BytesIO
     
     filename = re.sub(r'[^\w\-_]', '_', survey_name) + "_كامل_" + datetime.now().strftime("%Y%m%d_%H%M") + ".xlsx"
+    summary_df = response_summary_frame(responses)
+    
+    # التفاصيل تُجلب قبل إنشاء الملف: فشل الاستعلام لا يترك ملفاً ناقصاً
+    try:
+        details_df = survey_details_frame(survey_id, summary_df["ID"])
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب تفاصيل الإجابات: {str(e)}")
+        return
     
     with pd.ExcelWriter(filename, engine='openpyxl') as writer:
         # 1. ورقة ملخص الإجابات
-        df = pd.DataFrame(
-            [(r[0], r[2], r[3], r[4], r[6], "مكتملة" if r[5] else "مسودة") for r in responses],
-            columns=["ID", "المستخدم", "الإدارة الصحية", "المحافظة", "تاريخ التقديم", "الحالة"]
-        )
-        df.to_excel(writer, sheet_name='ملخص_الإجابات', index=False)
+        summary_df.to_excel(writer, sheet_name='ملخص_الإجابات', index=False)
         
         # 2. ورقة تفاصيل جميع الإجابات
-        all_details = []
-        for response in responses:
-            details = get_response_details(response[0])
-            for detail in details:
-                all_details.append({
-                    "ID الإجابة": response[0],
-                    "الحقل": detail[2],
-                    "القيمة": detail[5],
-                    "أدخلها": response[2],
-                    "تاريخ الإدخال": response[6],
-                    "حالة الإجابة": "مكتملة" if response[5] else "مسودة"
-                })
-        
-        if all_details:
-            details_df = pd.DataFrame(all_details)
+        if not details_df.empty:
             details_df.to_excel(writer, sheet_name='تفاصيل_الإجابات', index=False)
         
         # 3. ورقة حقول الاستبيان
@@ -595,10 +863,7 @@ def export_survey_data_to_excel(survey_id, survey_name, responses):
         fields_df.to_excel(writer, sheet_name='حقول_الاستبيان', index=False)
         
         # 4. ورقة المستخدمين الذين أدخلوا بيانات
-        users_df = pd.DataFrame(
-            [(r[2], r[3], r[4], r[6], "مكتملة" if r[5] else "مسودة") for r in responses],
-            columns=["المستخدم", "الإدارة الصحية", "المحافظة", "تاريخ التقديم", "الحالة"]
-        )
+        users_df = summary_df.drop(columns="ID")
         users_df.drop_duplicates().to_excel(writer, sheet_name='المستخدمين', index=False)
    
     with open(filename, "rb") as f:
@@ -611,10 +876,49 @@ def export_survey_data_to_excel(survey_id, survey_name, responses):
         )
     st.success("تم إنشاء ملف Excel الشامل بنجاح")
 
-def display_response_details(response_id, details):
+@st.fragment(run_every=2)
+def display_export_jobs():
+    jobs = get_user_export_jobs(st.session_state.user_id)
+    if not jobs:
+        return
+    
+    st.subheader("مهام التصدير")
+    status_labels = {
+        'running': "⏳ قيد التنفيذ",
+        'done': "✅ جاهز",
+        'failed': "❌ فشل",
+        'expired': "🗑️ انتهت صلاحية الملف"
+    }
+    
+    for job in jobs:
+        col1, col2, col3 = st.columns([3, 2, 1])
+        with col1:
+            st.write(f"**{job['survey_name']}** ({job['format'].upper()}) - {status_labels[job['status']]}")
+            if job['status'] == 'running':
+                st.progress(job['progress'], text=f"{job['rows']} سجل")
+            elif job['status'] == 'failed':
+                st.caption(job['error'])
+        with col2:
+            if job['status'] == 'done':
+                with open(job['path'], "rb") as f:
+                    st.download_button(
+                        label="تنزيل الملف",
+                        data=f,
+                        file_name=job['filename'],
+                        mime=EXPORT_FORMATS[job['format']][0],
+                        key=f"download_job_{job['job_id']}"
+                    )
+        with col3:
+            if job['status'] != 'running' and st.button("إزالة", key=f"remove_job_{job['job_id']}"):
+                remove_export_job(job['job_id'])
+                st.rerun(scope="fragment")
+
+def display_response_details(survey_id, response_id, details):
     st.subheader(f"تفاصيل الإجابة #{response_id}")
     response_info = get_response_info(response_id)
     if response_info:
+        # خطة العرض حسب نسخة الاستبيان التي أُجيب عليها
+        plan = get_survey_plan(response_info[6], response_info[7])
         st.markdown(f"""
         **الاستبيان:** {response_info[1]}  
         **المستخدم:** {response_info[2]}  
@@ -622,7 +926,13 @@ def display_response_details(response_id, details):
         **المحافظة:** {response_info[4]}  
         **تاريخ التقديم:** {response_info[5]}
         """)
-        
+
+        # الإجابات المؤرشفة للقراءة فقط: التعديل عليها لا يُحفظ
+        if response_info[8]:
+            st.info("هذه الإجابة مؤرشفة ولا يمكن تعديلها")
+            st.table(pd.DataFrame({"الحقل": [d[2] for d in details], "القيمة": [d[5] for d in details]}))
+            return
+
         updates = {}
         
         with st.form(key=f"edit_response_form_{response_id}"):
@@ -634,11 +944,11 @@ def display_response_details(response_id, details):
                     st.markdown(f"**{label}**")
                 with col2:
                     if field_type == 'dropdown':
-                        options_list = json.loads(options) if options else []
+                        field = plan.by_id.get(field_id) or compile_field((field_id, label, field_type, options, False, 0))
                         new_value = st.selectbox(
                             label,
-                            options_list,
-                            index=options_list.index(answer) if answer in options_list else 0,
+                            field.options,
+                            index=field.option_index.get(answer, 0),
                             key=f"dropdown_{detail_id}_{response_id}"
                         )
                     else:
@@ -656,10 +966,8 @@ def display_response_details(response_id, details):
                 save_clicked = st.form_submit_button("💾 حفظ جميع التعديلات")
                 if save_clicked:
                     if updates:
-                        success_count = 0
-                        for detail_id, new_value in updates.items():
-                            if update_response_detail(detail_id, new_value):
-                                success_count += 1
+                        results = update_response_details(response_id, updates)
+                        success_count = sum(1 for ok in results.values() if ok)
                         
                         if success_count == len(updates):
                             st.success("تم تحديث جميع التعديلات بنجاح")
@@ -682,15 +990,89 @@ def view_data():
         st.warning("لا توجد استبيانات متاحة")
         return
         
-    selected_survey = st.selectbox(
+    # الخيارات معرفات الاستبيانات: Streamlit يحول قائمة صفوف Snowpark إلى جدول ويأخذ عمودها الأول
+    surveys_by_id = {s[0]: s for s in surveys}
+    selected_survey_id = st.selectbox(
         "اختر استبيان",
-        surveys,
-        format_func=lambda x: x[1],
+        options=list(surveys_by_id),
+        format_func=lambda x: surveys_by_id[x][1],
         key="survey_select"
     )
     
-    if selected_survey:
-        display_survey_data(selected_survey[0])
+    if selected_survey_id:
+        display_survey_data(selected_survey_id)
+
+AUDIT_TABLES = ["USERS", "USER_SURVEYS", "GOVERNORATE_ADMINS", "SURVEYS", "RESPONSE_DETAILS"]
+AUDIT_ACTIONS = ["INSERT", "UPDATE", "DELETE", "GRANT", "REVOKE", "IMPORT"]
+
+def view_audit_logs():
+    st.header("سجل التعديلات")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        username = st.text_input("المستخدم", key="audit_filter_user")
+    with col2:
+        table_name = st.selectbox("الجدول", [None] + AUDIT_TABLES,
+                                  format_func=lambda x: "الكل" if x is None else x, key="audit_filter_table")
+    with col3:
+        action_type = st.selectbox("الإجراء", [None] + AUDIT_ACTIONS,
+                                   format_func=lambda x: "الكل" if x is None else x, key="audit_filter_action")
+    with col4:
+        date_range = st.date_input("الفترة", value=(), key="audit_filter_dates")
+    
+    include_archive = st.checkbox("تضمين السجلات المؤرشفة", key="audit_include_archive")
+    start_date, end_date = (date_range + (None, None))[:2] if isinstance(date_range, tuple) else (date_range, None)
+    
+    # إعادة الترقيم عند تغيير عوامل التصفية
+    filters = (username, table_name, action_type, start_date, end_date, include_archive)
+    if st.session_state.get('audit_filters') != filters:
+        st.session_state.audit_filters = filters
+        st.session_state.audit_cursors = [None]
+    
+    page_size = 50
+    logs = get_audit_logs(
+        username=username,
+        table_name=table_name,
+        action_type=action_type,
+        start_date=start_date,
+        end_date=end_date,
+        cursor=st.session_state.audit_cursors[-1],
+        page_size=page_size,
+        include_archive=include_archive
+    )
+    
+    if not logs:
+        st.info("لا توجد سجلات مطابقة")
+    else:
+        df = pd.DataFrame(
+            [(l[0], l[1], l[2], l[3], l[4], l[5], l[6], l[7]) for l in logs],
+            columns=["ID", "الوقت", "المستخدم", "الإجراء", "الجدول", "السجل", "القيمة القديمة", "القيمة الجديدة"]
+        )
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("السابق", key="audit_prev", disabled=len(st.session_state.audit_cursors) == 1):
+            st.session_state.audit_cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("التالي", key="audit_next", disabled=len(logs) < page_size):
+            st.session_state.audit_cursors.append((logs[-1][1], logs[-1][0]))
+            st.rerun()
+    with col3:
+        st.caption(f"الصفحة {len(st.session_state.audit_cursors)}")
+    
+    if start_date and end_date:
+        with st.expander("الملخص اليومي للسجلات المؤرشفة"):
+            summary = get_audit_daily_summary(start_date, end_date)
+            if summary:
+                st.dataframe(
+                    pd.DataFrame([tuple(r) for r in summary],
+                                 columns=["اليوم", "المستخدم", "الجدول", "الإجراء", "العدد"]),
+                    use_container_width=True, hide_index=True
+                )
+            else:
+                st.info("لا يوجد ملخص لهذه الفترة")
 
 def manage_governorates():
     st.header("إدارة المحافظات")
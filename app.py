@@ -1,15 +1,30 @@
 import streamlit as st
+from datetime import datetime
 from auth import authenticate, logout
 from admin_views import show_admin_dashboard
 from employee_views import show_employee_dashboard
 from database import init_db, get_user_role
+from loaders import begin_request
 from governorate_admin_views import show_governorate_admin_dashboard
+from submission_queue import start_submission_flusher
+
+@st.cache_resource(show_spinner=False)
+def init_db_once():
+    # إنشاء الجداول والترحيلات مرة واحدة لكل عملية وليس مع كل إعادة تشغيل للسكربت
+    return init_db()
 
 def main():
     st.set_page_config(page_title="نظام إدارة الاستبيانات", page_icon="📋", layout="wide")
     
-    # تهيئة قاعدة البيانات
-    init_db()
+    # نطاق جديد لتجميع الاستعلامات النقطية وحفظ نتائجها في هذا التشغيل
+    begin_request()
+    
+    # تهيئة قاعدة البيانات؛ الفشل لا يُحفظ حتى يُعاد في التشغيل التالي
+    if not init_db_once():
+        init_db_once.clear()
+    
+    # تسليم ما تبقى في سجل الإرسال المحلي (بما في ذلك ما قبل إعادة التشغيل)
+    start_submission_flusher()
     
     # التحقق من حالة الجلسة
     if authenticate():  # إذا كان مسجل الدخول
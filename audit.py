@@ -0,0 +1,123 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+import streamlit as st
+
+# إعدادات كاتب سجل التعديلات
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "2"))
+AUDIT_MAX_PENDING = int(os.getenv("AUDIT_MAX_PENDING", "10000"))
+AUDIT_MAX_BACKOFF_SECONDS = float(os.getenv("AUDIT_MAX_BACKOFF_SECONDS", "60"))
+AUDIT_VALUE_LIMIT = 2000
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_STOP = object()
+_writer = None
+_writer_lock = threading.Lock()
+
+def _format_value(value):
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    return value[:AUDIT_VALUE_LIMIT]
+
+def log_audit_event(action_type, table_name, record_id=None, old_value=None, new_value=None, user_id=None):
+    # يضيف الحدث إلى الطابور فقط؛ الكتابة إلى AUDIT_LOG تتم في الخلفية
+    if user_id is None:
+        user_id = st.session_state.get('user_id')
+    if user_id is None:
+        return
+
+    _ensure_writer()
+    _queue.put_nowait({
+        'user_id': user_id,
+        'action_type': action_type,
+        'table_name': table_name,
+        'record_id': record_id,
+        'old_value': _format_value(old_value),
+        'new_value': _format_value(new_value),
+        # وقت الحدث بتوقيت UTC مع الإزاحة؛ insert_audit_logs يحوله إلى توقيت الجلسة مثل CURRENT_TIMESTAMP()
+        'action_timestamp': datetime.now(timezone.utc).isoformat(sep=' ')
+    })
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="audit-writer", daemon=True)
+            _writer.start()
+
+def _flush(batch):
+    from database import insert_audit_logs
+    if not batch:
+        return []
+    try:
+        written = insert_audit_logs(batch)
+    except Exception as e:
+        # تعذر الاتصال بـ Snowflake: لا يتوقف الكاتب وتُعاد المحاولة لاحقاً
+        logger.warning("تعذرت كتابة سجل التعديلات: %s", e)
+        written = False
+    if not written:
+        # نحتفظ بالدفعة لإعادة المحاولة مع حد أعلى حتى لا تتضخم الذاكرة
+        return batch[-AUDIT_MAX_PENDING:]
+    return []
+
+def _writer_loop():
+    batch = []
+    deadline = None
+    failures = 0
+    while True:
+        timeout = None if deadline is None else max(deadline - datetime.now().timestamp(), 0)
+        try:
+            event = _queue.get(timeout=timeout)
+        except queue.Empty:
+            event = None
+
+        if event is _STOP:
+            while True:
+                try:
+                    pending = _queue.get_nowait()
+                except queue.Empty:
+                    break
+                if pending is not _STOP:
+                    batch.append(pending)
+            _flush(batch)
+            return
+
+        if event is not None:
+            batch.append(event)
+            if deadline is None:
+                deadline = datetime.now().timestamp() + AUDIT_FLUSH_SECONDS
+
+        batch_full = len(batch) >= AUDIT_BATCH_SIZE and not failures
+        if batch_full or (deadline is not None and datetime.now().timestamp() >= deadline):
+            batch = _flush(batch)
+            if batch:
+                # فشل الكتابة: مهلة متزايدة قبل المحاولة التالية بدلاً من تكرارها مع كل حدث جديد
+                failures += 1
+                deadline = datetime.now().timestamp() + min(AUDIT_FLUSH_SECONDS * 2 ** failures,
+                                                            AUDIT_MAX_BACKOFF_SECONDS)
+            else:
+                failures = 0
+                deadline = None
+
+def shutdown_audit_writer(timeout=10):
+    # تفريغ الطابور قبل إنهاء العملية
+    global _writer
+    with _writer_lock:
+        writer = _writer
+        _writer = None
+    if writer is not None:
+        _queue.put(_STOP)
+        writer.join(timeout)
+
+atexit.register(shutdown_audit_writer)
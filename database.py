@@ -1,28 +1,213 @@
 import os
+import re
 import json
-from snowflake.snowpark import Session
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from snowflake.snowpark import Session, Row
 from snowflake.snowpark.exceptions import SnowparkSQLException
+from snowflake.connector.errors import Error as ConnectorError
 import streamlit as st
+import pandas as pd
 from typing import Optional, List, Tuple, Dict
 from datetime import datetime
+from audit import log_audit_event
+from entity_cache import (
+    versioned_cache, invalidate_entities, ENTITIES, ENTITY_GOVERNORATES, ENTITY_HEALTH_ADMINS,
+    ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS, ENTITY_PERMISSIONS, ENTITY_RESPONSE_ARCHIVE
+)
+from loaders import BatchLoader
+
+logger = logging.getLogger(__name__)
+
+# فئات أحمال العمل: لكل فئة مستودع Snowflake ومجمع جلسات مستقل،
+# حتى لا تنتظر عمليات إرسال الموظفين خلف التصدير والتحليلات الثقيلة
+WORKLOAD_INTERACTIVE = "interactive"  # عمليات الكتابة والقراءة السريعة للمستخدمين
+WORKLOAD_DASHBOARD = "dashboard"      # قراءات لوحات التحكم
+WORKLOAD_BULK = "bulk"                # التصدير والتجميع والعمليات الجماعية والمهام الخلفية
+WORKLOAD_SUBMIT = "submit"            # تسليم سجل الإرسال وكتابة سجل التعديلات من الخيوط الخلفية
+
+WORKLOAD_WAREHOUSES = {
+    WORKLOAD_INTERACTIVE: os.getenv("SNOWFLAKE_WAREHOUSE_INTERACTIVE") or os.getenv("SNOWFLAKE_WAREHOUSE"),
+    WORKLOAD_SUBMIT: (os.getenv("SNOWFLAKE_WAREHOUSE_SUBMIT") or os.getenv("SNOWFLAKE_WAREHOUSE_INTERACTIVE")
+                      or os.getenv("SNOWFLAKE_WAREHOUSE")),
+    WORKLOAD_DASHBOARD: os.getenv("SNOWFLAKE_WAREHOUSE_DASHBOARD") or os.getenv("SNOWFLAKE_WAREHOUSE"),
+    WORKLOAD_BULK: os.getenv("SNOWFLAKE_WAREHOUSE_BULK") or os.getenv("SNOWFLAKE_WAREHOUSE"),
+}
+
+# أقصى فترة بين فحوص حالة الاستعلامات غير المتزامنة
+ASYNC_POLL_MAX_SECONDS = float(os.getenv("SNOWFLAKE_ASYNC_POLL_MAX_SECONDS", "0.5"))
+
+# طريقة تخزين الإجابات: rows صف لكل حقل في RESPONSE_DETAILS، أو document عمود ANSWERS
+# (VARIANT بمفاتيح معرفات الحقول) في صف الإجابة نفسه. في وضع document تُقرأ الإجابات التي
+# لم تُرحَّل بعد من RESPONSE_DETAILS، لذا يمكن تفعيله قبل تشغيل الترحيل (jobs.py migrate-responses)
+STORAGE_ROWS = "rows"
+STORAGE_DOCUMENT = "document"
+RESPONSE_STORAGE_MODE = os.getenv("RESPONSE_STORAGE_MODE", STORAGE_ROWS)
+
+# طبقات تخزين الإجابات: (جدول الإجابات، جدول التفاصيل) للبيانات الحالية والأرشيف
+RESPONSE_TABLES = ("RESPONSES", "RESPONSE_DETAILS")
+RESPONSE_ARCHIVE_TABLES = ("RESPONSES_ARCHIVE", "RESPONSE_DETAILS_ARCHIVE")
+RESPONSE_ARCHIVE_NAME = 'RESPONSES'
+
+WORKLOAD_POOL_SIZES = {
+    WORKLOAD_INTERACTIVE: int(os.getenv("SNOWFLAKE_POOL_SIZE_INTERACTIVE", "8")),
+    WORKLOAD_DASHBOARD: int(os.getenv("SNOWFLAKE_POOL_SIZE_DASHBOARD", "4")),
+    WORKLOAD_BULK: int(os.getenv("SNOWFLAKE_POOL_SIZE_BULK", "2")),
+    WORKLOAD_SUBMIT: int(os.getenv("SNOWFLAKE_POOL_SIZE_SUBMIT", "2")),
+}
+
+# أقصى انتظار لجلسة من مجمع ممتلئ قبل اعتبار الطلب فاشلاً
+POOL_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("SNOWFLAKE_POOL_ACQUIRE_TIMEOUT_SECONDS", "30"))
 
 # تكوين اتصال Snowflake
-def get_snowflake_session():
+def _create_session(workload):
     connection_params = {
         "account": os.getenv("SNOWFLAKE_ACCOUNT"),
         "user": os.getenv("SNOWFLAKE_USER"),
         "password": os.getenv("SNOWFLAKE_PASSWORD"),
-        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+        "warehouse": WORKLOAD_WAREHOUSES[workload],
         "database": os.getenv("SNOWFLAKE_DATABASE"),
         "schema": os.getenv("SNOWFLAKE_SCHEMA"),
         "role": os.getenv("SNOWFLAKE_ROLE")
     }
-    return Session.builder.configs(connection_params).create()
+    session = Session.builder.configs(connection_params).create()
+    session.query_tag = f"snowflakesurvey:{workload}"
+    return session
+
+class PooledSession:
+    # غلاف رفيع للجلسة: close() يعيدها إلى المجمع بدلاً من إغلاق الاتصال
+    def __init__(self, pool, session):
+        self._pool = pool
+        self._session = session
+        self._in_transaction = False
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def sql(self, query, *args, **kwargs):
+        statement = query.strip().upper()
+        if statement.startswith("BEGIN"):
+            self._in_transaction = True
+        elif statement.startswith(("COMMIT", "ROLLBACK")):
+            self._in_transaction = False
+        return self._session.sql(query, *args, **kwargs)
+
+    def commit(self):
+        self.sql("COMMIT").collect()
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._session, self._in_transaction)
+
+class SessionPoolTimeout(SnowparkSQLException):
+    # مشتق من SnowparkSQLException حتى تعالجه الدوال كأي خطأ استعلام وتُرجع قيمتها الافتراضية
+    pass
+
+class SessionPool:
+    def __init__(self, workload, size):
+        self.workload = workload
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, blocking=True, timeout=POOL_ACQUIRE_TIMEOUT_SECONDS):
+        # ينتظر عند امتلاء المجمع بدلاً من فتح اتصالات بلا حد، لكن ليس بلا نهاية
+        if not blocking:
+            if not self._slots.acquire(blocking=False):
+                return None
+        elif not self._slots.acquire(timeout=timeout):
+            raise SessionPoolTimeout(f"انتهت مهلة انتظار جلسة من مجمع {self.workload}")
+        try:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                session = _create_session(self.workload)
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledSession(self, session)
+
+    def release(self, session, in_transaction=False):
+        try:
+            # معاملة تُركت مفتوحة بسبب خطأ غير متوقع: نلغيها قبل إعادة استخدام الجلسة
+            if in_transaction:
+                session.sql("ROLLBACK").collect()
+            self._idle.put(session)
+        except Exception:
+            session.close()
+        finally:
+            self._slots.release()
+
+_pools = {workload: SessionPool(workload, size) for workload, size in WORKLOAD_POOL_SIZES.items()}
+
+def get_snowflake_session(workload=WORKLOAD_INTERACTIVE):
+    return _pools[workload].acquire()
+
+# الواجهة غير المتزامنة: الاستعلامات تُرسل دون انتظار (collect_nowait) ويُنتظر اكتمالها
+# داخل حلقة asyncio، فتتداخل عدة استعلامات في خيط واحد ويمكن إلغاؤها
+_acquire_executor = ThreadPoolExecutor(thread_name_prefix="session-acquire")
+
+def _release_abandoned(future):
+    # جلسة حصل عليها الخيط بعد إلغاء المهمة التي طلبتها: تُعاد إلى المجمع
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+async def get_snowflake_session_async(workload=WORKLOAD_INTERACTIVE):
+    session = _pools[workload].acquire(blocking=False)
+    if session is None:
+        # المجمع ممتلئ: الانتظار في خيط منفصل حتى لا تتوقف الحلقة عن متابعة بقية الاستعلامات
+        future = _acquire_executor.submit(_pools[workload].acquire)
+        try:
+            session = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(_release_abandoned)
+            raise
+    return session
+
+async def _collect_async(session, query, params=None):
+    job = None
+    try:
+        job = session.sql(query, params=params).collect_nowait()
+        delay = 0.01
+        while not job.is_done():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, ASYNC_POLL_MAX_SECONDS)
+        return job.result()
+    except ConnectorError as e:
+        # AsyncJob يرفع أخطاء الموصل مباشرة؛ نحولها حتى تعالجها الدوال كبقية أخطاء الاستعلامات
+        raise SnowparkSQLException(str(e), conn_error=e, sfqid=job.query_id if job else None) from e
+    except asyncio.CancelledError:
+        if job is not None:
+            job.cancel()
+        raise
+
+def run_sync(coro):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # استدعاء من داخل حلقة تعمل بالفعل: التنفيذ في خيط مستقل بحلقة خاصة به
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+async def _gather(*coros):
+    return await asyncio.gather(*coros)
+
+def run_concurrently(*coros):
+    # تنفيذ عدة دوال غير متزامنة معاً وإرجاع نتائجها بنفس الترتيب
+    return run_sync(_gather(*coros))
 
 # تهيئة الجداول
 def init_db():
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
         
         # إنشاء جدول المستخدمين
         session.sql('''
@@ -94,6 +279,7 @@ def init_db():
             REGION_ID INTEGER NOT NULL,
             SUBMISSION_DATE TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
             IS_COMPLETED BOOLEAN DEFAULT FALSE,
+            INSERTED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
             CONSTRAINT FK_SURVEY_RESPONSE FOREIGN KEY (SURVEY_ID) REFERENCES SURVEYS(SURVEY_ID),
             CONSTRAINT FK_USER_RESPONSE FOREIGN KEY (USER_ID) REFERENCES USERS(USER_ID),
             CONSTRAINT FK_REGION_RESPONSE FOREIGN KEY (REGION_ID) REFERENCES HEALTH_ADMINISTRATIONS(ADMIN_ID)
@@ -107,11 +293,67 @@ def init_db():
             RESPONSE_ID INTEGER NOT NULL,
             FIELD_ID INTEGER NOT NULL,
             ANSWER_VALUE VARCHAR(2000),
+            UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
             CONSTRAINT FK_RESPONSE FOREIGN KEY (RESPONSE_ID) REFERENCES RESPONSES(RESPONSE_ID),
             CONSTRAINT FK_FIELD FOREIGN KEY (FIELD_ID) REFERENCES SURVEY_FIELDS(FIELD_ID)
         )
         ''').collect()
         
+        # وقت آخر تعديل للإجابة (للجداول المنشأة قبل إضافة العمود)
+        session.sql(
+            "ALTER TABLE RESPONSE_DETAILS ADD COLUMN IF NOT EXISTS UPDATED_AT TIMESTAMP_NTZ"
+        ).collect()
+        
+        # نسخ تعريفات الاستبيانات: كل تعديل ينشئ نسخة جديدة ولا تتغير النسخ السابقة
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS SURVEY_VERSIONS (
+            SURVEY_ID INTEGER NOT NULL,
+            VERSION_NUMBER INTEGER NOT NULL,
+            CREATED_BY INTEGER,
+            CREATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+            CONSTRAINT PK_SURVEY_VERSIONS PRIMARY KEY (SURVEY_ID, VERSION_NUMBER),
+            CONSTRAINT FK_SURVEY_VERSION FOREIGN KEY (SURVEY_ID) REFERENCES SURVEYS(SURVEY_ID)
+        )
+        ''').collect()
+        session.sql(
+            "ALTER TABLE SURVEYS ADD COLUMN IF NOT EXISTS CURRENT_VERSION INTEGER DEFAULT 1"
+        ).collect()
+        # مفتاح فريد لكل إدراج حتى يُقرأ معرف الاستبيان الجديد دون الاعتماد على MAX
+        session.sql(
+            "ALTER TABLE SURVEYS ADD COLUMN IF NOT EXISTS CLIENT_KEY VARCHAR(64)"
+        ).collect()
+        session.sql(
+            "ALTER TABLE SURVEY_FIELDS ADD COLUMN IF NOT EXISTS SURVEY_VERSION INTEGER DEFAULT 1"
+        ).collect()
+        session.sql(
+            "ALTER TABLE RESPONSES ADD COLUMN IF NOT EXISTS SURVEY_VERSION INTEGER DEFAULT 1"
+        ).collect()
+        
+        # مفتاح عدم التكرار الذي يولده العميل للإرسال عبر السجل المحلي
+        session.sql(
+            "ALTER TABLE RESPONSES ADD COLUMN IF NOT EXISTS CLIENT_KEY VARCHAR(64)"
+        ).collect()
+        
+        # وقت الإدخال عند العميل للاطلاع فقط؛ SUBMISSION_DATE من ساعة الخادم حتى لا يؤثر
+        # فرق التوقيت أو انحراف ساعة الخادم المحلي على قاعدة "مرة في اليوم" وتجميع الأيام
+        session.sql(
+            "ALTER TABLE RESPONSES ADD COLUMN IF NOT EXISTS CLIENT_SUBMITTED_AT TIMESTAMP_TZ"
+        ).collect()
+        
+        # إجابات وضع document في صف الإجابة نفسه
+        session.sql(
+            "ALTER TABLE RESPONSES ADD COLUMN IF NOT EXISTS ANSWERS VARIANT"
+        ).collect()
+        session.sql(
+            "ALTER TABLE RESPONSES ADD COLUMN IF NOT EXISTS ANSWERS_UPDATED_AT TIMESTAMP_NTZ"
+        ).collect()
+        
+        # وقت وصول الصف إلى الخادم (SUBMISSION_DATE وقت الإدخال عند العميل وقد يتأخر تسليمه).
+        # Snowflake لا يقبل CURRENT_TIMESTAMP() افتراضياً لعمود يُضاف لجدول قائم، لذا تكتبه جمل الإدراج أيضاً
+        session.sql(
+            "ALTER TABLE RESPONSES ADD COLUMN IF NOT EXISTS INSERTED_AT TIMESTAMP_NTZ"
+        ).collect()
+        
         # إنشاء جدول مسؤولي المحافظات
         session.sql('''
         CREATE TABLE IF NOT EXISTS GOVERNORATE_ADMINS (
@@ -162,7 +404,115 @@ def init_db():
             CONSTRAINT FK_USER_AUDIT FOREIGN KEY (USER_ID) REFERENCES USERS(USER_ID)
         )
         ''').collect()
+
+        # أرشيف سجل التعديلات القديم (مجمّع حسب اليوم لسرعة التصفية الزمنية)
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS AUDIT_LOG_ARCHIVE (
+            LOG_ID INTEGER PRIMARY KEY,
+            USER_ID INTEGER NOT NULL,
+            ACTION_TYPE VARCHAR(50) NOT NULL,
+            TABLE_NAME VARCHAR(50) NOT NULL,
+            RECORD_ID INTEGER,
+            OLD_VALUE VARCHAR(2000),
+            NEW_VALUE VARCHAR(2000),
+            ACTION_TIMESTAMP TIMESTAMP_NTZ NOT NULL
+        )
+        CLUSTER BY (TO_DATE(ACTION_TIMESTAMP))
+        ''').collect()
         
+        # ملخص يومي لسجل التعديلات
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS AUDIT_LOG_DAILY_SUMMARY (
+            LOG_DAY DATE NOT NULL,
+            USER_ID INTEGER NOT NULL,
+            TABLE_NAME VARCHAR(50) NOT NULL,
+            ACTION_TYPE VARCHAR(50) NOT NULL,
+            ACTION_COUNT INTEGER NOT NULL,
+            CONSTRAINT PK_AUDIT_SUMMARY PRIMARY KEY (LOG_DAY, USER_ID, TABLE_NAME, ACTION_TYPE)
+        )
+        ''').collect()
+
+        # أرشيف الإجابات: المسودات التي تلتها إجابة مكتملة، والإجابات المكتملة الأقدم من مدة الاحتفاظ
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS RESPONSES_ARCHIVE (
+            RESPONSE_ID INTEGER PRIMARY KEY,
+            SURVEY_ID INTEGER NOT NULL,
+            USER_ID INTEGER NOT NULL,
+            REGION_ID INTEGER NOT NULL,
+            SUBMISSION_DATE TIMESTAMP_NTZ NOT NULL,
+            IS_COMPLETED BOOLEAN,
+            SURVEY_VERSION INTEGER,
+            CLIENT_KEY VARCHAR(64),
+            ANSWERS VARIANT,
+            ANSWERS_UPDATED_AT TIMESTAMP_NTZ,
+            ARCHIVED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+        CLUSTER BY (SURVEY_ID, TO_DATE(SUBMISSION_DATE))
+        ''').collect()
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS RESPONSE_DETAILS_ARCHIVE (
+            DETAIL_ID INTEGER PRIMARY KEY,
+            RESPONSE_ID INTEGER NOT NULL,
+            FIELD_ID INTEGER NOT NULL,
+            ANSWER_VALUE VARCHAR(2000),
+            UPDATED_AT TIMESTAMP_NTZ
+        )
+        CLUSTER BY (RESPONSE_ID)
+        ''').collect()
+
+        # حد الأرشفة: كل الإجابات المؤرشفة (المكتملة والمسودات) قُدمت قبل ARCHIVED_BEFORE
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS ARCHIVE_STATE (
+            ARCHIVE_NAME VARCHAR(50) PRIMARY KEY,
+            ARCHIVED_BEFORE TIMESTAMP_NTZ,
+            ARCHIVED_AT TIMESTAMP_NTZ
+        )
+        ''').collect()
+        session.sql('''
+            MERGE INTO ARCHIVE_STATE T
+            USING (SELECT ? AS ARCHIVE_NAME) S ON T.ARCHIVE_NAME = S.ARCHIVE_NAME
+            WHEN NOT MATCHED THEN INSERT (ARCHIVE_NAME) VALUES (S.ARCHIVE_NAME)
+        ''', params=(RESPONSE_ARCHIVE_NAME,)).collect()
+
+        # إنشاء جدول تجميع الإجابات حسب الاستبيان والإدارة الصحية واليوم
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS RESPONSE_ROLLUPS (
+            SURVEY_ID INTEGER NOT NULL,
+            GOVERNORATE_ID INTEGER NOT NULL,
+            HEALTH_ADMIN_ID INTEGER NOT NULL,
+            RESPONSE_DAY DATE NOT NULL,
+            TOTAL_RESPONSES INTEGER DEFAULT 0,
+            COMPLETED_RESPONSES INTEGER DEFAULT 0,
+            DRAFT_RESPONSES INTEGER DEFAULT 0,
+            UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+            CONSTRAINT PK_RESPONSE_ROLLUPS PRIMARY KEY (SURVEY_ID, HEALTH_ADMIN_ID, RESPONSE_DAY)
+        )
+        ''').collect()
+
+        # إنشاء جدول حالة التجميع (آخر إجابة تم تجميعها)
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS ROLLUP_STATE (
+            ROLLUP_NAME VARCHAR(50) PRIMARY KEY,
+            LAST_RESPONSE_ID INTEGER NOT NULL DEFAULT 0,
+            REFRESHED_AT TIMESTAMP_NTZ
+        )
+        ''').collect()
+
+        # إنشاء جدول عدادات نسخ البيانات المرجعية (يُزاد العداد في نفس معاملة الكتابة)
+        session.sql('''
+        CREATE TABLE IF NOT EXISTS ENTITY_VERSIONS (
+            ENTITY VARCHAR(50) PRIMARY KEY,
+            VERSION INTEGER NOT NULL DEFAULT 0,
+            UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+        ''').collect()
+        session.sql('''
+            MERGE INTO ENTITY_VERSIONS T
+            USING (SELECT VALUE::VARCHAR AS ENTITY FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?)))) S
+            ON T.ENTITY = S.ENTITY
+            WHEN NOT MATCHED THEN INSERT (ENTITY, VERSION) VALUES (S.ENTITY, 0)
+        ''', params=(json.dumps(ENTITIES),)).collect()
+
         # إضافة مستخدم admin افتراضي إذا لم يكن موجوداً
         admin_count = session.sql("SELECT COUNT(*) FROM USERS WHERE ROLE='admin'").collect()[0][0]
         if admin_count == 0:
@@ -176,14 +526,40 @@ def init_db():
         return True
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في تهيئة قاعدة البيانات: {str(e)}")
+        # يُستدعى أيضاً من jobs.py حيث لا تظهر st.error
+        logger.error("حدث خطأ في تهيئة قاعدة البيانات: %s", e)
         return False
     finally:
-        session.close()
+        if session:
+            session.close()
+
+# عدادات نسخ البيانات المرجعية
+def _bump_entity_versions(session, *entities):
+    # يُستدعى داخل معاملة الكتابة قبل COMMIT حتى لا يُرى التعديل دون زيادة العداد
+    session.sql('''
+        UPDATE ENTITY_VERSIONS
+        SET VERSION = VERSION + 1, UPDATED_AT = CURRENT_TIMESTAMP()
+        WHERE ENTITY IN (SELECT VALUE::VARCHAR FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+    ''', params=(json.dumps(list(entities)),)).collect()
+
+def get_entity_versions():
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        rows = session.sql("SELECT ENTITY, VERSION FROM ENTITY_VERSIONS").collect()
+        return {row[0]: row[1] for row in rows}
+    except SnowparkSQLException:
+        # فشل الفحص لا يُعرض للمستخدم؛ تبقى الذاكرة المؤقتة كما هي حتى الفحص التالي
+        return None
+    finally:
+        if session:
+            session.close()
 
 # دوال إدارة المستخدمين
 def get_user_by_username(username):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
         user = session.sql("SELECT * FROM USERS WHERE USERNAME=?", params=(username,)).collect()
         
         if user:
@@ -201,193 +577,1137 @@ def get_user_by_username(username):
         st.error(f"حدث خطأ في جلب بيانات المستخدم: {str(e)}")
         return None
     finally:
-        session.close()
+        if session:
+            session.close()
+
+def get_existing_usernames(usernames):
+    # فحص مجموعة أسماء مستخدمين دفعة واحدة
+    if not usernames:
+        return set()
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        rows = session.sql('''
+            SELECT USERNAME FROM USERS
+            WHERE USERNAME IN (SELECT VALUE::VARCHAR FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+        ''', params=(json.dumps(list(usernames)),)).collect()
+        return {row[0] for row in rows}
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في التحقق من أسماء المستخدمين: {str(e)}")
+        return None
+    finally:
+        if session:
+            session.close()
+
+def add_user(username, password, role, assigned_region=None):
+    from auth import hash_password
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql(
+            "INSERT INTO USERS (USERNAME, PASSWORD_HASH, ROLE, ASSIGNED_REGION) VALUES (?, ?, ?, ?)",
+            params=(username, hash_password(password), role, assigned_region)
+        ).collect()
+        
+        session.commit()
+        log_audit_event('INSERT', 'USERS', new_value={'username': username, 'role': role,
+                                                     'assigned_region': assigned_region})
+        return True
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في إضافة المستخدم: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+def bulk_add_users(users_df, user_surveys_df):
+    # users_df: USERNAME, PASSWORD_HASH, ROLE, ASSIGNED_REGION, GOVERNORATE_ID
+    # user_surveys_df: USERNAME, SURVEY_ID
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_BULK)
+        session.write_pandas(users_df, "USER_IMPORT_STAGING", auto_create_table=True,
+                             table_type="temporary", overwrite=True)
+        session.write_pandas(user_surveys_df, "USER_SURVEY_IMPORT_STAGING", auto_create_table=True,
+                             table_type="temporary", overwrite=True)
+
+        session.sql("BEGIN TRANSACTION").collect()
+
+        session.sql('''
+            INSERT INTO USERS (USERNAME, PASSWORD_HASH, ROLE, ASSIGNED_REGION)
+            SELECT "USERNAME", "PASSWORD_HASH", "ROLE", "ASSIGNED_REGION" FROM USER_IMPORT_STAGING
+        ''').collect()
+
+        session.sql('''
+            INSERT INTO GOVERNORATE_ADMINS (USER_ID, GOVERNORATE_ID)
+            SELECT U.USER_ID, S."GOVERNORATE_ID"
+            FROM USER_IMPORT_STAGING S
+            JOIN USERS U ON U.USERNAME = S."USERNAME"
+            WHERE S."ROLE" = 'governorate_admin'
+        ''').collect()
+
+        session.sql('''
+            INSERT INTO USER_SURVEYS (USER_ID, SURVEY_ID)
+            SELECT DISTINCT U.USER_ID, S."SURVEY_ID"
+            FROM USER_SURVEY_IMPORT_STAGING S
+            JOIN USERS U ON U.USERNAME = S."USERNAME"
+        ''').collect()
+
+        _bump_entity_versions(session, ENTITY_PERMISSIONS)
+        session.sql("COMMIT").collect()
+        invalidate_entities(ENTITY_PERMISSIONS)
+        log_audit_event('IMPORT', 'USERS', new_value=users_df["USERNAME"].tolist())
+        return True
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        st.error(f"حدث خطأ في استيراد المستخدمين: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+def update_user(user_id, username, role, assigned_region=None):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        session.sql(
+            "UPDATE USERS SET USERNAME = ?, ROLE = ?, ASSIGNED_REGION = ? WHERE USER_ID = ?",
+            params=(username, role, assigned_region, user_id)
+        ).collect()
+        
+        _bump_entity_versions(session, ENTITY_PERMISSIONS)
+        session.commit()
+        invalidate_entities(ENTITY_PERMISSIONS)
+        employee_details_loader.clear(user_id)
+        log_audit_event('UPDATE', 'USERS', user_id,
+                        new_value={'username': username, 'role': role, 'assigned_region': assigned_region})
+        return True
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في تحديث المستخدم: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+def delete_user(user_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        session.sql("DELETE FROM USER_SURVEYS WHERE USER_ID = ?", params=(user_id,)).collect()
+        session.sql("DELETE FROM GOVERNORATE_ADMINS WHERE USER_ID = ?", params=(user_id,)).collect()
+        session.sql("DELETE FROM USERS WHERE USER_ID = ?", params=(user_id,)).collect()
+        _bump_entity_versions(session, ENTITY_PERMISSIONS)
+        session.sql("COMMIT").collect()
+        invalidate_entities(ENTITY_PERMISSIONS)
+        log_audit_event('DELETE', 'USERS', user_id)
+        return True
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        st.error(f"حدث خطأ في حذف المستخدم: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+def _contains_pattern(text):
+    # البحث الجزئي بنص المستخدم كما هو: % و _ في النص ليست أحرف بدل
+    return "%" + re.sub(r"([!%_])", r"!\1", text) + "%"
+
+async def get_users_page_async(page=1, page_size=50, username=None, role=None, governorate_id=None, health_admin_id=None):
+    # صفحة واحدة من المستخدمين مع العدد الكلي بعد التصفية في نفس الاستعلام
+    session = None
+    try:
+        session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+        conditions = []
+        params = []
+        if username:
+            conditions.append("U.USERNAME ILIKE ? ESCAPE '!'")
+            params.append(_contains_pattern(username))
+        if role:
+            conditions.append("U.ROLE = ?")
+            params.append(role)
+        if governorate_id:
+            conditions.append("COALESCE(HA.GOVERNORATE_ID, GA.GOVERNORATE_ID) = ?")
+            params.append(governorate_id)
+        if health_admin_id:
+            conditions.append("U.ASSIGNED_REGION = ?")
+            params.append(health_admin_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        rows = await _collect_async(session, f'''
+            SELECT U.USER_ID, U.USERNAME, U.ROLE,
+                   COALESCE(G.GOVERNORATE_NAME, GG.GOVERNORATE_NAME) AS GOVERNORATE_NAME,
+                   HA.ADMIN_NAME,
+                   COUNT(*) OVER () AS TOTAL_COUNT
+            FROM USERS U
+            LEFT JOIN HEALTH_ADMINISTRATIONS HA ON U.ASSIGNED_REGION = HA.ADMIN_ID
+            LEFT JOIN GOVERNORATES G ON HA.GOVERNORATE_ID = G.GOVERNORATE_ID
+            LEFT JOIN GOVERNORATE_ADMINS GA ON GA.USER_ID = U.USER_ID
+            LEFT JOIN GOVERNORATES GG ON GA.GOVERNORATE_ID = GG.GOVERNORATE_ID
+            {where}
+            ORDER BY U.USERNAME, U.USER_ID
+            LIMIT ? OFFSET ?
+        ''', (*params, page_size, (page - 1) * page_size))
+
+        users = [{
+            'user_id': row[0],
+            'username': row[1],
+            'role': row[2],
+            'governorate_name': row[3],
+            'admin_name': row[4]
+        } for row in rows]
+        total = rows[0][5] if rows else 0
+        return users, total
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب المستخدمين: {str(e)}")
+        return [], 0
+    finally:
+        if session:
+            session.close()
+
+def get_users_page(page=1, page_size=50, username=None, role=None, governorate_id=None, health_admin_id=None):
+    return run_sync(get_users_page_async(page, page_size, username, role, governorate_id, health_admin_id))
 
 def get_user_role(user_id):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
         role = session.sql("SELECT ROLE FROM USERS WHERE USER_ID=?", params=(user_id,)).collect()
         return role[0][0] if role else None
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في جلب دور المستخدم: {str(e)}")
         return None
     finally:
-        session.close()
+        if session:
+            session.close()
 
 # دوال إدارة المحافظات والإدارات الصحية
-def get_governorates_list():
+@versioned_cache(ENTITY_GOVERNORATES)
+def get_governorates_list(include_description=False):
+    session = None
     try:
-        session = get_snowflake_session()
-        governorates = session.sql("SELECT GOVERNORATE_ID, GOVERNORATE_NAME FROM GOVERNORATES").collect()
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        columns = "GOVERNORATE_ID, GOVERNORATE_NAME, DESCRIPTION" if include_description else "GOVERNORATE_ID, GOVERNORATE_NAME"
+        governorates = session.sql(f"SELECT {columns} FROM GOVERNORATES ORDER BY GOVERNORATE_NAME").collect()
         return governorates
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في جلب قائمة المحافظات: {str(e)}")
         return []
     finally:
-        session.close()
+        if session:
+            session.close()
 
-def get_health_admins():
+@versioned_cache(ENTITY_HEALTH_ADMINS)
+def get_health_admins(governorate_id=None):
+    session = None
     try:
-        session = get_snowflake_session()
-        admins = session.sql("SELECT ADMIN_ID, ADMIN_NAME FROM HEALTH_ADMINISTRATIONS").collect()
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        if governorate_id:
+            admins = session.sql(
+                "SELECT ADMIN_ID, ADMIN_NAME FROM HEALTH_ADMINISTRATIONS WHERE GOVERNORATE_ID=?",
+                params=(governorate_id,)
+            ).collect()
+        else:
+            admins = session.sql("SELECT ADMIN_ID, ADMIN_NAME FROM HEALTH_ADMINISTRATIONS").collect()
         return admins
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في جلب الإدارات الصحية: {str(e)}")
         return []
+    finally:
+        if session:
+            session.close()
+
+async def _load_health_admin_names(admin_ids):
+    session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+    try:
+        rows = await _collect_async(session, '''
+            SELECT ADMIN_ID, ADMIN_NAME FROM HEALTH_ADMINISTRATIONS
+            WHERE ADMIN_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+        ''', (json.dumps(admin_ids),))
+        return {row[0]: row[1] for row in rows}
     finally:
         session.close()
 
+health_admin_name_loader = BatchLoader("health_admin_name", _load_health_admin_names)
+
 def get_health_admin_name(admin_id):
     try:
-        session = get_snowflake_session()
-        result = session.sql("SELECT ADMIN_NAME FROM HEALTH_ADMINISTRATIONS WHERE ADMIN_ID=?", params=(admin_id,)).collect()
-        return result[0][0] if result else "غير معروف"
+        name = run_sync(health_admin_name_loader.load(admin_id))
+        return name if name is not None else "غير معروف"
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في جلب اسم الإدارة الصحية: {str(e)}")
         return "خطأ في النظام"
+
+@versioned_cache(ENTITY_HEALTH_ADMINS, ENTITY_GOVERNORATES)
+def get_all_regions():
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        regions = session.sql('''
+            SELECT HA.ADMIN_ID, HA.ADMIN_NAME, HA.DESCRIPTION, G.GOVERNORATE_NAME, G.GOVERNORATE_ID
+            FROM HEALTH_ADMINISTRATIONS HA
+            JOIN GOVERNORATES G ON HA.GOVERNORATE_ID = G.GOVERNORATE_ID
+            ORDER BY G.GOVERNORATE_NAME, HA.ADMIN_NAME
+        ''').collect()
+        return regions
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب الإدارات الصحية: {str(e)}")
+        return []
     finally:
-        session.close()
+        if session:
+            session.close()
 
-# دوال إدارة الاستبيانات
-def save_survey(survey_name, fields, governorate_ids=None):
+def add_governorate(governorate_name, description):
+    session = None
     try:
-        session = get_snowflake_session()
-        
-        # حفظ الاستبيان الأساسي
-        survey_id = session.sql(
-            "INSERT INTO SURVEYS (SURVEY_NAME, CREATED_BY) VALUES (?, ?)",
-            params=(survey_name, st.session_state.user_id)
-        ).collect()[0][0]
-        
-        # ربط الاستبيان بالمحافظات
-        if governorate_ids:
-            for gov_id in governorate_ids:
-                session.sql(
-                    "INSERT INTO SURVEY_GOVERNORATE (SURVEY_ID, GOVERNORATE_ID) VALUES (?, ?)",
-                    params=(survey_id, gov_id)
-                ).collect()
-        
-        # حفظ حقول الاستبيان
-        for i, field in enumerate(fields):
-            field_options = json.dumps(field.get('field_options', [])) if field.get('field_options') else None
-            
-            session.sql(
-                """INSERT INTO SURVEY_FIELDS 
-                   (SURVEY_ID, FIELD_TYPE, FIELD_LABEL, FIELD_OPTIONS, IS_REQUIRED, FIELD_ORDER) 
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                params=(
-                    survey_id, 
-                    field['field_type'], 
-                    field['field_label'],
-                    field_options,
-                    field.get('is_required', False),
-                    i + 1)
-            ).collect()
-        
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        session.sql(
+            "INSERT INTO GOVERNORATES (GOVERNORATE_NAME, DESCRIPTION) VALUES (?, ?)",
+            params=(governorate_name, description)
+        ).collect()
+        _bump_entity_versions(session, ENTITY_GOVERNORATES)
         session.commit()
+        invalidate_entities(ENTITY_GOVERNORATES)
+        log_audit_event('INSERT', 'GOVERNORATES', new_value={'governorate_name': governorate_name})
         return True
     except SnowparkSQLException as e:
-        st.error(f"حدث خطأ في حفظ الاستبيان: {str(e)}")
+        st.error(f"حدث خطأ في إضافة المحافظة: {str(e)}")
         return False
     finally:
-        session.close()
+        if session:
+            session.close()
 
-def get_survey_fields(survey_id):
+def update_governorate(governorate_id, governorate_name, description):
+    session = None
     try:
-        session = get_snowflake_session()
-        fields = session.sql('''
-            SELECT 
-                FIELD_ID, 
-                FIELD_LABEL, 
-                FIELD_TYPE, 
-                FIELD_OPTIONS, 
-                IS_REQUIRED, 
-                FIELD_ORDER
-            FROM SURVEY_FIELDS
-            WHERE SURVEY_ID = ?
-            ORDER BY FIELD_ORDER
-        ''', params=(survey_id,)).collect()
-        
-        return fields
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        session.sql(
+            "UPDATE GOVERNORATES SET GOVERNORATE_NAME = ?, DESCRIPTION = ? WHERE GOVERNORATE_ID = ?",
+            params=(governorate_name, description, governorate_id)
+        ).collect()
+        _bump_entity_versions(session, ENTITY_GOVERNORATES)
+        session.commit()
+        invalidate_entities(ENTITY_GOVERNORATES)
+        log_audit_event('UPDATE', 'GOVERNORATES', governorate_id,
+                        new_value={'governorate_name': governorate_name, 'description': description})
+        return True
     except SnowparkSQLException as e:
-        st.error(f"حدث خطأ في جلب حقول الاستبيان: {str(e)}")
-        return []
+        st.error(f"حدث خطأ في تحديث المحافظة: {str(e)}")
+        return False
     finally:
-        session.close()
+        if session:
+            session.close()
 
-# دوال إدارة الإجابات
-def save_response(survey_id, user_id, region_id, is_completed=False):
+def check_governorate_has_regions(governorate_id):
+    session = None
     try:
-        session = get_snowflake_session()
-        response_id = session.sql(
-            '''INSERT INTO RESPONSES 
-               (SURVEY_ID, USER_ID, REGION_ID, IS_COMPLETED) 
-               VALUES (?, ?, ?, ?)''',
-            params=(survey_id, user_id, region_id, is_completed)
-        ).collect()[0][0]
-        
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        result = session.sql(
+            "SELECT COUNT(*) FROM HEALTH_ADMINISTRATIONS WHERE GOVERNORATE_ID = ?",
+            params=(governorate_id,)
+        ).collect()
+        return result[0][0] > 0
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في التحقق من الإدارات الصحية: {str(e)}")
+        return True
+    finally:
+        if session:
+            session.close()
+
+def delete_governorate_from_db(governorate_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        session.sql("DELETE FROM SURVEY_GOVERNORATE WHERE GOVERNORATE_ID = ?", params=(governorate_id,)).collect()
+        session.sql("DELETE FROM GOVERNORATE_ADMINS WHERE GOVERNORATE_ID = ?", params=(governorate_id,)).collect()
+        session.sql("DELETE FROM GOVERNORATES WHERE GOVERNORATE_ID = ?", params=(governorate_id,)).collect()
+        _bump_entity_versions(session, ENTITY_GOVERNORATES, ENTITY_PERMISSIONS)
         session.commit()
-        return response_id
+        invalidate_entities(ENTITY_GOVERNORATES, ENTITY_PERMISSIONS)
+        log_audit_event('DELETE', 'GOVERNORATES', governorate_id)
+        return True
     except SnowparkSQLException as e:
-        st.error(f"حدث خطأ في حفظ الاستجابة: {str(e)}")
-        return None
+        st.error(f"حدث خطأ في حذف المحافظة: {str(e)}")
+        return False
     finally:
-        session.close()
+        if session:
+            session.close()
 
-def save_response_detail(response_id, field_id, answer_value):
+def add_health_admin(admin_name, description, governorate_id):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
         session.sql(
-            "INSERT INTO RESPONSE_DETAILS (RESPONSE_ID, FIELD_ID, ANSWER_VALUE) VALUES (?, ?, ?)",
-            params=(response_id, field_id, str(answer_value) if answer_value is not None else "")
+            "INSERT INTO HEALTH_ADMINISTRATIONS (ADMIN_NAME, DESCRIPTION, GOVERNORATE_ID) VALUES (?, ?, ?)",
+            params=(admin_name, description, governorate_id)
         ).collect()
-        
+        _bump_entity_versions(session, ENTITY_HEALTH_ADMINS)
         session.commit()
+        invalidate_entities(ENTITY_HEALTH_ADMINS)
+        log_audit_event('INSERT', 'HEALTH_ADMINISTRATIONS',
+                        new_value={'admin_name': admin_name, 'governorate_id': governorate_id})
         return True
     except SnowparkSQLException as e:
-        st.error(f"حدث خطأ في حفظ تفاصيل الإجابة: {str(e)}")
+        st.error(f"حدث خطأ في إضافة الإدارة الصحية: {str(e)}")
         return False
     finally:
-        session.close()
+        if session:
+            session.close()
 
-# دوال مسؤولي المحافظات
-def get_governorate_admin(user_id):
+def update_health_admin(admin_id, admin_name, description, governorate_id):
+    session = None
     try:
-        session = get_snowflake_session()
-        result = session.sql('''
-            SELECT G.GOVERNORATE_ID, G.GOVERNORATE_NAME 
-            FROM GOVERNORATE_ADMINS GA
-            JOIN GOVERNORATES G ON GA.GOVERNORATE_ID = G.GOVERNORATE_ID
-            WHERE GA.USER_ID = ?
-        ''', params=(user_id,)).collect()
-        
-        return result
-    except SnowparkSQLException as e:
-        st.error(f"حدث خطأ في جلب بيانات مسؤول المحافظة: {str(e)}")
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        session.sql(
+            "UPDATE HEALTH_ADMINISTRATIONS SET ADMIN_NAME = ?, DESCRIPTION = ?, GOVERNORATE_ID = ? WHERE ADMIN_ID = ?",
+            params=(admin_name, description, governorate_id, admin_id)
+        ).collect()
+        _bump_entity_versions(session, ENTITY_HEALTH_ADMINS)
+        session.commit()
+        invalidate_entities(ENTITY_HEALTH_ADMINS)
+        health_admin_name_loader.clear(admin_id)
+        log_audit_event('UPDATE', 'HEALTH_ADMINISTRATIONS', admin_id,
+                        new_value={'admin_name': admin_name, 'description': description,
+                                   'governorate_id': governorate_id})
+        return True
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في تحديث الإدارة الصحية: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+def check_admin_has_users(admin_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        result = session.sql(
+            "SELECT COUNT(*) FROM USERS WHERE ASSIGNED_REGION = ?",
+            params=(admin_id,)
+        ).collect()
+        return result[0][0] > 0
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في التحقق من مستخدمي الإدارة الصحية: {str(e)}")
+        return True
+    finally:
+        if session:
+            session.close()
+
+def delete_health_admin_from_db(admin_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        session.sql("DELETE FROM HEALTH_ADMINISTRATIONS WHERE ADMIN_ID = ?", params=(admin_id,)).collect()
+        _bump_entity_versions(session, ENTITY_HEALTH_ADMINS)
+        session.commit()
+        invalidate_entities(ENTITY_HEALTH_ADMINS)
+        log_audit_event('DELETE', 'HEALTH_ADMINISTRATIONS', admin_id)
+        return True
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في حذف الإدارة الصحية: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+# دوال إدارة الاستبيانات
+@versioned_cache(ENTITY_SURVEYS)
+def get_surveys_list(survey_id=None, include_details=False):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        columns = "SURVEY_ID, SURVEY_NAME, CREATED_AT, IS_ACTIVE" if include_details else "SURVEY_ID, SURVEY_NAME"
+        if survey_id:
+            surveys = session.sql(
+                f"SELECT {columns} FROM SURVEYS WHERE SURVEY_ID=?",
+                params=(survey_id,)
+            ).collect()
+        else:
+            surveys = session.sql(f"SELECT {columns} FROM SURVEYS ORDER BY SURVEY_NAME").collect()
+        return surveys
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب قائمة الاستبيانات: {str(e)}")
         return []
+    finally:
+        if session:
+            session.close()
+
+def _insert_survey_fields(session, survey_id, version, fields):
+    # إدراج جميع حقول نسخة الاستبيان في جملة واحدة
+    if not fields:
+        return
+    payload = json.dumps([{
+        'field_type': field['field_type'],
+        'field_label': field['field_label'],
+        'field_options': json.dumps(field['field_options'], ensure_ascii=False) if field.get('field_options') else None,
+        'is_required': bool(field.get('is_required', False)),
+        'field_order': i + 1
+    } for i, field in enumerate(fields)], ensure_ascii=False)
+
+    session.sql('''
+        INSERT INTO SURVEY_FIELDS
+            (SURVEY_ID, SURVEY_VERSION, FIELD_TYPE, FIELD_LABEL, FIELD_OPTIONS, IS_REQUIRED, FIELD_ORDER)
+        SELECT ?, ?, VALUE:field_type::VARCHAR, VALUE:field_label::VARCHAR,
+               VALUE:field_options::VARCHAR, VALUE:is_required::BOOLEAN, VALUE:field_order::INTEGER
+        FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?)))
+    ''', params=(survey_id, version, payload)).collect()
+
+def save_survey(survey_name, fields, governorate_ids=None):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        
+        # حفظ الاستبيان الأساسي (النسخة الأولى)
+        # المعرف الجديد يُقرأ بمفتاح فريد لهذا الإدراج، فإدراج متزامن من نفس المستخدم لا يُرجع معرفه
+        client_key = uuid.uuid4().hex
+        session.sql(
+            "INSERT INTO SURVEYS (SURVEY_NAME, CREATED_BY, CURRENT_VERSION, CLIENT_KEY) VALUES (?, ?, 1, ?)",
+            params=(survey_name, st.session_state.user_id, client_key)
+        ).collect()
+        survey_id = session.sql(
+            "SELECT SURVEY_ID FROM SURVEYS WHERE CLIENT_KEY = ?",
+            params=(client_key,)
+        ).collect()[0][0]
+        
+        session.sql(
+            "INSERT INTO SURVEY_VERSIONS (SURVEY_ID, VERSION_NUMBER, CREATED_BY) VALUES (?, 1, ?)",
+            params=(survey_id, st.session_state.user_id)
+        ).collect()
+        
+        # ربط الاستبيان بالمحافظات
+        if governorate_ids:
+            session.sql('''
+                INSERT INTO SURVEY_GOVERNORATE (SURVEY_ID, GOVERNORATE_ID)
+                SELECT ?, VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?)))
+            ''', params=(survey_id, json.dumps(list(governorate_ids)))).collect()
+        
+        # حفظ حقول الاستبيان
+        _insert_survey_fields(session, survey_id, 1, fields)
+        
+        _bump_entity_versions(session, ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS, ENTITY_PERMISSIONS)
+        session.sql("COMMIT").collect()
+        invalidate_entities(ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS, ENTITY_PERMISSIONS)
+        log_audit_event('INSERT', 'SURVEYS', survey_id,
+                        new_value={'survey_name': survey_name, 'fields': len(fields),
+                                   'governorates': governorate_ids or []})
+        return True
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        st.error(f"حدث خطأ في حفظ الاستبيان: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+def update_survey(survey_id, survey_name, is_active, fields):
+    # تعديل الاستبيان ينشئ نسخة جديدة من الحقول بدلاً من تعديلها في مكانها
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        
+        # الزيادة في UPDATE أولاً تقفل الصف حتى نهاية المعاملة، فتعديلان متزامنان لا يحصلان على نفس النسخة
+        # (المفتاح الأساسي لـ SURVEY_VERSIONS لا يُفرض في Snowflake)
+        session.sql(
+            '''UPDATE SURVEYS SET SURVEY_NAME = ?, IS_ACTIVE = ?, CURRENT_VERSION = COALESCE(CURRENT_VERSION, 1) + 1
+               WHERE SURVEY_ID = ?''',
+            params=(survey_name, is_active, survey_id)
+        ).collect()
+        version = session.sql(
+            "SELECT CURRENT_VERSION FROM SURVEYS WHERE SURVEY_ID = ?",
+            params=(survey_id,)
+        ).collect()[0][0]
+        session.sql(
+            "INSERT INTO SURVEY_VERSIONS (SURVEY_ID, VERSION_NUMBER, CREATED_BY) VALUES (?, ?, ?)",
+            params=(survey_id, version, st.session_state.get('user_id'))
+        ).collect()
+        _insert_survey_fields(session, survey_id, version, fields)
+        
+        _bump_entity_versions(session, ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS)
+        session.sql("COMMIT").collect()
+        invalidate_entities(ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS)
+        survey_info_loader.clear(survey_id)
+        log_audit_event('UPDATE', 'SURVEYS', survey_id,
+                        new_value={'survey_name': survey_name, 'is_active': is_active,
+                                   'version': version, 'fields': len(fields)})
+        return True
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        st.error(f"حدث خطأ في تحديث الاستبيان: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+def delete_survey(survey_id):
+    # حذف الاستبيان مع جميع نسخه وإجاباته وصلاحياته في معاملة واحدة
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        for responses, details in (RESPONSE_TABLES, RESPONSE_ARCHIVE_TABLES):
+            session.sql(f'''
+                DELETE FROM {details}
+                WHERE RESPONSE_ID IN (SELECT RESPONSE_ID FROM {responses} WHERE SURVEY_ID = ?)
+            ''', params=(survey_id,)).collect()
+        for table in ("RESPONSES", "RESPONSES_ARCHIVE", "RESPONSE_ROLLUPS", "USER_SURVEYS", "SURVEY_GOVERNORATE", "SURVEY_FIELDS", "SURVEY_VERSIONS", "SURVEYS"):
+            session.sql(f"DELETE FROM {table} WHERE SURVEY_ID = ?", params=(survey_id,)).collect()
+        _bump_entity_versions(session, ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS, ENTITY_PERMISSIONS)
+        session.sql("COMMIT").collect()
+        invalidate_entities(ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS, ENTITY_PERMISSIONS)
+        survey_info_loader.clear(survey_id)
+        log_audit_event('DELETE', 'SURVEYS', survey_id)
+        return True
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        st.error(f"حدث خطأ في حذف الاستبيان: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+async def _load_survey_info(survey_ids):
+    # معرف الاستبيان في آخر عمود حتى تبقى مواضع الأعمدة كما يستخدمها المستدعون
+    session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+    try:
+        rows = await _collect_async(session, '''
+            SELECT SURVEY_NAME, CREATED_AT, IS_ACTIVE, CURRENT_VERSION, SURVEY_ID FROM SURVEYS
+            WHERE SURVEY_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+        ''', (json.dumps(survey_ids),))
+        return {row[4]: row for row in rows}
     finally:
         session.close()
 
+survey_info_loader = BatchLoader("survey_info", _load_survey_info)
+
+@versioned_cache(ENTITY_SURVEYS)
+def get_survey_info(survey_id):
+    try:
+        return run_sync(survey_info_loader.load(survey_id))
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب معلومات الاستبيان: {str(e)}")
+        return None
+
+def get_survey_info_many(survey_ids):
+    # جلب عدة استبيانات باستعلام واحد؛ تُحفظ النتائج لبقية التشغيل الحالي
+    try:
+        return run_sync(survey_info_loader.load_many(survey_ids))
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب معلومات الاستبيانات: {str(e)}")
+        return [None] * len(survey_ids)
+
+def defer_survey_info(survey_ids):
+    # استبيانات ستُطلب في هذا التشغيل: أول get_survey_info لم تُحفظ نتيجته يجلبها كلها باستعلام واحد
+    survey_info_loader.defer(survey_ids)
+
+def get_survey_current_version(survey_id):
+    # تُقرأ من معلومات الاستبيان المخزنة مؤقتاً؛ القيمة الافتراضية عند الخطأ لا تُخزن
+    survey = get_survey_info(survey_id)
+    return (survey[3] or 1) if survey else 1
+
+def get_survey_fields(survey_id, version=None):
+    # بدون تحديد النسخة تُرجع حقول النسخة الحالية، وتُبطل مع أي تعديل على الاستبيانات.
+    # حقول نسخة محددة لا تتغير بعد إنشائها، فتُحفظ دون ربطها بعدادات الكيانات
+    if version is None:
+        return _get_current_survey_fields(survey_id)
+    return _get_survey_version_fields(survey_id, version)
+
+@versioned_cache(ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS)
+def _get_current_survey_fields(survey_id):
+    return _load_survey_fields(survey_id, None)
+
+@versioned_cache()
+def _get_survey_version_fields(survey_id, version):
+    return _load_survey_fields(survey_id, version)
+
+def _load_survey_fields(survey_id, version):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        fields = session.sql('''
+            SELECT 
+                FIELD_ID, 
+                FIELD_LABEL, 
+                FIELD_TYPE, 
+                FIELD_OPTIONS, 
+                IS_REQUIRED, 
+                FIELD_ORDER
+            FROM SURVEY_FIELDS
+            WHERE SURVEY_ID = ?
+            AND COALESCE(SURVEY_VERSION, 1) = COALESCE(?, (
+                SELECT COALESCE(CURRENT_VERSION, 1) FROM SURVEYS WHERE SURVEY_ID = ?
+            ))
+            ORDER BY FIELD_ORDER
+        ''', params=(survey_id, version, survey_id)).collect()
+        
+        return fields
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب حقول الاستبيان: {str(e)}")
+        return []
+    finally:
+        if session:
+            session.close()
+
+# دوال إدارة الإجابات
+def save_response(survey_id, user_id, region_id, is_completed=False, survey_version=None):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        
+        # نتيجة INSERT هي عدد الصفوف المضافة، فيُقرأ المعرف الجديد بمفتاح فريد لهذا الإدراج
+        # (تسليم من السجل المحلي لنفس المستخدم والاستبيان قد يُدرج صفاً آخر في نفس اللحظة)
+        client_key = uuid.uuid4().hex
+        session.sql(
+            '''INSERT INTO RESPONSES 
+               (SURVEY_ID, USER_ID, REGION_ID, IS_COMPLETED, SURVEY_VERSION, CLIENT_KEY, INSERTED_AT) 
+               SELECT ?, ?, ?, ?, COALESCE(?, CURRENT_VERSION, 1), ?, CURRENT_TIMESTAMP()
+               FROM SURVEYS WHERE SURVEY_ID = ?''',
+            params=(survey_id, user_id, region_id, is_completed, survey_version, client_key, survey_id)
+        ).collect()
+        # لا يُدرج صف إذا كان الاستبيان غير موجود
+        rows = session.sql(
+            "SELECT RESPONSE_ID FROM RESPONSES WHERE CLIENT_KEY = ?",
+            params=(client_key,)
+        ).collect()
+        response_id = rows[0][0] if rows else None
+        
+        session.sql("COMMIT").collect()
+        return response_id
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        st.error(f"حدث خطأ في حفظ الاستجابة: {str(e)}")
+        return None
+    finally:
+        if session:
+            session.close()
+
+def deliver_submissions(submissions):
+    # تسليم دفعة من السجل المحلي في معاملة واحدة. المفاتيح التي سبق تسليمها تُتجاهل،
+    # لذا إعادة المحاولة بعد انقطاع الاتصال لا تنشئ إجابات مكررة.
+    # القيد UNIQUE لا يُفرض في Snowflake و INSERT ... WHERE NOT EXISTS لا يرى معاملة أخرى مفتوحة؛
+    # أما MERGE فيقفل الجدول حتى نهاية المعاملة، فتسليمان متزامنان لنفس المفتاح لا يُدرجان معاً.
+    # تُرجع مفاتيح الإرسالات التي حُذف استبيانها فلم تُسلَّم، أو None عند الفشل
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_SUBMIT)
+        payload = json.dumps(submissions, ensure_ascii=False)
+        document_mode = RESPONSE_STORAGE_MODE == STORAGE_DOCUMENT
+        session.sql("BEGIN TRANSACTION").collect()
+        
+        # في وضع document تُكتب الإجابات مع صف الإجابة في نفس الجملة
+        answer_columns = ", ANSWERS, ANSWERS_UPDATED_AT" if document_mode else ""
+        answer_values = ", S.ANSWERS, CURRENT_TIMESTAMP()" if document_mode else ""
+        session.sql(f'''
+            MERGE INTO RESPONSES T
+            USING (
+                SELECT S.VALUE:key::VARCHAR AS CLIENT_KEY, S.VALUE:survey_id::INTEGER AS SURVEY_ID,
+                       S.VALUE:user_id::INTEGER AS USER_ID, S.VALUE:region_id::INTEGER AS REGION_ID,
+                       S.VALUE:is_completed::BOOLEAN AS IS_COMPLETED,
+                       COALESCE(S.VALUE:survey_version::INTEGER, SV.CURRENT_VERSION, 1) AS SURVEY_VERSION,
+                       S.VALUE:submitted_at::TIMESTAMP_TZ AS CLIENT_SUBMITTED_AT, S.VALUE:answers AS ANSWERS
+                FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) S
+                -- إرسال استبيان حُذف بعد حفظه محلياً لا يُسلَّم حتى لا تبقى إجابات بلا استبيان
+                JOIN SURVEYS SV ON SV.SURVEY_ID = S.VALUE:survey_id::INTEGER
+                -- المسودة المسلَّمة قد تكون أُرشفت قبل إعادة تسليمها (فقدان التأكيد مثلاً)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM RESPONSES_ARCHIVE A WHERE A.CLIENT_KEY = S.VALUE:key::VARCHAR
+                )
+            ) S
+            ON T.CLIENT_KEY = S.CLIENT_KEY
+            WHEN NOT MATCHED THEN INSERT
+                (SURVEY_ID, USER_ID, REGION_ID, IS_COMPLETED, SURVEY_VERSION, SUBMISSION_DATE, CLIENT_SUBMITTED_AT,
+                 CLIENT_KEY, INSERTED_AT{answer_columns})
+            VALUES
+                (S.SURVEY_ID, S.USER_ID, S.REGION_ID, S.IS_COMPLETED, S.SURVEY_VERSION, CURRENT_TIMESTAMP(),
+                 S.CLIENT_SUBMITTED_AT, S.CLIENT_KEY, CURRENT_TIMESTAMP(){answer_values})
+        ''', params=(payload,)).collect()
+        
+        dropped = [row[0] for row in session.sql('''
+            SELECT S.VALUE:key::VARCHAR FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) S
+            WHERE NOT EXISTS (SELECT 1 FROM SURVEYS SV WHERE SV.SURVEY_ID = S.VALUE:survey_id::INTEGER)
+        ''', params=(payload,)).collect()]
+        
+        if document_mode:
+            session.sql("COMMIT").collect()
+            return dropped
+        
+        session.sql('''
+            INSERT INTO RESPONSE_DETAILS (RESPONSE_ID, FIELD_ID, ANSWER_VALUE)
+            SELECT R.RESPONSE_ID, A.KEY::INTEGER, A.VALUE::VARCHAR
+            FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) S,
+                 LATERAL FLATTEN(INPUT => S.VALUE:answers) A,
+                 RESPONSES R
+            WHERE R.CLIENT_KEY = S.VALUE:key::VARCHAR
+            AND NOT EXISTS (
+                SELECT 1 FROM RESPONSE_DETAILS D WHERE D.RESPONSE_ID = R.RESPONSE_ID
+            )
+        ''', params=(payload,)).collect()
+        
+        session.sql("COMMIT").collect()
+        return dropped
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        # يُستدعى من خيط التسليم في الخلفية حيث لا توجد صفحة لعرض الخطأ
+        logger.error("حدث خطأ في تسليم الإجابات: %s", e)
+        return None
+    finally:
+        if session:
+            session.close()
+
+def save_response_detail(response_id, field_id, answer_value):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        answer_value = str(answer_value) if answer_value is not None else ""
+        if RESPONSE_STORAGE_MODE == STORAGE_DOCUMENT:
+            session.sql('''
+                UPDATE RESPONSES
+                SET ANSWERS = OBJECT_INSERT(COALESCE(ANSWERS, OBJECT_CONSTRUCT()), ?, TO_VARIANT(?::VARCHAR), TRUE),
+                    ANSWERS_UPDATED_AT = CURRENT_TIMESTAMP()
+                WHERE RESPONSE_ID = ?
+            ''', params=(str(field_id), answer_value, response_id)).collect()
+        else:
+            session.sql(
+                "INSERT INTO RESPONSE_DETAILS (RESPONSE_ID, FIELD_ID, ANSWER_VALUE) VALUES (?, ?, ?)",
+                params=(response_id, field_id, answer_value)
+            ).collect()
+        
+        session.commit()
+        return True
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في حفظ تفاصيل الإجابة: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+# دوال مسؤولي المحافظات
+@versioned_cache(ENTITY_PERMISSIONS, ENTITY_GOVERNORATES)
+def get_governorate_admin(user_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        result = session.sql('''
+            SELECT G.GOVERNORATE_ID, G.GOVERNORATE_NAME 
+            FROM GOVERNORATE_ADMINS GA
+            JOIN GOVERNORATES G ON GA.GOVERNORATE_ID = G.GOVERNORATE_ID
+            WHERE GA.USER_ID = ?
+        ''', params=(user_id,)).collect()
+        
+        return result
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب بيانات مسؤول المحافظة: {str(e)}")
+        return []
+    finally:
+        if session:
+            session.close()
+
 def add_governorate_admin(user_id, governorate_id):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
         session.sql(
             "INSERT INTO GOVERNORATE_ADMINS (USER_ID, GOVERNORATE_ID) VALUES (?, ?)",
             params=(user_id, governorate_id)
         ).collect()
         
+        _bump_entity_versions(session, ENTITY_PERMISSIONS)
         session.commit()
+        invalidate_entities(ENTITY_PERMISSIONS)
+        log_audit_event('INSERT', 'GOVERNORATE_ADMINS', user_id, new_value={'governorate_id': governorate_id})
         return True
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في إضافة مسؤول المحافظة: {str(e)}")
         return False
+    finally:
+        if session:
+            session.close()
+
+def get_governorate_admin_data(user_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        result = session.sql('''
+            SELECT G.GOVERNORATE_ID, G.GOVERNORATE_NAME, G.DESCRIPTION
+            FROM GOVERNORATE_ADMINS GA
+            JOIN GOVERNORATES G ON GA.GOVERNORATE_ID = G.GOVERNORATE_ID
+            WHERE GA.USER_ID = ?
+        ''', params=(user_id,)).collect()
+        
+        return result[0] if result else None
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب بيانات المحافظة: {str(e)}")
+        return None
+    finally:
+        if session:
+            session.close()
+
+@versioned_cache(ENTITY_SURVEYS, ENTITY_PERMISSIONS)
+def get_governorate_surveys(governorate_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        surveys = session.sql('''
+            SELECT S.SURVEY_ID, S.SURVEY_NAME, S.CREATED_AT, S.IS_ACTIVE
+            FROM SURVEYS S
+            JOIN SURVEY_GOVERNORATE SG ON S.SURVEY_ID = SG.SURVEY_ID
+            WHERE SG.GOVERNORATE_ID = ?
+            ORDER BY S.SURVEY_NAME
+        ''', params=(governorate_id,)).collect()
+        
+        return surveys
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب استبيانات المحافظة: {str(e)}")
+        return []
+    finally:
+        if session:
+            session.close()
+
+def update_survey_status(survey_id, is_active):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
+        session.sql(
+            "UPDATE SURVEYS SET IS_ACTIVE = ? WHERE SURVEY_ID = ?",
+            params=(is_active, survey_id)
+        ).collect()
+        _bump_entity_versions(session, ENTITY_SURVEYS)
+        session.commit()
+        invalidate_entities(ENTITY_SURVEYS)
+        survey_info_loader.clear(survey_id)
+        log_audit_event('UPDATE', 'SURVEYS', survey_id, new_value={'is_active': is_active})
+        return True
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في تحديث حالة الاستبيان: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+async def get_governorate_employees_async(governorate_id, page=1, page_size=50, username=None, health_admin_id=None):
+    # صفحة من موظفي المحافظة مع نشاط كل موظف؛ التجميع يقتصر على موظفي الصفحة فقط
+    session = None
+    try:
+        session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+        conditions = ["U.ROLE = 'employee'", "HA.GOVERNORATE_ID = ?"]
+        params = [governorate_id]
+        if username:
+            conditions.append("U.USERNAME ILIKE ? ESCAPE '!'")
+            params.append(_contains_pattern(username))
+        if health_admin_id:
+            conditions.append("U.ASSIGNED_REGION = ?")
+            params.append(health_admin_id)
+
+        rows = await _collect_async(session, f'''
+            WITH PAGE AS (
+                SELECT U.USER_ID, U.USERNAME, HA.ADMIN_NAME,
+                       COUNT(*) OVER () AS TOTAL_COUNT
+                FROM USERS U
+                JOIN HEALTH_ADMINISTRATIONS HA ON U.ASSIGNED_REGION = HA.ADMIN_ID
+                WHERE {' AND '.join(conditions)}
+                ORDER BY U.USERNAME, U.USER_ID
+                LIMIT ? OFFSET ?
+            ),
+            ACTIVITY AS (
+                SELECT R.USER_ID,
+                       MAX(IFF(R.IS_COMPLETED, R.SUBMISSION_DATE, NULL)) AS LAST_SUBMISSION,
+                       COUNT_IF(R.IS_COMPLETED AND R.SUBMISSION_DATE >= DATEADD(DAY, -7, CURRENT_TIMESTAMP())) AS COMPLETED_7D,
+                       COUNT_IF(R.IS_COMPLETED AND R.SUBMISSION_DATE >= DATEADD(DAY, -30, CURRENT_TIMESTAMP())) AS COMPLETED_30D
+                FROM RESPONSES R
+                JOIN PAGE P ON R.USER_ID = P.USER_ID
+                GROUP BY R.USER_ID
+            ),
+            ACCESS AS (
+                SELECT US.USER_ID, COUNT(*) AS ALLOWED_SURVEYS
+                FROM USER_SURVEYS US
+                JOIN PAGE P ON US.USER_ID = P.USER_ID
+                GROUP BY US.USER_ID
+            )
+            SELECT P.USER_ID, P.USERNAME, P.ADMIN_NAME, A.LAST_SUBMISSION,
+                   COALESCE(A.COMPLETED_7D, 0), COALESCE(A.COMPLETED_30D, 0),
+                   COALESCE(S.ALLOWED_SURVEYS, 0), P.TOTAL_COUNT
+            FROM PAGE P
+            LEFT JOIN ACTIVITY A ON P.USER_ID = A.USER_ID
+            LEFT JOIN ACCESS S ON P.USER_ID = S.USER_ID
+            ORDER BY P.USERNAME, P.USER_ID
+        ''', (*params, page_size, (page - 1) * page_size))
+
+        employees = [{
+            'user_id': row[0],
+            'username': row[1],
+            'admin_name': row[2],
+            'last_submission': row[3],
+            'completed_7d': row[4],
+            'completed_30d': row[5],
+            'allowed_surveys': row[6]
+        } for row in rows]
+        total = rows[0][7] if rows else 0
+        return employees, total
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب موظفي المحافظة: {str(e)}")
+        return [], 0
+    finally:
+        if session:
+            session.close()
+
+def get_governorate_employees(governorate_id, page=1, page_size=50, username=None, health_admin_id=None):
+    return run_sync(get_governorate_employees_async(governorate_id, page, page_size, username, health_admin_id))
+
+async def _load_employee_details(user_ids):
+    session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+    try:
+        rows = await _collect_async(session, '''
+            SELECT USERNAME, ASSIGNED_REGION, USER_ID FROM USERS
+            WHERE USER_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+        ''', (json.dumps(user_ids),))
+        return {row[2]: row for row in rows}
     finally:
         session.close()
 
+employee_details_loader = BatchLoader("employee_details", _load_employee_details)
+
+def get_employee_details(user_id):
+    try:
+        return run_sync(employee_details_loader.load(user_id))
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب بيانات الموظف: {str(e)}")
+        return None
+
+def update_user_region(user_id, region_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql(
+            "UPDATE USERS SET ASSIGNED_REGION = ? WHERE USER_ID = ?",
+            params=(region_id, user_id)
+        ).collect()
+        
+        session.commit()
+        employee_details_loader.clear(user_id)
+        log_audit_event('UPDATE', 'USERS', user_id, new_value={'assigned_region': region_id})
+        return True
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في تحديث الإدارة الصحية للموظف: {str(e)}")
+        return False
+    finally:
+        if session:
+            session.close()
+
+def _response_filter_conditions(health_admin_id=None, username=None, start_date=None, end_date=None, is_completed=None):
+    # عوامل تصفية الإجابات كشروط WHERE بمعاملات، حتى لا تُنقل إلا الصفوف المطابقة
+    conditions = []
+    params = []
+    if health_admin_id:
+        conditions.append("R.REGION_ID = ?")
+        params.append(health_admin_id)
+    if username:
+        conditions.append("U.USERNAME ILIKE ? ESCAPE '!'")
+        params.append(_contains_pattern(username))
+    if start_date:
+        conditions.append("R.SUBMISSION_DATE >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append("R.SUBMISSION_DATE < DATEADD(DAY, 1, ?::DATE)")
+        params.append(end_date)
+    if is_completed is not None:
+        conditions.append("R.IS_COMPLETED = ?")
+        params.append(is_completed)
+    return conditions, params
+
+def _responses_source(start_date=None):
+    # جدول الإجابات الحالي، أو اتحاده مع الأرشيف إذا امتدت الفترة إلى ما قبل حد الأرشفة
+    tiers = _response_tiers(start_date)
+    if len(tiers) == 1:
+        return tiers[0][0]
+    return "(" + " UNION ALL ".join(
+        f"SELECT RESPONSE_ID, SURVEY_ID, USER_ID, REGION_ID, SUBMISSION_DATE, IS_COMPLETED FROM {responses}"
+        for responses, _ in tiers
+    ) + ")"
+
+def get_governorate_responses(survey_id, governorate_id, health_admin_id=None, username=None,
+                              start_date=None, end_date=None, is_completed=None):
+    # مصدر الإجابات يُحدد قبل أخذ الجلسة حتى لا تُطلب جلستان من نفس المجمع في آن واحد
+    source = _responses_source(start_date)
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        conditions, params = _response_filter_conditions(health_admin_id, username, start_date, end_date, is_completed)
+        conditions = ["R.SURVEY_ID = ?", "HA.GOVERNORATE_ID = ?"] + conditions
+        # النتيجة DataFrame مباشرة عبر Arrow دون إنشاء كائن Row لكل صف
+        responses = session.sql(f'''
+            SELECT R.RESPONSE_ID, U.USERNAME, HA.ADMIN_NAME, R.SUBMISSION_DATE, R.IS_COMPLETED
+            FROM {source} R
+            JOIN USERS U ON R.USER_ID = U.USER_ID
+            JOIN HEALTH_ADMINISTRATIONS HA ON R.REGION_ID = HA.ADMIN_ID
+            WHERE {' AND '.join(conditions)}
+            ORDER BY R.SUBMISSION_DATE DESC
+        ''', params=(survey_id, governorate_id, *params)).to_pandas()
+        
+        return responses
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب إجابات المحافظة: {str(e)}")
+        return pd.DataFrame()
+    finally:
+        if session:
+            session.close()
+
+def get_survey_responses(survey_id, governorate_id=None, health_admin_id=None, username=None,
+                         start_date=None, end_date=None, is_completed=None):
+    # إجابات الاستبيان لمسؤول النظام في جميع المحافظات، بنفس عوامل التصفية
+    source = _responses_source(start_date)
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        conditions, params = _response_filter_conditions(health_admin_id, username, start_date, end_date, is_completed)
+        conditions = ["R.SURVEY_ID = ?"] + conditions
+        params = [survey_id] + params
+        if governorate_id:
+            conditions.append("HA.GOVERNORATE_ID = ?")
+            params.append(governorate_id)
+        responses = session.sql(f'''
+            SELECT R.RESPONSE_ID, U.USERNAME, HA.ADMIN_NAME, G.GOVERNORATE_NAME,
+                   R.SUBMISSION_DATE, R.IS_COMPLETED
+            FROM {source} R
+            JOIN USERS U ON R.USER_ID = U.USER_ID
+            JOIN HEALTH_ADMINISTRATIONS HA ON R.REGION_ID = HA.ADMIN_ID
+            JOIN GOVERNORATES G ON HA.GOVERNORATE_ID = G.GOVERNORATE_ID
+            WHERE {' AND '.join(conditions)}
+            ORDER BY R.SUBMISSION_DATE DESC
+        ''', params=tuple(params)).to_pandas()
+        
+        return responses
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب إجابات الاستبيان: {str(e)}")
+        return pd.DataFrame()
+    finally:
+        if session:
+            session.close()
+
 # دوال إدارة الصلاحيات
+@versioned_cache(ENTITY_PERMISSIONS, ENTITY_SURVEYS)
 def get_user_allowed_surveys(user_id):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
         surveys = session.sql('''
             SELECT S.SURVEY_ID, S.SURVEY_NAME 
             FROM SURVEYS S
@@ -401,13 +1721,19 @@ def get_user_allowed_surveys(user_id):
         st.error(f"حدث خطأ في جلب الاستبيانات المسموح بها: {str(e)}")
         return []
     finally:
-        session.close()
+        if session:
+            session.close()
 
 def update_user_allowed_surveys(user_id, survey_ids):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        session.sql("BEGIN TRANSACTION").collect()
         
-        # حذف جميع التصاريح الحالية
+        # التصاريح الحالية تُسجل كقيمة سابقة ثم تُحذف جميعها
+        old_survey_ids = [row[0] for row in session.sql(
+            "SELECT SURVEY_ID FROM USER_SURVEYS WHERE USER_ID = ? ORDER BY SURVEY_ID", params=(user_id,)
+        ).collect()]
         session.sql("DELETE FROM USER_SURVEYS WHERE USER_ID=?", params=(user_id,)).collect()
         
         # إضافة التصاريح الجديدة
@@ -417,18 +1743,79 @@ def update_user_allowed_surveys(user_id, survey_ids):
                 params=(user_id, survey_id)
             ).collect()
         
+        _bump_entity_versions(session, ENTITY_PERMISSIONS)
         session.commit()
+        invalidate_entities(ENTITY_PERMISSIONS)
+        log_audit_event('UPDATE', 'USER_SURVEYS', user_id, old_value=old_survey_ids, new_value=list(survey_ids))
         return True
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في تحديث الاستبيانات المسموح بها: {str(e)}")
         return False
     finally:
-        session.close()
+        if session:
+            session.close()
+
+def bulk_update_survey_access(survey_id, grant, governorate_id=None, health_admin_id=None):
+    # منح أو سحب استبيان لجميع موظفي محافظة أو إدارة صحية باستعلام واحد
+    if not governorate_id and not health_admin_id:
+        return 0
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_BULK)
+        conditions = []
+        scope_params = []
+        if governorate_id:
+            conditions.append("HA.GOVERNORATE_ID = ?")
+            scope_params.append(governorate_id)
+        if health_admin_id:
+            conditions.append("HA.ADMIN_ID = ?")
+            scope_params.append(health_admin_id)
+        scope = " AND ".join(conditions)
+
+        session.sql("BEGIN TRANSACTION").collect()
+        if grant:
+            result = session.sql(f'''
+                INSERT INTO USER_SURVEYS (USER_ID, SURVEY_ID)
+                SELECT U.USER_ID, ?
+                FROM USERS U
+                JOIN HEALTH_ADMINISTRATIONS HA ON U.ASSIGNED_REGION = HA.ADMIN_ID
+                WHERE U.ROLE = 'employee' AND {scope}
+                AND NOT EXISTS (
+                    SELECT 1 FROM USER_SURVEYS US
+                    WHERE US.USER_ID = U.USER_ID AND US.SURVEY_ID = ?
+                )
+            ''', params=(survey_id, *scope_params, survey_id)).collect()
+        else:
+            result = session.sql(f'''
+                DELETE FROM USER_SURVEYS US
+                USING USERS U, HEALTH_ADMINISTRATIONS HA
+                WHERE US.USER_ID = U.USER_ID
+                AND U.ASSIGNED_REGION = HA.ADMIN_ID
+                AND U.ROLE = 'employee'
+                AND US.SURVEY_ID = ? AND {scope}
+            ''', params=(survey_id, *scope_params)).collect()
+
+        _bump_entity_versions(session, ENTITY_PERMISSIONS)
+        session.commit()
+        invalidate_entities(ENTITY_PERMISSIONS)
+        affected = result[0][0] if result else 0
+        log_audit_event('GRANT' if grant else 'REVOKE', 'USER_SURVEYS', survey_id,
+                        new_value={'governorate_id': governorate_id,
+                                   'health_admin_id': health_admin_id,
+                                   'affected': affected})
+        return affected
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في تحديث صلاحيات الاستبيان: {str(e)}")
+        return None
+    finally:
+        if session:
+            session.close()
 
 # دوال تسجيل النشاط
 def update_last_login(user_id):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
         session.sql(
             "UPDATE USERS SET LAST_LOGIN = CURRENT_TIMESTAMP() WHERE USER_ID = ?", 
             params=(user_id,)
@@ -438,11 +1825,13 @@ def update_last_login(user_id):
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في تحديث وقت آخر دخول: {str(e)}")
     finally:
-        session.close()
+        if session:
+            session.close()
 
 def update_user_activity(user_id):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
         session.sql(
             "UPDATE USERS SET LAST_ACTIVITY = CURRENT_TIMESTAMP() WHERE USER_ID = ?", 
             params=(user_id,)
@@ -452,68 +1841,261 @@ def update_user_activity(user_id):
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في تحديث وقت النشاط: {str(e)}")
     finally:
-        session.close()
+        if session:
+            session.close()
+
+# دوال الموظفين
+def get_employee_region_info(region_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        result = session.sql('''
+            SELECT HA.ADMIN_ID, HA.ADMIN_NAME, G.GOVERNORATE_ID, G.GOVERNORATE_NAME
+            FROM HEALTH_ADMINISTRATIONS HA
+            JOIN GOVERNORATES G ON HA.GOVERNORATE_ID = G.GOVERNORATE_ID
+            WHERE HA.ADMIN_ID = ?
+        ''', params=(region_id,)).collect()
+        
+        if not result:
+            return None
+        return {
+            'admin_id': result[0][0],
+            'admin_name': result[0][1],
+            'governorate_id': result[0][2],
+            'governorate_name': result[0][3]
+        }
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب معلومات المنطقة: {str(e)}")
+        return None
+    finally:
+        if session:
+            session.close()
+
+@versioned_cache(ENTITY_PERMISSIONS, ENTITY_SURVEYS)
+def get_allowed_surveys(user_id):
+    # الاستبيانات المفعلة المسموح بها للموظف فقط
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        surveys = session.sql('''
+            SELECT S.SURVEY_ID, S.SURVEY_NAME
+            FROM SURVEYS S
+            JOIN USER_SURVEYS US ON S.SURVEY_ID = US.SURVEY_ID
+            WHERE US.USER_ID = ? AND S.IS_ACTIVE = TRUE
+            ORDER BY S.SURVEY_NAME
+        ''', params=(user_id,)).collect()
+        
+        return surveys
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب الاستبيانات المتاحة: {str(e)}")
+        return []
+    finally:
+        if session:
+            session.close()
+
+def get_user_last_login(user_id):
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        result = session.sql("SELECT LAST_LOGIN FROM USERS WHERE USER_ID = ?", params=(user_id,)).collect()
+        return result[0][0] if result else None
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب وقت آخر دخول: {str(e)}")
+        return None
+    finally:
+        if session:
+            session.close()
 
 # دوال إضافية
-def get_response_details(response_id):
+def _document_details(survey_id, version, answers):
+    # صفوف بنفس شكل RESPONSE_DETAILS من عمود ANSWERS وحقول النسخة (من الذاكرة المؤقتة بدل JOIN)؛
+    # معرف الحقل يقوم مقام DETAIL_ID في update_response_details
+    answers = json.loads(answers)
+    return [
+        Row(DETAIL_ID=field[0], FIELD_ID=field[0], FIELD_LABEL=field[1], FIELD_TYPE=field[2],
+            FIELD_OPTIONS=field[3], ANSWER_VALUE=answers[str(field[0])])
+        for field in get_survey_fields(survey_id, version)
+        if str(field[0]) in answers
+    ]
+
+async def get_response_details_async(response_id, tiers=None):
+    # الطبقات تُحدد قبل أخذ الجلسة: _response_tiers متزامنة وقد تأخذ جلسة من نفس المجمع
+    if tiers is None:
+        tiers = await asyncio.to_thread(_response_tiers)
+    session = None
+    document = None
     try:
-        session = get_snowflake_session()
-        details = session.sql('''
-            SELECT RD.DETAIL_ID, RD.FIELD_ID, SF.FIELD_LABEL, 
-                   SF.FIELD_TYPE, SF.FIELD_OPTIONS, RD.ANSWER_VALUE
-            FROM RESPONSE_DETAILS RD
-            JOIN SURVEY_FIELDS SF ON RD.FIELD_ID = SF.FIELD_ID
-            WHERE RD.RESPONSE_ID = ?
-            ORDER BY SF.FIELD_ORDER
-        ''', params=(response_id,)).collect()
+        session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+        # الإجابة المختارة قد تكون مؤرشفة: البحث في الأرشيف فقط إن لم توجد في الجداول الحالية
+        for responses, details_table in tiers:
+            if RESPONSE_STORAGE_MODE == STORAGE_DOCUMENT:
+                response = await _collect_async(session, f'''
+                    SELECT SURVEY_ID, COALESCE(SURVEY_VERSION, 1), ANSWERS FROM {responses} WHERE RESPONSE_ID = ?
+                ''', (response_id,))
+                # الإجابات التي لم تُرحَّل بعد تُقرأ من RESPONSE_DETAILS
+                if response and response[0][2] is not None:
+                    document = response[0]
+                    break
+            details = await _collect_async(session, f'''
+                SELECT RD.DETAIL_ID, RD.FIELD_ID, SF.FIELD_LABEL, 
+                       SF.FIELD_TYPE, SF.FIELD_OPTIONS, RD.ANSWER_VALUE
+                FROM {details_table} RD
+                JOIN SURVEY_FIELDS SF ON RD.FIELD_ID = SF.FIELD_ID
+                WHERE RD.RESPONSE_ID = ?
+                ORDER BY SF.FIELD_ORDER
+            ''', (response_id,))
+            if details:
+                return details
         
-        return details
+        if document is None:
+            return []
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في جلب تفاصيل الإجابة: {str(e)}")
         return []
     finally:
-        session.close()
+        if session:
+            session.close()
+    # حقول النسخة تُقرأ بعد إعادة الجلسة وفي خيط منفصل: get_survey_fields متزامنة وقد تأخذ
+    # جلسة من نفس المجمع، فاستدعاؤها داخل الحلقة مع الاحتفاظ بجلسة قد يستنفد المجمع
+    return await asyncio.to_thread(_document_details, *document)
+
+def get_response_details(response_id):
+    return run_sync(get_response_details_async(response_id, _response_tiers()))
 
 def update_response_detail(detail_id, new_value):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
         session.sql(
-            "UPDATE RESPONSE_DETAILS SET ANSWER_VALUE = ? WHERE DETAIL_ID = ?",
+            "UPDATE RESPONSE_DETAILS SET ANSWER_VALUE = ?, UPDATED_AT = CURRENT_TIMESTAMP() WHERE DETAIL_ID = ?",
             params=(new_value, detail_id)
         ).collect()
         
         session.commit()
+        log_audit_event('UPDATE', 'RESPONSE_DETAILS', detail_id, new_value=new_value)
         return True
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في تحديث الإجابة: {str(e)}")
         return False
+    finally:
+        if session:
+            session.close()
+
+def update_response_details(response_id, updates):
+    # تطبيق جميع تعديلات الإجابة {detail_id: new_value} في جملة MERGE واحدة (معاملة واحدة)
+    # وإرجاع نتيجة كل صف {detail_id: True/False}
+    if not updates:
+        return {}
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
+        if RESPONSE_STORAGE_MODE == STORAGE_DOCUMENT:
+            current = session.sql(
+                "SELECT ANSWERS FROM RESPONSES WHERE RESPONSE_ID = ?", params=(response_id,)
+            ).collect()
+            if current and current[0][0] is not None:
+                return _update_document_answers(session, response_id, json.loads(current[0][0]), updates)
+        # القيم الحالية للصفوف الموجودة ضمن هذه الإجابة: تحدد نتيجة كل صف وتُسجل كقيم سابقة
+        current = session.sql('''
+            SELECT DETAIL_ID, ANSWER_VALUE FROM RESPONSE_DETAILS
+            WHERE RESPONSE_ID = ?
+            AND DETAIL_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+        ''', params=(response_id, json.dumps(list(updates)))).collect()
+        old_values = {row[0]: row[1] for row in current}
+        results = {detail_id: detail_id in old_values for detail_id in updates}
+        if not old_values:
+            return results
+
+        payload = json.dumps([
+            {'detail_id': detail_id, 'value': None if value is None else str(value)}
+            for detail_id, value in updates.items() if detail_id in old_values
+        ])
+        session.sql('''
+            MERGE INTO RESPONSE_DETAILS T
+            USING (
+                SELECT VALUE:detail_id::INTEGER AS DETAIL_ID, VALUE:value::VARCHAR AS ANSWER_VALUE
+                FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?)))
+            ) S
+            ON T.DETAIL_ID = S.DETAIL_ID AND T.RESPONSE_ID = ?
+            WHEN MATCHED THEN UPDATE SET
+                T.ANSWER_VALUE = S.ANSWER_VALUE,
+                T.UPDATED_AT = CURRENT_TIMESTAMP()
+        ''', params=(payload, response_id)).collect()
+
+        for detail_id, old_value in old_values.items():
+            log_audit_event('UPDATE', 'RESPONSE_DETAILS', detail_id,
+                            old_value=old_value, new_value=updates[detail_id])
+        return results
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في تحديث الإجابات: {str(e)}")
+        return {detail_id: False for detail_id in updates}
+    finally:
+        if session:
+            session.close()
+
+def _update_document_answers(session, response_id, answers, updates):
+    # المفاتيح هنا معرفات الحقول؛ تُعدل فقط الحقول الموجودة في الإجابة بجملة UPDATE واحدة.
+    # OBJECT_INSERT يُطبق على القيمة الحالية في الجدول فلا تضيع تعديلات متزامنة على حقول أخرى
+    existing = [field_id for field_id in updates if str(field_id) in answers]
+    if existing:
+        expression = "ANSWERS"
+        params = []
+        for field_id in existing:
+            expression = f"OBJECT_INSERT({expression}, ?, PARSE_JSON(?), TRUE)"
+            value = updates[field_id]
+            params += [str(field_id), json.dumps(None if value is None else str(value), ensure_ascii=False)]
+        session.sql(
+            f"UPDATE RESPONSES SET ANSWERS = {expression}, ANSWERS_UPDATED_AT = CURRENT_TIMESTAMP() WHERE RESPONSE_ID = ?",
+            params=(*params, response_id)
+        ).collect()
+        log_audit_event('UPDATE', 'RESPONSE_DETAILS', response_id,
+                        old_value={field_id: answers[str(field_id)] for field_id in existing},
+                        new_value={field_id: updates[field_id] for field_id in existing})
+    return {field_id: field_id in existing for field_id in updates}
+
+async def _load_response_info(response_ids):
+    tiers = await asyncio.to_thread(_response_tiers)
+    session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+    try:
+        found = {}
+        # آخر عمود يحدد إن كانت الإجابة مؤرشفة (للقراءة فقط)
+        for responses, _ in tiers:
+            missing = [response_id for response_id in response_ids if response_id not in found]
+            if not missing:
+                break
+            rows = await _collect_async(session, f'''
+                SELECT R.RESPONSE_ID, S.SURVEY_NAME, U.USERNAME, 
+                       HA.ADMIN_NAME, G.GOVERNORATE_NAME, R.SUBMISSION_DATE,
+                       R.SURVEY_ID, COALESCE(R.SURVEY_VERSION, 1) AS SURVEY_VERSION,
+                       {responses == RESPONSE_ARCHIVE_TABLES[0]} AS IS_ARCHIVED
+                FROM {responses} R
+                JOIN SURVEYS S ON R.SURVEY_ID = S.SURVEY_ID
+                JOIN USERS U ON R.USER_ID = U.USER_ID
+                JOIN HEALTH_ADMINISTRATIONS HA ON R.REGION_ID = HA.ADMIN_ID
+                JOIN GOVERNORATES G ON HA.GOVERNORATE_ID = G.GOVERNORATE_ID
+                WHERE R.RESPONSE_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+            ''', (json.dumps(missing),))
+            found.update({row[0]: row for row in rows})
+        return found
     finally:
         session.close()
 
-def get_response_info(response_id):
+response_info_loader = BatchLoader("response_info", _load_response_info)
+
+async def get_response_info_async(response_id):
     try:
-        session = get_snowflake_session()
-        response = session.sql('''
-            SELECT R.RESPONSE_ID, S.SURVEY_NAME, U.USERNAME, 
-                   HA.ADMIN_NAME, G.GOVERNORATE_NAME, R.SUBMISSION_DATE
-            FROM RESPONSES R
-            JOIN SURVEYS S ON R.SURVEY_ID = S.SURVEY_ID
-            JOIN USERS U ON R.USER_ID = U.USER_ID
-            JOIN HEALTH_ADMINISTRATIONS HA ON R.REGION_ID = HA.ADMIN_ID
-            JOIN GOVERNORATES G ON HA.GOVERNORATE_ID = G.GOVERNORATE_ID
-            WHERE R.RESPONSE_ID = ?
-        ''', params=(response_id,)).collect()
-        
-        return response[0] if response else None
+        return await response_info_loader.load(response_id)
     except SnowparkSQLException as e:
         st.error(f"حدث خطأ في جلب معلومات الإجابة: {str(e)}")
         return None
-    finally:
-        session.close()
+
+def get_response_info(response_id):
+    return run_sync(get_response_info_async(response_id))
 
 def has_completed_survey_today(user_id, survey_id):
+    session = None
     try:
-        session = get_snowflake_session()
+        session = get_snowflake_session(WORKLOAD_INTERACTIVE)
         result = session.sql('''
             SELECT 1 FROM RESPONSES 
             WHERE USER_ID = ? AND SURVEY_ID = ? AND IS_COMPLETED = TRUE
@@ -526,4 +2108,610 @@ def has_completed_survey_today(user_id, survey_id):
         st.error(f"حدث خطأ في التحقق من إكمال الاستبيان: {str(e)}")
         return False
     finally:
-        session.close()
+        if session:
+            session.close()
+
+# دوال جداول التجميع (Rollups)
+RESPONSE_ROLLUP_NAME = 'RESPONSE_ROLLUPS'
+
+RESPONSE_ROLLUP_COUNTS = '''
+    COUNT(*) AS TOTAL_RESPONSES,
+    COUNT_IF(R.IS_COMPLETED) AS COMPLETED_RESPONSES,
+    COUNT_IF(NOT R.IS_COMPLETED) AS DRAFT_RESPONSES
+'''
+
+def refresh_response_rollups(settle_seconds=60, reconcile_seconds=3600):
+    # تحديث تزايدي لجداول التجميع انطلاقاً من آخر RESPONSE_ID تم تجميعه.
+    # لا تُجمع إلا الإجابات التي وصلت إلى الخادم قبل settle_seconds حتى لا تُفوَّت إجابات
+    # ما زالت معاملاتها مفتوحة أثناء التحديث. المهلة تُقاس بـ INSERTED_AT وليس SUBMISSION_DATE:
+    # الإرسال المتأخر من السجل المحلي يحمل وقت الإدخال عند العميل فيبدو قديماً لحظة إدراجه.
+    # INSERTED_AT هو وقت الجملة لا وقت الالتزام، فمعاملة بقيت مفتوحة أطول من المهلة قد تلتزم بمعرف
+    # أقل من الحد بعد تجاوزه؛ لذلك تُعاد أيضاً عدّ الأيام التي وصلتها إجابات خلال reconcile_seconds
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_BULK)
+        session.sql("BEGIN TRANSACTION").collect()
+
+        session.sql('''
+            MERGE INTO ROLLUP_STATE T
+            USING (SELECT ? AS ROLLUP_NAME) S ON T.ROLLUP_NAME = S.ROLLUP_NAME
+            WHEN NOT MATCHED THEN INSERT (ROLLUP_NAME, LAST_RESPONSE_ID) VALUES (S.ROLLUP_NAME, 0)
+        ''', params=(RESPONSE_ROLLUP_NAME,)).collect()
+
+        last_id = session.sql(
+            "SELECT LAST_RESPONSE_ID FROM ROLLUP_STATE WHERE ROLLUP_NAME = ?",
+            params=(RESPONSE_ROLLUP_NAME,)
+        ).collect()[0][0]
+
+        new_last_id = session.sql('''
+            SELECT COALESCE(MAX(RESPONSE_ID), ?) FROM RESPONSES
+            WHERE RESPONSE_ID > ?
+            AND COALESCE(INSERTED_AT, SUBMISSION_DATE) <= DATEADD(SECOND, -?, CURRENT_TIMESTAMP())
+        ''', params=(last_id, last_id, settle_seconds)).collect()[0][0]
+
+        if new_last_id > last_id:
+            # حجز النطاق: إذا سبقنا تحديث آخر لن يتغير أي صف ونتراجع دون تكرار العد
+            claimed = session.sql('''
+                UPDATE ROLLUP_STATE
+                SET LAST_RESPONSE_ID = ?, REFRESHED_AT = CURRENT_TIMESTAMP()
+                WHERE ROLLUP_NAME = ? AND LAST_RESPONSE_ID = ?
+            ''', params=(new_last_id, RESPONSE_ROLLUP_NAME, last_id)).collect()[0][0]
+
+            if not claimed:
+                session.sql("ROLLBACK").collect()
+                return 0
+
+            session.sql(f'''
+                MERGE INTO RESPONSE_ROLLUPS T
+                USING (
+                    SELECT R.SURVEY_ID, HA.GOVERNORATE_ID, R.REGION_ID AS HEALTH_ADMIN_ID,
+                           DATE(R.SUBMISSION_DATE) AS RESPONSE_DAY, {RESPONSE_ROLLUP_COUNTS}
+                    FROM RESPONSES R
+                    JOIN HEALTH_ADMINISTRATIONS HA ON R.REGION_ID = HA.ADMIN_ID
+                    WHERE R.RESPONSE_ID > ? AND R.RESPONSE_ID <= ?
+                    GROUP BY R.SURVEY_ID, HA.GOVERNORATE_ID, R.REGION_ID, DATE(R.SUBMISSION_DATE)
+                ) S
+                ON T.SURVEY_ID = S.SURVEY_ID
+                AND T.HEALTH_ADMIN_ID = S.HEALTH_ADMIN_ID
+                AND T.RESPONSE_DAY = S.RESPONSE_DAY
+                WHEN MATCHED THEN UPDATE SET
+                    T.GOVERNORATE_ID = S.GOVERNORATE_ID,
+                    T.TOTAL_RESPONSES = T.TOTAL_RESPONSES + S.TOTAL_RESPONSES,
+                    T.COMPLETED_RESPONSES = T.COMPLETED_RESPONSES + S.COMPLETED_RESPONSES,
+                    T.DRAFT_RESPONSES = T.DRAFT_RESPONSES + S.DRAFT_RESPONSES,
+                    T.UPDATED_AT = CURRENT_TIMESTAMP()
+                WHEN NOT MATCHED THEN INSERT
+                    (SURVEY_ID, GOVERNORATE_ID, HEALTH_ADMIN_ID, RESPONSE_DAY,
+                     TOTAL_RESPONSES, COMPLETED_RESPONSES, DRAFT_RESPONSES)
+                VALUES
+                    (S.SURVEY_ID, S.GOVERNORATE_ID, S.HEALTH_ADMIN_ID, S.RESPONSE_DAY,
+                     S.TOTAL_RESPONSES, S.COMPLETED_RESPONSES, S.DRAFT_RESPONSES)
+            ''', params=(last_id, new_last_id)).collect()
+
+        # إعادة عدّ الأيام الحديثة حتى الحد الحالي (مع الأرشيف): القيم تُستبدل ولا تُضاف، فتشمل
+        # الإجابات التي التزمت متأخرة بمعرف أقل من الحد ولا تتكرر عند التشغيل المتزامن
+        session.sql(f'''
+            MERGE INTO RESPONSE_ROLLUPS T
+            USING (
+                WITH RECENT_DAYS AS (
+                    SELECT DISTINCT SURVEY_ID, REGION_ID, DATE(SUBMISSION_DATE) AS RESPONSE_DAY
+                    FROM RESPONSES
+                    WHERE RESPONSE_ID <= ?
+                    AND INSERTED_AT >= DATEADD(SECOND, -?, CURRENT_TIMESTAMP())
+                ),
+                ALL_RESPONSES AS (
+                    SELECT RESPONSE_ID, SURVEY_ID, REGION_ID, SUBMISSION_DATE, IS_COMPLETED FROM RESPONSES
+                    UNION ALL
+                    SELECT RESPONSE_ID, SURVEY_ID, REGION_ID, SUBMISSION_DATE, IS_COMPLETED FROM RESPONSES_ARCHIVE
+                )
+                SELECT R.SURVEY_ID, HA.GOVERNORATE_ID, R.REGION_ID AS HEALTH_ADMIN_ID,
+                       DATE(R.SUBMISSION_DATE) AS RESPONSE_DAY, {RESPONSE_ROLLUP_COUNTS}
+                FROM ALL_RESPONSES R
+                JOIN RECENT_DAYS D ON D.SURVEY_ID = R.SURVEY_ID AND D.REGION_ID = R.REGION_ID
+                    AND D.RESPONSE_DAY = DATE(R.SUBMISSION_DATE)
+                JOIN HEALTH_ADMINISTRATIONS HA ON R.REGION_ID = HA.ADMIN_ID
+                WHERE R.RESPONSE_ID <= ?
+                GROUP BY R.SURVEY_ID, HA.GOVERNORATE_ID, R.REGION_ID, DATE(R.SUBMISSION_DATE)
+            ) S
+            ON T.SURVEY_ID = S.SURVEY_ID
+            AND T.HEALTH_ADMIN_ID = S.HEALTH_ADMIN_ID
+            AND T.RESPONSE_DAY = S.RESPONSE_DAY
+            WHEN MATCHED THEN UPDATE SET
+                T.GOVERNORATE_ID = S.GOVERNORATE_ID,
+                T.TOTAL_RESPONSES = S.TOTAL_RESPONSES,
+                T.COMPLETED_RESPONSES = S.COMPLETED_RESPONSES,
+                T.DRAFT_RESPONSES = S.DRAFT_RESPONSES,
+                T.UPDATED_AT = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN INSERT
+                (SURVEY_ID, GOVERNORATE_ID, HEALTH_ADMIN_ID, RESPONSE_DAY,
+                 TOTAL_RESPONSES, COMPLETED_RESPONSES, DRAFT_RESPONSES)
+            VALUES
+                (S.SURVEY_ID, S.GOVERNORATE_ID, S.HEALTH_ADMIN_ID, S.RESPONSE_DAY,
+                 S.TOTAL_RESPONSES, S.COMPLETED_RESPONSES, S.DRAFT_RESPONSES)
+        ''', params=(new_last_id, reconcile_seconds, new_last_id)).collect()
+
+        session.sql("COMMIT").collect()
+        return new_last_id - last_id
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        # المهام تُشغَّل من jobs.py خارج Streamlit: الخطأ يُسجل ويُرفع حتى تنتهي المهمة برمز فشل
+        logger.error("حدث خطأ في تحديث جداول التجميع: %s", e)
+        raise
+    finally:
+        if session:
+            session.close()
+
+async def get_survey_response_stats_async(survey_id, governorate_id=None):
+    # الإحصائيات من جداول التجميع مع إضافة الإجابات التي لم تُجمع بعد
+    session = None
+    try:
+        session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+        gov_filter_rollup = "AND GOVERNORATE_ID = ?" if governorate_id else ""
+        gov_filter_tail = "AND HA.GOVERNORATE_ID = ?" if governorate_id else ""
+        params = [survey_id] + ([governorate_id] if governorate_id else [])
+        params += [survey_id, RESPONSE_ROLLUP_NAME] + ([governorate_id] if governorate_id else [])
+
+        result = await _collect_async(session, f'''
+            SELECT COALESCE(SUM(TOTAL_RESPONSES), 0),
+                   COALESCE(SUM(COMPLETED_RESPONSES), 0),
+                   COALESCE(SUM(DRAFT_RESPONSES), 0),
+                   COUNT(DISTINCT HEALTH_ADMIN_ID)
+            FROM (
+                SELECT HEALTH_ADMIN_ID, TOTAL_RESPONSES, COMPLETED_RESPONSES, DRAFT_RESPONSES
+                FROM RESPONSE_ROLLUPS
+                WHERE SURVEY_ID = ? {gov_filter_rollup}
+                UNION ALL
+                SELECT R.REGION_ID, 1, IFF(R.IS_COMPLETED, 1, 0), IFF(R.IS_COMPLETED, 0, 1)
+                FROM RESPONSES R
+                JOIN HEALTH_ADMINISTRATIONS HA ON R.REGION_ID = HA.ADMIN_ID
+                WHERE R.SURVEY_ID = ?
+                AND R.RESPONSE_ID > COALESCE(
+                    (SELECT LAST_RESPONSE_ID FROM ROLLUP_STATE WHERE ROLLUP_NAME = ?), 0)
+                {gov_filter_tail}
+            )
+        ''', tuple(params))
+
+        total, completed, drafts, regions = result[0]
+        return {
+            'total': total,
+            'completed': completed,
+            'drafts': drafts,
+            'regions': regions
+        }
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب إحصائيات الإجابات: {str(e)}")
+        return {'total': 0, 'completed': 0, 'drafts': 0, 'regions': 0}
+    finally:
+        if session:
+            session.close()
+
+def get_survey_response_stats(survey_id, governorate_id=None):
+    return run_sync(get_survey_response_stats_async(survey_id, governorate_id))
+
+# دوال أرشفة الإجابات
+@versioned_cache(ENTITY_RESPONSE_ARCHIVE)
+def get_response_archive_state():
+    # يُرجع الصف نفسه (وليس القيمة) حتى تُخزن حالة "لا أرشيف بعد" في الذاكرة المؤقتة أيضاً
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        result = session.sql(
+            "SELECT ARCHIVED_BEFORE FROM ARCHIVE_STATE WHERE ARCHIVE_NAME = ?", params=(RESPONSE_ARCHIVE_NAME,)
+        ).collect()
+        return result[0] if result else None
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب حد الأرشفة: {str(e)}")
+        return None
+    finally:
+        if session:
+            session.close()
+
+def _response_tiers(start_date=None):
+    # الأرشيف يُضم فقط إذا وصلت الفترة المطلوبة إلى ما قبل حد الأرشفة (أو لم تُحدد بداية لها)
+    state = get_response_archive_state()
+    cutoff = state[0] if state else None
+    if cutoff is None or (start_date and pd.Timestamp(start_date) >= pd.Timestamp(cutoff)):
+        return [RESPONSE_TABLES]
+    return [RESPONSE_TABLES, RESPONSE_ARCHIVE_TABLES]
+
+def archive_responses(retention_days=365, batch_size=10000):
+    # نقل المسودات التي تلتها إجابة مكتملة لنفس المستخدم والاستبيان، والإجابات المكتملة الأقدم
+    # من مدة الاحتفاظ، إلى جداول الأرشيف على دفعات، كل دفعة في معاملة مستقلة.
+    # لا تُنقل إلا الإجابات التي دخلت جداول التجميع حتى تبقى الإحصائيات صحيحة
+    session = None
+    archived = 0
+    try:
+        session = get_snowflake_session(WORKLOAD_BULK)
+        cutoff = session.sql(
+            "SELECT DATEADD(DAY, -?, CURRENT_DATE())::TIMESTAMP_NTZ", params=(retention_days,)
+        ).collect()[0][0]
+
+        while True:
+            session.sql("BEGIN TRANSACTION").collect()
+            batch = session.sql('''
+                SELECT R.RESPONSE_ID FROM RESPONSES R
+                WHERE R.RESPONSE_ID <= COALESCE(
+                    (SELECT LAST_RESPONSE_ID FROM ROLLUP_STATE WHERE ROLLUP_NAME = ?), 0)
+                AND (
+                    (R.IS_COMPLETED AND R.SUBMISSION_DATE < ?)
+                    OR (NOT R.IS_COMPLETED AND EXISTS (
+                        SELECT 1 FROM (
+                            SELECT USER_ID, SURVEY_ID, SUBMISSION_DATE FROM RESPONSES WHERE IS_COMPLETED
+                            UNION ALL
+                            SELECT USER_ID, SURVEY_ID, SUBMISSION_DATE FROM RESPONSES_ARCHIVE WHERE IS_COMPLETED
+                        ) C
+                        WHERE C.USER_ID = R.USER_ID AND C.SURVEY_ID = R.SURVEY_ID
+                        AND C.SUBMISSION_DATE >= R.SUBMISSION_DATE
+                    ))
+                )
+                ORDER BY R.RESPONSE_ID
+                LIMIT ?
+            ''', params=(RESPONSE_ROLLUP_NAME, cutoff, batch_size)).collect()
+            if not batch:
+                session.sql("COMMIT").collect()
+                return archived
+            response_ids = json.dumps([row[0] for row in batch])
+
+            # الحد هو بداية اليوم التالي لأحدث إجابة مؤرشفة (المسودات الحديثة التي تلتها إجابة مكتملة
+            # قد تكون أحدث من مدة الاحتفاظ)، ويُحدَّث في نفس معاملة النقل حتى يضم القراء الأرشيف
+            # بمجرد أن تظهر فيه الصفوف
+            session.sql('''
+                MERGE INTO ARCHIVE_STATE T
+                USING (
+                    SELECT ? AS ARCHIVE_NAME,
+                           DATEADD(DAY, 1, TO_DATE(MAX(SUBMISSION_DATE)))::TIMESTAMP_NTZ AS ARCHIVED_BEFORE
+                    FROM RESPONSES
+                    WHERE RESPONSE_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+                ) S
+                ON T.ARCHIVE_NAME = S.ARCHIVE_NAME
+                WHEN MATCHED THEN UPDATE SET
+                    T.ARCHIVED_BEFORE = GREATEST(COALESCE(T.ARCHIVED_BEFORE, S.ARCHIVED_BEFORE), S.ARCHIVED_BEFORE),
+                    T.ARCHIVED_AT = CURRENT_TIMESTAMP()
+                WHEN NOT MATCHED THEN INSERT (ARCHIVE_NAME, ARCHIVED_BEFORE, ARCHIVED_AT)
+                VALUES (S.ARCHIVE_NAME, S.ARCHIVED_BEFORE, CURRENT_TIMESTAMP())
+            ''', params=(RESPONSE_ARCHIVE_NAME, response_ids)).collect()
+            _bump_entity_versions(session, ENTITY_RESPONSE_ARCHIVE)
+
+            session.sql('''
+                INSERT INTO RESPONSES_ARCHIVE
+                    (RESPONSE_ID, SURVEY_ID, USER_ID, REGION_ID, SUBMISSION_DATE, IS_COMPLETED,
+                     SURVEY_VERSION, CLIENT_KEY, ANSWERS, ANSWERS_UPDATED_AT)
+                SELECT RESPONSE_ID, SURVEY_ID, USER_ID, REGION_ID, SUBMISSION_DATE, IS_COMPLETED,
+                       SURVEY_VERSION, CLIENT_KEY, ANSWERS, ANSWERS_UPDATED_AT
+                FROM RESPONSES
+                WHERE RESPONSE_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+                ORDER BY SURVEY_ID, SUBMISSION_DATE
+            ''', params=(response_ids,)).collect()
+            session.sql('''
+                INSERT INTO RESPONSE_DETAILS_ARCHIVE (DETAIL_ID, RESPONSE_ID, FIELD_ID, ANSWER_VALUE, UPDATED_AT)
+                SELECT DETAIL_ID, RESPONSE_ID, FIELD_ID, ANSWER_VALUE, UPDATED_AT
+                FROM RESPONSE_DETAILS
+                WHERE RESPONSE_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+                ORDER BY RESPONSE_ID
+            ''', params=(response_ids,)).collect()
+            for table in ("RESPONSE_DETAILS", "RESPONSES"):
+                session.sql(f'''
+                    DELETE FROM {table}
+                    WHERE RESPONSE_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+                ''', params=(response_ids,)).collect()
+
+            session.sql("COMMIT").collect()
+            invalidate_entities(ENTITY_RESPONSE_ARCHIVE)
+            archived += len(batch)
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        # المهام تُشغَّل من jobs.py خارج Streamlit: الخطأ يُسجل ويُرفع حتى تنتهي المهمة برمز فشل
+        logger.error("حدث خطأ في أرشفة الإجابات بعد نقل %s إجابة: %s", archived, e)
+        raise
+    finally:
+        if session:
+            session.close()
+
+# دوال التصدير
+# إجابات استبيان واحد بشكل صفوف (RESPONSE_ID, FIELD_ID, ANSWER_VALUE, UPDATED_AT) في وضع document:
+# من عمود ANSWERS، مع ما لم يُرحَّل بعد من جدول التفاصيل. المعاملات: معرف الاستبيان مرتين
+DOCUMENT_ANSWER_ROWS = '''
+    SELECT R.RESPONSE_ID, A.KEY::INTEGER AS FIELD_ID, A.VALUE::VARCHAR AS ANSWER_VALUE,
+           R.ANSWERS_UPDATED_AT AS UPDATED_AT
+    FROM {responses} R, LATERAL FLATTEN(INPUT => R.ANSWERS) A
+    WHERE R.SURVEY_ID = ?
+    UNION ALL
+    SELECT D.RESPONSE_ID, D.FIELD_ID, D.ANSWER_VALUE, D.UPDATED_AT
+    FROM {details} D
+    JOIN {responses} R ON D.RESPONSE_ID = R.RESPONSE_ID
+    WHERE R.SURVEY_ID = ? AND R.ANSWERS IS NULL
+'''
+
+def _answer_rows(responses, details, survey_id):
+    # مصدر صفوف الإجابات لطبقة واحدة (الحالية أو الأرشيف) مع معاملاته
+    if RESPONSE_STORAGE_MODE == STORAGE_DOCUMENT:
+        return f"({DOCUMENT_ANSWER_ROWS.format(responses=responses, details=details)})", [survey_id, survey_id]
+    return details, []
+
+def iter_survey_export_batches(survey_id):
+    # جلب بيانات التصدير على دفعات (Arrow) دون تحميل النتيجة كاملة في الذاكرة.
+    # أخطاء الاستعلام تُرفع إلى المستدعي: التوقف بصمت يجعل الكاتب ينتج ملفاً ناقصاً ويعتبره ناجحاً
+    tiers = _response_tiers()
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_BULK)
+        # التصدير الشامل لا يحدد فترة، فيضم الأرشيف متى وُجد
+        parts = []
+        params = []
+        for responses, details in tiers:
+            answers, answer_params = _answer_rows(responses, details, survey_id)
+            parts.append(f'''
+                SELECT R.RESPONSE_ID, U.USERNAME, HA.ADMIN_NAME, G.GOVERNORATE_NAME,
+                       R.SUBMISSION_DATE, IFF(R.IS_COMPLETED, 'مكتملة', 'مسودة') AS STATUS,
+                       SF.FIELD_LABEL, RD.ANSWER_VALUE, SF.FIELD_ORDER
+                FROM {responses} R
+                JOIN USERS U ON R.USER_ID = U.USER_ID
+                JOIN HEALTH_ADMINISTRATIONS HA ON R.REGION_ID = HA.ADMIN_ID
+                JOIN GOVERNORATES G ON HA.GOVERNORATE_ID = G.GOVERNORATE_ID
+                JOIN {answers} RD ON RD.RESPONSE_ID = R.RESPONSE_ID
+                JOIN SURVEY_FIELDS SF ON RD.FIELD_ID = SF.FIELD_ID
+                WHERE R.SURVEY_ID = ?
+            ''')
+            params += answer_params + [survey_id]
+        query = session.sql(
+            " UNION ALL ".join(parts) + " ORDER BY RESPONSE_ID, FIELD_ORDER", params=tuple(params)
+        )
+
+        for batch in query.to_pandas_batches():
+            yield batch
+    finally:
+        if session:
+            session.close()
+
+def get_survey_export_version(survey_id):
+    # بصمة بيانات الاستبيان: آخر إجابة، آخر تعديل على التفاصيل، وعدد صفوف التفاصيل
+    tiers = _response_tiers()
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_DASHBOARD)
+        # الأرشفة تنقل الصفوف دون تغيير مجموعها، فلا تتغير البصمة بسببها
+        parts = []
+        params = []
+        for responses, details in tiers:
+            answers, answer_params = _answer_rows(responses, details, survey_id)
+            parts.append(f'''
+                SELECT R.RESPONSE_ID, RD.UPDATED_AT, RD.RESPONSE_ID AS ANSWER_RESPONSE_ID
+                FROM {responses} R
+                LEFT JOIN {answers} RD ON RD.RESPONSE_ID = R.RESPONSE_ID
+                WHERE R.SURVEY_ID = ?
+            ''')
+            params += answer_params + [survey_id]
+        result = session.sql(f'''
+            SELECT COALESCE(MAX(RESPONSE_ID), 0), MAX(UPDATED_AT), COUNT(ANSWER_RESPONSE_ID)
+            FROM ({" UNION ALL ".join(parts)})
+        ''', params=tuple(params)).collect()
+        
+        return result[0] if result else None
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب إصدار بيانات الاستبيان: {str(e)}")
+        return None
+    finally:
+        if session:
+            session.close()
+
+# دوال سجل التعديلات
+def insert_audit_logs(events):
+    # إدراج دفعة من أحداث السجل في جملة INSERT واحدة
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_SUBMIT)
+        session.sql('''
+            INSERT INTO AUDIT_LOG
+                (USER_ID, ACTION_TYPE, TABLE_NAME, RECORD_ID, OLD_VALUE, NEW_VALUE, ACTION_TIMESTAMP)
+            SELECT VALUE:user_id::INTEGER, VALUE:action_type::VARCHAR, VALUE:table_name::VARCHAR,
+                   VALUE:record_id::INTEGER, VALUE:old_value::VARCHAR, VALUE:new_value::VARCHAR,
+                   VALUE:action_timestamp::TIMESTAMP_TZ::TIMESTAMP_LTZ::TIMESTAMP_NTZ
+            FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?)))
+        ''', params=(json.dumps(events, ensure_ascii=False),)).collect()
+        return True
+    except SnowparkSQLException as e:
+        # يُستدعى من كاتب السجل في الخلفية حيث لا توجد صفحة لعرض الخطأ
+        logger.error("حدث خطأ في كتابة سجل التعديلات: %s", e)
+        return False
+    finally:
+        if session:
+            session.close()
+
+async def get_audit_logs_async(username=None, table_name=None, action_type=None, start_date=None, end_date=None,
+                               cursor=None, page_size=50, include_archive=False):
+    # ترقيم بالمفتاح (ACTION_TIMESTAMP, LOG_ID) تنازلياً بدلاً من OFFSET
+    # cursor: (ACTION_TIMESTAMP, LOG_ID) لآخر صف في الصفحة السابقة
+    session = None
+    try:
+        session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+        conditions = []
+        params = []
+        if username:
+            conditions.append("U.USERNAME ILIKE ? ESCAPE '!'")
+            params.append(_contains_pattern(username))
+        if table_name:
+            conditions.append("A.TABLE_NAME = ?")
+            params.append(table_name)
+        if action_type:
+            conditions.append("A.ACTION_TYPE = ?")
+            params.append(action_type)
+        if start_date:
+            conditions.append("A.ACTION_TIMESTAMP >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("A.ACTION_TIMESTAMP < DATEADD(DAY, 1, ?::DATE)")
+            params.append(end_date)
+        if cursor:
+            conditions.append("(A.ACTION_TIMESTAMP < ? OR (A.ACTION_TIMESTAMP = ? AND A.LOG_ID < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        source = "AUDIT_LOG"
+        if include_archive:
+            source = "(SELECT * FROM AUDIT_LOG UNION ALL SELECT * FROM AUDIT_LOG_ARCHIVE)"
+
+        logs = await _collect_async(session, f'''
+            SELECT A.LOG_ID, A.ACTION_TIMESTAMP, U.USERNAME, A.ACTION_TYPE, A.TABLE_NAME,
+                   A.RECORD_ID, A.OLD_VALUE, A.NEW_VALUE
+            FROM {source} A
+            LEFT JOIN USERS U ON A.USER_ID = U.USER_ID
+            {where}
+            ORDER BY A.ACTION_TIMESTAMP DESC, A.LOG_ID DESC
+            LIMIT ?
+        ''', (*params, page_size))
+
+        return logs
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب سجل التعديلات: {str(e)}")
+        return []
+    finally:
+        if session:
+            session.close()
+
+def get_audit_logs(username=None, table_name=None, action_type=None, start_date=None, end_date=None,
+                   cursor=None, page_size=50, include_archive=False):
+    return run_sync(get_audit_logs_async(username, table_name, action_type, start_date, end_date,
+                                         cursor, page_size, include_archive))
+
+def cluster_responses_table():
+    # تجميع الإجابات حسب الاستبيان واليوم حتى تتخطى عوامل تصفية التاريخ الأجزاء غير المطابقة.
+    # إعادة التجميع تكتب الجدول من جديد في الخلفية وتُحتسب تكلفتها، لذا تُشغل مرة واحدة كمهمة
+    # وليس مع كل بدء تشغيل للتطبيق
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_BULK)
+        session.sql(
+            "ALTER TABLE RESPONSES CLUSTER BY (SURVEY_ID, TO_DATE(SUBMISSION_DATE))"
+        ).collect()
+        return True
+    except SnowparkSQLException as e:
+        # المهام تُشغَّل من jobs.py خارج Streamlit: الخطأ يُسجل ويُرفع حتى تنتهي المهمة برمز فشل
+        logger.error("حدث خطأ في تجميع جدول الإجابات: %s", e)
+        raise
+    finally:
+        if session:
+            session.close()
+
+def archive_audit_logs(retention_days=365):
+    # نقل السجلات الأقدم من مدة الاحتفاظ إلى الأرشيف مع تحديث الملخص اليومي في معاملة واحدة
+    session = None
+    try:
+        session = get_snowflake_session(WORKLOAD_BULK)
+        session.sql("BEGIN TRANSACTION").collect()
+
+        cutoff = session.sql(
+            "SELECT DATEADD(DAY, -?, CURRENT_DATE())::TIMESTAMP_NTZ", params=(retention_days,)
+        ).collect()[0][0]
+
+        session.sql('''
+            MERGE INTO AUDIT_LOG_DAILY_SUMMARY T
+            USING (
+                SELECT TO_DATE(ACTION_TIMESTAMP) AS LOG_DAY, USER_ID, TABLE_NAME, ACTION_TYPE,
+                       COUNT(*) AS ACTION_COUNT
+                FROM AUDIT_LOG
+                WHERE ACTION_TIMESTAMP < ?
+                GROUP BY TO_DATE(ACTION_TIMESTAMP), USER_ID, TABLE_NAME, ACTION_TYPE
+            ) S
+            ON T.LOG_DAY = S.LOG_DAY AND T.USER_ID = S.USER_ID
+            AND T.TABLE_NAME = S.TABLE_NAME AND T.ACTION_TYPE = S.ACTION_TYPE
+            WHEN MATCHED THEN UPDATE SET T.ACTION_COUNT = T.ACTION_COUNT + S.ACTION_COUNT
+            WHEN NOT MATCHED THEN INSERT (LOG_DAY, USER_ID, TABLE_NAME, ACTION_TYPE, ACTION_COUNT)
+            VALUES (S.LOG_DAY, S.USER_ID, S.TABLE_NAME, S.ACTION_TYPE, S.ACTION_COUNT)
+        ''', params=(cutoff,)).collect()
+
+        session.sql('''
+            INSERT INTO AUDIT_LOG_ARCHIVE
+                (LOG_ID, USER_ID, ACTION_TYPE, TABLE_NAME, RECORD_ID, OLD_VALUE, NEW_VALUE, ACTION_TIMESTAMP)
+            SELECT LOG_ID, USER_ID, ACTION_TYPE, TABLE_NAME, RECORD_ID, OLD_VALUE, NEW_VALUE, ACTION_TIMESTAMP
+            FROM AUDIT_LOG
+            WHERE ACTION_TIMESTAMP < ?
+            ORDER BY ACTION_TIMESTAMP
+        ''', params=(cutoff,)).collect()
+
+        archived = session.sql(
+            "DELETE FROM AUDIT_LOG WHERE ACTION_TIMESTAMP < ?", params=(cutoff,)
+        ).collect()[0][0]
+
+        session.sql("COMMIT").collect()
+        return archived
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        # المهام تُشغَّل من jobs.py خارج Streamlit: الخطأ يُسجل ويُرفع حتى تنتهي المهمة برمز فشل
+        logger.error("حدث خطأ في أرشفة سجل التعديلات: %s", e)
+        raise
+    finally:
+        if session:
+            session.close()
+
+def migrate_response_details_to_documents(batch_size=1000):
+    # نقل إجابات RESPONSE_DETAILS إلى عمود ANSWERS على دفعات، كل دفعة في معاملة مستقلة
+    # حتى يمكن إيقاف الترحيل واستئنافه؛ القراءة أثناء الترحيل تجمع المصدرين
+    if RESPONSE_STORAGE_MODE != STORAGE_DOCUMENT:
+        raise RuntimeError("الترحيل يتطلب RESPONSE_STORAGE_MODE=document حتى لا تُكتب إجابات جديدة في RESPONSE_DETAILS")
+    session = None
+    migrated = 0
+    try:
+        session = get_snowflake_session(WORKLOAD_BULK)
+        while True:
+            batch = session.sql('''
+                SELECT DISTINCT RESPONSE_ID FROM RESPONSE_DETAILS ORDER BY RESPONSE_ID LIMIT ?
+            ''', params=(batch_size,)).collect()
+            if not batch:
+                return migrated
+            response_ids = json.dumps([row[0] for row in batch])
+
+            session.sql("BEGIN TRANSACTION").collect()
+            # الإجابة التي لها ANSWERS مسبقاً تحتفظ بها (كُتبت بعد تفعيل الوضع وهي الأحدث)
+            session.sql('''
+                UPDATE RESPONSES R
+                SET ANSWERS = COALESCE(R.ANSWERS, D.ANSWERS),
+                    ANSWERS_UPDATED_AT = COALESCE(R.ANSWERS_UPDATED_AT, D.UPDATED_AT)
+                FROM (
+                    SELECT RESPONSE_ID, OBJECT_AGG(FIELD_ID::VARCHAR, ANSWER_VALUE::VARIANT) AS ANSWERS,
+                           MAX(UPDATED_AT) AS UPDATED_AT
+                    FROM RESPONSE_DETAILS
+                    WHERE RESPONSE_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+                    GROUP BY RESPONSE_ID
+                ) D
+                WHERE R.RESPONSE_ID = D.RESPONSE_ID
+            ''', params=(response_ids,)).collect()
+            session.sql('''
+                DELETE FROM RESPONSE_DETAILS
+                WHERE RESPONSE_ID IN (SELECT VALUE::INTEGER FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+            ''', params=(response_ids,)).collect()
+            session.sql("COMMIT").collect()
+            migrated += len(batch)
+    except SnowparkSQLException as e:
+        if session:
+            session.sql("ROLLBACK").collect()
+        # المهام تُشغَّل من jobs.py خارج Streamlit: الخطأ يُسجل ويُرفع حتى تنتهي المهمة برمز فشل
+        logger.error("حدث خطأ في ترحيل الإجابات بعد ترحيل %s إجابة: %s", migrated, e)
+        raise
+    finally:
+        if session:
+            session.close()
+
+async def get_audit_daily_summary_async(start_date, end_date):
+    session = None
+    try:
+        session = await get_snowflake_session_async(WORKLOAD_DASHBOARD)
+        summary = await _collect_async(session, '''
+            SELECT S.LOG_DAY, U.USERNAME, S.TABLE_NAME, S.ACTION_TYPE, S.ACTION_COUNT
+            FROM AUDIT_LOG_DAILY_SUMMARY S
+            LEFT JOIN USERS U ON S.USER_ID = U.USER_ID
+            WHERE S.LOG_DAY BETWEEN ? AND ?
+            ORDER BY S.LOG_DAY DESC, S.ACTION_COUNT DESC
+        ''', (start_date, end_date))
+        return summary
+    except SnowparkSQLException as e:
+        st.error(f"حدث خطأ في جلب ملخص سجل التعديلات: {str(e)}")
+        return []
+    finally:
+        if session:
+            session.close()
+
+def get_audit_daily_summary(start_date, end_date):
+    return run_sync(get_audit_daily_summary_async(start_date, end_date))
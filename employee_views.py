@@ -1,12 +1,13 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-import json
+import uuid
+import sqlite3
 from database import (
-    get_employee_region_info, get_allowed_surveys, get_survey_fields,
-    save_response, save_response_detail, has_completed_survey_today,
-    get_response_info, get_response_details
+    get_employee_region_info, get_allowed_surveys,
+    has_completed_survey_today, defer_survey_info
 )
+from submission_queue import enqueue_submission, has_pending_completion
+from survey_plans import get_survey_plan, missing_required_fields
 
 def show_employee_dashboard():
     if not st.session_state.get('region_id'):
@@ -28,6 +29,9 @@ def show_employee_dashboard():
 
     selected_surveys = display_survey_selection(allowed_surveys)
     
+    # الاستبيانات المختارة التي لم تُعرض بعد تُجلب معلوماتها باستعلام واحد عند أول طلب بدلاً من استعلام لكل جزء
+    defer_survey_info([s for s in selected_surveys if f"survey_state_{s}" not in st.session_state])
+    
     for survey_id in selected_surveys:
         display_single_survey(survey_id, region_info['admin_id'])
 
@@ -64,31 +68,50 @@ def display_survey_selection(allowed_surveys):
     
     return selected_surveys
 
+@st.fragment
 def display_single_survey(survey_id, region_id):
+    # كل استبيان جزء مستقل: تفاعلاته تعيد تنفيذ هذا الجزء فقط وليس التطبيق كاملاً
     from database import get_survey_info
     
+    # معلومات الاستبيان من الذاكرة المؤقتة المرتبطة بعدادات ENTITY_VERSIONS، فنشر نسخة جديدة يظهر هنا
     survey_info = get_survey_info(survey_id)
     if not survey_info:
         st.error("الاستبيان المحدد غير موجود")
         return
+    
+    # خطة النموذج مرتبطة بنسخة الاستبيان، وحالة "أكمله اليوم" مرتبطة بالتاريخ الذي حُسبت فيه
+    state_key = f"survey_state_{survey_id}"
+    state = st.session_state.get(state_key)
+    if state is None:
+        state = st.session_state[state_key] = {'completed_today': False, 'date': None}
+    if state.get('version') != survey_info[3]:
+        state.update(version=survey_info[3], plan=None)
+    today = datetime.now().date()
+    if state['date'] != today:
+        state['completed_today'] = completed_survey_today(st.session_state.user_id, survey_id)
+        state['date'] = today
+    
+    submitted_survey = st.session_state.pop(f"survey_submitted_{survey_id}", None)
+    if submitted_survey:
+        show_submission_message(True, submitted_survey)
         
-    if has_completed_survey_today(st.session_state.user_id, survey_id):
+    if state['completed_today']:
         st.warning(f"لقد أكملت استبيان '{survey_info[0]}' اليوم. يمكنك إكماله مرة أخرى غدًا.")
         return
         
     with st.expander(f"📋 {survey_info[0]} (تاريخ الإنشاء: {survey_info[1]})"):
-        fields = get_survey_fields(survey_id)
-        display_survey_form(survey_id, region_id, fields, survey_info[0])
+        if state['plan'] is None:
+            state['plan'] = get_survey_plan(survey_id, survey_info[3])
+        display_survey_form(survey_id, region_id, state['plan'], survey_info[0])
 
-def display_survey_form(survey_id, region_id, fields, survey_name):
+def display_survey_form(survey_id, region_id, plan, survey_name):
     with st.form(f"survey_form_{survey_id}"):
         st.markdown("**يرجى تعبئة جميع الحقول المطلوبة (*)**")
         
         st.subheader("🧾 بيانات الاستبيان")
         answers = {}
-        for field in fields:
-            field_id, label, field_type, options, is_required, _ = field
-            answers[field_id] = render_field(field_id, label, field_type, options, is_required)
+        for field in plan.fields:
+            answers[field.field_id] = render_field(field)
         
         col1, col2 = st.columns(2)
         with col1:
@@ -100,71 +123,77 @@ def display_survey_form(survey_id, region_id, fields, survey_name):
             process_survey_submission(
                 survey_id,
                 region_id,
-                fields,
+                plan,
                 answers,
                 submitted,
                 survey_name
             )
 
-def render_field(field_id, label, field_type, options, is_required):
-    required_mark = " *" if is_required else ""
-    
-    if field_type == 'text':
-        return st.text_input(label + required_mark, key=f"text_{field_id}")
-    elif field_type == 'number':
-        return st.number_input(label + required_mark, key=f"number_{field_id}")
-    elif field_type == 'dropdown':
-        options_list = json.loads(options) if options else []
-        return st.selectbox(label + required_mark, options_list, key=f"dropdown_{field_id}")
-    elif field_type == 'checkbox':
-        return st.checkbox(label + required_mark, key=f"checkbox_{field_id}")
-    elif field_type == 'date':
-        return st.date_input(label + required_mark, key=f"date_{field_id}")
+def render_field(field):
+    label = field.label + (" *" if field.is_required else "")
+    field_id = field.field_id
+    
+    if field.field_type == 'text':
+        return st.text_input(label, key=f"text_{field_id}")
+    elif field.field_type == 'number':
+        return st.number_input(label, key=f"number_{field_id}")
+    elif field.field_type == 'dropdown':
+        return st.selectbox(label, field.options, key=f"dropdown_{field_id}")
+    elif field.field_type == 'checkbox':
+        return st.checkbox(label, key=f"checkbox_{field_id}")
+    elif field.field_type == 'date':
+        return st.date_input(label, key=f"date_{field_id}")
     else:
-        st.warning(f"نوع الحقل غير معروف: {field_type}")
+        st.warning(f"نوع الحقل غير معروف: {field.field_type}")
         return None
 
-def process_survey_submission(survey_id, region_id, fields, answers, is_completed, survey_name):
-    missing_fields = check_required_fields(fields, answers)
+def process_survey_submission(survey_id, region_id, plan, answers, is_completed, survey_name):
+    missing_fields = check_required_fields(plan, answers)
     
     if missing_fields and is_completed:
         st.error(f"الحقول التالية مطلوبة: {', '.join(missing_fields)}")
         return
     
-    if is_completed and has_completed_survey_today(st.session_state.user_id, survey_id):
+    if is_completed and completed_survey_today(st.session_state.user_id, survey_id):
         st.error("لقد قمت بإكمال هذا الاستبيان اليوم بالفعل. يمكنك إكماله مرة أخرى غدًا.")
         return
     
-    response_id = save_response(
-        survey_id=survey_id,
-        user_id=st.session_state.user_id,
-        region_id=region_id,
-        is_completed=is_completed
-    )
-    
-    if not response_id:
-        st.error("حدث خطأ أثناء حفظ البيانات")
+    # الحفظ في السجل المحلي فوري؛ التسليم إلى Snowflake يتم في الخلفية.
+    # المفتاح ثابت لنفس النموذج حتى لا تنشئ إعادة الإرسال إجابة مكررة
+    key_name = f"submission_key_{survey_id}"
+    if key_name not in st.session_state:
+        st.session_state[key_name] = uuid.uuid4().hex
+    
+    try:
+        enqueue_submission(
+            idempotency_key=st.session_state[key_name],
+            survey_id=survey_id,
+            user_id=st.session_state.user_id,
+            region_id=region_id,
+            is_completed=is_completed,
+            survey_version=plan.version,
+            answers=answers
+        )
+    except sqlite3.Error as e:
+        st.error(f"حدث خطأ أثناء حفظ البيانات: {str(e)}")
         return
     
-    save_response_details(response_id, answers)
-    show_submission_message(is_completed, survey_name)
+    del st.session_state[key_name]
+    
+    if is_completed:
+        # الإرسال النهائي يغير حالة الاستبيان، لذا نعيد تشغيل التطبيق كاملاً
+        st.session_state[f"survey_state_{survey_id}"]['completed_today'] = True
+        st.session_state[f"survey_submitted_{survey_id}"] = survey_name
+        st.rerun(scope="app")
+    else:
+        show_submission_message(is_completed, survey_name)
 
-def check_required_fields(fields, answers):
-    missing_fields = []
-    for field in fields:
-        field_id, label, _, _, is_required, _ = field
-        if is_required and not answers.get(field_id):
-            missing_fields.append(label)
-    return missing_fields
+def check_required_fields(plan, answers):
+    return missing_required_fields(plan, answers)
 
-def save_response_details(response_id, answers):
-    for field_id, answer in answers.items():
-        if answer is not None:
-            save_response_detail(
-                response_id=response_id,
-                field_id=field_id,
-                answer_value=str(answer)
-            )
+def completed_survey_today(user_id, survey_id):
+    # يشمل الإرسالات المكتملة التي ما زالت في السجل المحلي ولم تصل بعد
+    return has_pending_completion(user_id, survey_id) or has_completed_survey_today(user_id, survey_id)
 
 def show_submission_message(is_completed, survey_name):
     if is_completed:
@@ -176,38 +205,3 @@ def show_submission_message(is_completed, survey_name):
         cols[2].info(f"حالة: مكتمل")
     else:
         st.success(f"تم حفظ مسودة استبيان '{survey_name}' بنجاح")
-
-def view_survey_responses(survey_id):
-    from database import get_user_survey_responses
-    
-    survey = get_survey_info(survey_id)
-    if not survey:
-        st.error("الاستبيان المحدد غير موجود")
-        return
-        
-    st.subheader(f"إجابات استبيان {survey[0]} (عرض فقط)")
-    
-    responses = get_user_survey_responses(st.session_state.user_id, survey_id)
-    
-    if not responses:
-        st.info("لا توجد إجابات مسجلة لهذا الاستبيان")
-        return
-    
-    df = pd.DataFrame(
-        [(r[0], r[1], "✔️" if r[2] else "✖️") for r in responses],
-        columns=["ID", "التاريخ", "الحالة"]
-    )
-    
-    st.dataframe(df, use_container_width=True)
-    
-    selected_response_id = st.selectbox(
-        "اختر إجابة لعرض تفاصيلها",
-        options=[r[0] for r in responses],
-        format_func=lambda x: f"إجابة #{x}"
-    )
-
-    if selected_response_id:
-        details = get_response_details(selected_response_id)
-        st.subheader("تفاصيل الإجابة المحددة")
-        for field, answer in details:
-            st.write(f"**{field}:** {answer if answer else 'غير مدخل'}")
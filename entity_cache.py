@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+import functools
+from shared_cache import get_or_compute
+
+# ذاكرة مؤقتة داخل العملية للبيانات المرجعية، تُبطل بدقة عند تغير عدادات ENTITY_VERSIONS.
+# كل عملية تفحص العدادات باستعلام صغير واحد كل ENTITY_POLL_SECONDS، فتظهر الكتابات
+# التي تمت في نسخة أخرى من التطبيق دون الاعتماد على مدة صلاحية قصيرة
+ENTITY_POLL_SECONDS = float(os.getenv("ENTITY_POLL_SECONDS", "3"))
+
+ENTITY_GOVERNORATES = "governorates"
+ENTITY_HEALTH_ADMINS = "health_admins"
+ENTITY_SURVEYS = "surveys"
+ENTITY_SURVEY_FIELDS = "survey_fields"
+ENTITY_PERMISSIONS = "permissions"
+ENTITY_RESPONSE_ARCHIVE = "response_archive"
+ENTITIES = [ENTITY_GOVERNORATES, ENTITY_HEALTH_ADMINS, ENTITY_SURVEYS, ENTITY_SURVEY_FIELDS, ENTITY_PERMISSIONS,
+            ENTITY_RESPONSE_ARCHIVE]
+
+_lock = threading.Lock()
+_poll_lock = threading.Lock()
+_versions = {}
+_cache = {}
+_generation = 0
+_last_poll = 0.0
+
+def invalidate_entities(*entities):
+    global _generation
+    entities = set(entities)
+    with _lock:
+        _generation += 1
+        for key in [k for k, (tags, _) in _cache.items() if tags & entities]:
+            del _cache[key]
+
+def poll_entity_versions(force=False):
+    global _last_poll
+    now = time.monotonic()
+    if not force and now - _last_poll < ENTITY_POLL_SECONDS:
+        return
+    # عملية فحص واحدة في كل مرة؛ بقية الخيوط تستخدم الذاكرة الحالية
+    if not _poll_lock.acquire(blocking=False):
+        return
+    try:
+        _last_poll = now
+        from database import get_entity_versions
+        versions = get_entity_versions()
+        if versions is None:
+            return
+        changed = [entity for entity, version in versions.items() if _versions.get(entity) != version]
+        _versions.update(versions)
+        if changed:
+            invalidate_entities(*changed)
+    finally:
+        _poll_lock.release()
+
+def _shared_key(func, key, tags):
+    # نسخ الكيانات جزء من المفتاح، فأي كتابة في أي نسخة من التطبيق تنتج مفتاحاً جديداً
+    versions = tuple((entity, _versions.get(entity)) for entity in sorted(tags))
+    if any(version is None for _, version in versions):
+        return None
+    return repr((func.__module__, key, versions))
+
+def versioned_cache(*entities):
+    tags = frozenset(entities)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            poll_entity_versions()
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            with _lock:
+                if key in _cache:
+                    return _cache[key][1]
+                generation = _generation
+
+            shared_key = _shared_key(func, key, tags)
+            if shared_key is None:
+                value = func(*args, **kwargs)
+            else:
+                value = get_or_compute(shared_key, lambda: func(*args, **kwargs))
+
+            # النتائج الفارغة قد تكون ناتجة عن خطأ فلا تُخزن، ولا تُخزن قراءة تزامنت مع إبطال
+            if value:
+                with _lock:
+                    if generation == _generation:
+                        _cache[key] = (tags, value)
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
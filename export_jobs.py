@@ -0,0 +1,152 @@
+import os
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from database import get_survey_export_version
+from exports import EXPORT_WRITERS, EXPORT_FORMATS, export_filename
+
+# إعدادات مهام التصدير وذاكرة الملفات المؤقتة
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "survey_exports"))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+EXPORT_CACHE_MAX_AGE_HOURS = float(os.getenv("EXPORT_CACHE_MAX_AGE_HOURS", "24"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+
+# الحالة مشتركة بين جميع جلسات العملية لأن الوحدة تُحمَّل مرة واحدة
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def _cache_path(survey_id, version, export_format):
+    max_response_id, last_edit, _ = version
+    key = f"{survey_id}:{max_response_id}:{last_edit}:{export_format}"
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return os.path.join(EXPORT_CACHE_DIR, digest + EXPORT_FORMATS[export_format][1])
+
+def evict_export_cache():
+    # حذف الملفات الأقدم من الحد المسموح ثم الأقدم استخداماً حتى يعود الحجم تحت الحد
+    if not os.path.isdir(EXPORT_CACHE_DIR):
+        return
+
+    with _jobs_lock:
+        in_use = {job['path'] for job in _jobs.values() if job['status'] == 'running'}
+
+    now = time.time()
+    entries = []
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        path = os.path.join(EXPORT_CACHE_DIR, name)
+        if path in in_use or name.endswith(".tmp"):
+            continue
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if now - stat.st_mtime > EXPORT_CACHE_MAX_AGE_HOURS * 3600:
+            os.remove(path)
+        else:
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= EXPORT_CACHE_MAX_BYTES:
+            break
+        os.remove(path)
+        total_size -= size
+
+def _run_export_job(job_id):
+    # تعديل قواميس المهام يتم تحت القفل لأن صفحات المستخدمين تقرأها من خيوط أخرى
+    with _jobs_lock:
+        job = _jobs[job_id]
+        tmp_path = job['path'] + ".tmp"
+
+    def progress(rows):
+        with _jobs_lock:
+            job['rows'] = rows
+            if job['expected_rows']:
+                job['progress'] = min(rows / job['expected_rows'], 1.0)
+
+    try:
+        # أي خطأ في الاستعلام يُرفع من مُولد الدفعات، فلا يُنقل ملف ناقص إلى الذاكرة المؤقتة
+        EXPORT_WRITERS[job['format']](job['survey_id'], tmp_path, progress=progress)
+        os.replace(tmp_path, job['path'])
+        with _jobs_lock:
+            job['progress'] = 1.0
+            job['status'] = 'done'
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with _jobs_lock:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+    finally:
+        with _jobs_lock:
+            job['finished_at'] = time.time()
+        evict_export_cache()
+
+def submit_export_job(user_id, survey_id, survey_name, export_format):
+    version = get_survey_export_version(survey_id)
+    if version is None:
+        return None
+
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    path = _cache_path(survey_id, version, export_format)
+
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'user_id': user_id,
+        'survey_id': survey_id,
+        'survey_name': survey_name,
+        'format': export_format,
+        'filename': export_filename(survey_name, export_format),
+        'path': path,
+        'expected_rows': version[2],
+        'rows': 0,
+        'progress': 0.0,
+        'status': 'running',
+        'error': None,
+        'created_at': time.time(),
+        'finished_at': None,
+    }
+
+    with _jobs_lock:
+        # البيانات لم تتغير منذ آخر تصدير: الملف جاهز فوراً
+        if os.path.exists(path):
+            os.utime(path)
+            job.update(status='done', progress=1.0, rows=version[2], finished_at=time.time())
+            _jobs[job['job_id']] = job
+            return job['job_id']
+
+        # نفس التصدير قيد التنفيذ لمستخدم آخر: ننتظر نفس الملف بدلاً من تكراره
+        running = next((j for j in _jobs.values() if j['path'] == path and j['status'] == 'running'), None)
+        _jobs[job['job_id']] = job
+        if running:
+            job['shared_with'] = running['job_id']
+            return job['job_id']
+
+    _executor.submit(_run_export_job, job['job_id'])
+    return job['job_id']
+
+def get_user_export_jobs(user_id):
+    with _jobs_lock:
+        jobs = [j for j in _jobs.values() if j['user_id'] == user_id]
+
+        for job in jobs:
+            source = _jobs.get(job.get('shared_with'))
+            if source:
+                job.update(status=source['status'], progress=source['progress'],
+                           rows=source['rows'], error=source['error'],
+                           finished_at=source['finished_at'])
+            # ملف أزيل من الذاكرة المؤقتة بعد انتهاء المهمة
+            if job['status'] == 'done' and not os.path.exists(job['path']):
+                job['status'] = 'expired'
+
+        # نسخ حتى لا تقرأ الصفحة قاموساً يعدله خيط التصدير أثناء العرض
+        jobs = [dict(job) for job in jobs]
+
+    return sorted(jobs, key=lambda j: j['created_at'], reverse=True)
+
+def remove_export_job(job_id):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
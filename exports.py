@@ -0,0 +1,98 @@
+import os
+import re
+import tempfile
+from datetime import datetime
+import pandas as pd
+from database import iter_survey_export_batches
+
+# أعمدة ملف التصدير بالترتيب الذي يُرجعه الاستعلام
+EXPORT_COLUMNS = {
+    "RESPONSE_ID": "ID الإجابة",
+    "USERNAME": "أدخلها",
+    "ADMIN_NAME": "الإدارة الصحية",
+    "GOVERNORATE_NAME": "المحافظة",
+    "SUBMISSION_DATE": "تاريخ الإدخال",
+    "STATUS": "حالة الإجابة",
+    "FIELD_LABEL": "الحقل",
+    "ANSWER_VALUE": "القيمة",
+}
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+def export_filename(survey_name, export_format):
+    _, extension = EXPORT_FORMATS[export_format]
+    return re.sub(r'[^\w\-_]', '_', survey_name) + "_كامل_" + datetime.now().strftime("%Y%m%d_%H%M") + extension
+
+def _prepare_batch(batch):
+    batch = batch[list(EXPORT_COLUMNS)].rename(columns=EXPORT_COLUMNS)
+    batch["القيمة"] = batch["القيمة"].astype("string")
+    return batch
+
+def write_survey_csv(survey_id, path, progress=None):
+    # UTF-8 مع BOM حتى يتعرف Excel على النص العربي
+    rows = 0
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        header = True
+        for batch in iter_survey_export_batches(survey_id):
+            batch = _prepare_batch(batch)
+            batch.to_csv(f, header=header, index=False)
+            header = False
+            rows += len(batch)
+            if progress:
+                progress(rows)
+        if header:
+            f.write(",".join(EXPORT_COLUMNS.values()) + "\n")
+    return rows
+
+def write_survey_parquet(survey_id, path, progress=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("ID الإجابة", pa.int64()),
+        ("أدخلها", pa.string()),
+        ("الإدارة الصحية", pa.string()),
+        ("المحافظة", pa.string()),
+        ("تاريخ الإدخال", pa.timestamp("us")),
+        ("حالة الإجابة", pa.string()),
+        ("الحقل", pa.string()),
+        ("القيمة", pa.string()),
+    ])
+
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in iter_survey_export_batches(survey_id):
+            batch = _prepare_batch(batch)
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+            rows += len(batch)
+            if progress:
+                progress(rows)
+    return rows
+
+def survey_details_frame(survey_id, response_ids):
+    # تفاصيل الإجابات المحددة من استعلام التصدير الواحد بدلاً من استعلام لكل إجابة
+    response_ids = set(response_ids)
+    frames = [
+        batch[batch["RESPONSE_ID"].isin(response_ids)]
+        for batch in iter_survey_export_batches(survey_id)
+    ]
+    frames = [_prepare_batch(frame) for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=list(EXPORT_COLUMNS.values()))
+    return pd.concat(frames, ignore_index=True)
+
+EXPORT_WRITERS = {
+    "csv": write_survey_csv,
+    "parquet": write_survey_parquet,
+}
+
+def export_survey_data(survey_id, survey_name, export_format):
+    # الكتابة تتم دفعةً دفعة إلى ملف مؤقت على القرص، فلا تتجاوز الذاكرة حجم دفعة واحدة
+    filename = export_filename(survey_name, export_format)
+    fd, path = tempfile.mkstemp(suffix=EXPORT_FORMATS[export_format][1])
+    os.close(fd)
+    rows = EXPORT_WRITERS[export_format](survey_id, path)
+    return path, filename, rows
@@ -1,14 +1,17 @@
 import streamlit as st
 import pandas as pd
-import json
+import numpy as np
 from database import (
     get_governorate_admin_data, get_governorate_surveys,
     get_governorate_employees, update_survey_status,
-    get_survey_fields, update_user_region,
+    update_user_region,
     get_user_allowed_surveys, update_user_allowed_surveys,
-    get_response_info, get_response_details,
-    update_response_detail, get_governorate_responses
+    get_response_info_async, get_response_details_async, run_concurrently,
+    update_response_details, get_governorate_responses,
+    get_survey_response_stats, get_health_admins, bulk_update_survey_access, get_survey_info
 )
+from survey_plans import get_survey_plan, compile_field
+from admin_views import RESPONSE_STATUS_LABELS, reset_page, page_input, clamp_page
 
 def show_governorate_admin_dashboard():
     if st.session_state.get('role') != 'governorate_admin':
@@ -55,23 +58,55 @@ def manage_governorate_surveys(governorate_id, governorate_name):
         st.info("لا توجد استبيانات لهذه المحافظة")
         return
     
-    df = pd.DataFrame(survey[1:] for survey in surveys)
-    df.columns = ["اسم الاستبيان", "تاريخ الإنشاء", "الحالة"]
+    df = pd.DataFrame(
+        [tuple(survey[1:]) for survey in surveys],
+        columns=["اسم الاستبيان", "تاريخ الإنشاء", "الحالة"]
+    )
     df["الحالة"] = df["الحالة"].apply(lambda x: "مفعل" if x else "غير مفعل")
 
     st.dataframe(df, use_container_width=True)
     
-    selected_survey = st.selectbox(
+    # الخيارات معرفات الاستبيانات: Streamlit يحول قائمة صفوف Snowpark إلى جدول ويأخذ عمودها الأول
+    surveys_by_id = {s[0]: s for s in surveys}
+    survey_id = st.selectbox(
         "اختر استبيان للتحكم",
-        surveys,
-        format_func=lambda x: x[1]
+        options=list(surveys_by_id),
+        format_func=lambda x: surveys_by_id[x][1]
     )
-    
-    survey_id = selected_survey[0]
+    selected_survey = surveys_by_id[survey_id]
     
     if st.button("تعديل حالة الاستبيان", key=f"edit_{survey_id}"):
         st.session_state.editing_survey = survey_id
         st.rerun()
+    
+    with st.expander("إتاحة الاستبيان لمجموعة موظفين"):
+        bulk_survey_access_form(selected_survey, governorate_id, governorate_name)
+
+def bulk_survey_access_form(survey, governorate_id, governorate_name):
+    survey_id, survey_name = survey[0], survey[1]
+    health_admins = get_health_admins(governorate_id)
+    
+    with st.form(f"bulk_access_{survey_id}"):
+        scope = st.selectbox(
+            "النطاق",
+            options=[None] + [a[0] for a in health_admins],
+            format_func=lambda x: f"جميع موظفي محافظة {governorate_name}" if x is None
+                else next(a[1] for a in health_admins if a[0] == x)
+        )
+        action = st.radio(
+            "الإجراء",
+            ["grant", "revoke"],
+            format_func=lambda x: "منح الاستبيان" if x == "grant" else "سحب الاستبيان",
+            horizontal=True
+        )
+        
+        if st.form_submit_button("تنفيذ"):
+            affected = bulk_update_survey_access(
+                survey_id, action == "grant", governorate_id=governorate_id, health_admin_id=scope
+            )
+            if affected is not None:
+                verb = "منح" if action == "grant" else "سحب"
+                st.success(f"تم {verb} استبيان '{survey_name}' لعدد {affected} موظف")
 
 def edit_governorate_survey(survey_id, governorate_id):
     st.subheader("تعديل حالة الاستبيان")
@@ -84,7 +119,7 @@ def edit_governorate_survey(survey_id, governorate_id):
     
     with st.form(f"edit_survey_{survey_id}"):
         st.text_input("اسم الاستبيان", value=survey[0], disabled=True)
-        is_active = st.checkbox("مفعل", value=bool(survey[1]))
+        is_active = st.checkbox("مفعل", value=bool(survey[2]))
         
         st.info("ملاحظة: مسؤول المحافظة يمكنه فقط تغيير حالة تفعيل الاستبيان")
         
@@ -112,15 +147,16 @@ def view_governorate_data(governorate_id, governorate_name):
         st.info("لا توجد استبيانات لعرض البيانات")
         return
     
-    selected_survey = st.selectbox(
+    surveys_by_id = {s[0]: s for s in surveys}
+    selected_survey_id = st.selectbox(
         "اختر استبيان",
-        surveys,
-        format_func=lambda x: x[1],
+        options=list(surveys_by_id),
+        format_func=lambda x: surveys_by_id[x][1],
         key="survey_select"
     )
     
-    if selected_survey:
-        view_survey_responses(selected_survey[0], governorate_id)
+    if selected_survey_id:
+        view_survey_responses(selected_survey_id, governorate_id)
 
 def view_survey_responses(survey_id, governorate_id):
     survey = get_survey_info(survey_id)
@@ -130,36 +166,80 @@ def view_survey_responses(survey_id, governorate_id):
         
     st.subheader(f"إجابات استبيان {survey[0]}")
     
-    responses = get_governorate_responses(survey_id, governorate_id)
+    stats = get_survey_response_stats(survey_id, governorate_id)
+    total = stats['total']
+    completed = stats['completed']
     
-    if not responses:
+    if not total:
         st.info("لا توجد إجابات مسجلة لهذا الاستبيان في محافظتك")
         return
     
-    total = len(responses)
-    completed = sum(1 for r in responses if r[4])
-    
     col1, col2, col3 = st.columns(3)
     col1.metric("إجمالي الإجابات", total)
     col2.metric("الإجابات المكتملة", completed)
-    col3.metric("نسبة الإكمال", f"{round((completed/total)*100)}%")
+    col3.metric("نسبة الإكمال", f"{round((completed/total)*100) if total else 0}%")
     
-    df = pd.DataFrame(
-        [(r[0], r[1], r[2], r[3], "✔️" if r[4] else "✖️") for r in responses],
-        columns=["ID", "المستخدم", "الإدارة الصحية", "التاريخ", "الحالة"]
+    # عوامل التصفية (تُطبق في قاعدة البيانات)
+    health_admins = get_health_admins(governorate_id)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        date_range = st.date_input("الفترة", value=(), key=f"responses_filter_dates_{survey_id}")
+    with col2:
+        admin_filter = st.selectbox(
+            "الإدارة الصحية",
+            options=[None] + [a[0] for a in health_admins],
+            format_func=lambda x: "الكل" if x is None else next(a[1] for a in health_admins if a[0] == x),
+            key=f"responses_filter_admin_{survey_id}"
+        )
+    with col3:
+        username_filter = st.text_input("المستخدم", key=f"responses_filter_user_{survey_id}")
+    with col4:
+        status_filter = st.selectbox(
+            "الحالة",
+            options=list(RESPONSE_STATUS_LABELS),
+            format_func=RESPONSE_STATUS_LABELS.get,
+            key=f"responses_filter_status_{survey_id}"
+        )
+    start_date, end_date = (date_range + (None, None))[:2] if isinstance(date_range, tuple) else (date_range, None)
+    
+    responses = get_governorate_responses(
+        survey_id, governorate_id,
+        health_admin_id=admin_filter,
+        username=username_filter,
+        start_date=start_date,
+        end_date=end_date,
+        is_completed=status_filter
     )
     
+    st.caption(f"الإجابات المطابقة: {len(responses)}")
+    if responses.empty:
+        st.info("لا توجد إجابات مطابقة لعوامل التصفية")
+        return
+    
+    # بناء الجدول عموداً بعمود دون المرور على الصفوف
+    df = pd.DataFrame({
+        "ID": responses["RESPONSE_ID"],
+        "المستخدم": responses["USERNAME"],
+        "الإدارة الصحية": responses["ADMIN_NAME"],
+        "التاريخ": responses["SUBMISSION_DATE"],
+        "الحالة": np.where(responses["IS_COMPLETED"], "✔️", "✖️")
+    })
+    
     st.dataframe(df, use_container_width=True)
     
     selected_response_id = st.selectbox(
         "اختر إجابة لعرض وتعديل تفاصيلها",
-        options=[r[0] for r in responses],
+        options=responses["RESPONSE_ID"].tolist(),
         format_func=lambda x: f"إجابة #{x}",
         key=f"response_select_{survey_id}_{governorate_id}"
     )
 
     if selected_response_id:
-        response_info = get_response_info(selected_response_id)
+        # جلب معلومات الإجابة وتفاصيلها باستعلامين متزامنين
+        response_info, details = run_concurrently(
+            get_response_info_async(selected_response_id),
+            get_response_details_async(selected_response_id)
+        )
         if response_info:
             st.subheader(f"تفاصيل الإجابة #{selected_response_id}")
             st.markdown(f"""
@@ -169,8 +249,14 @@ def view_survey_responses(survey_id, governorate_id):
             **المحافظة:** {response_info[4]}  
             **تاريخ التقديم:** {response_info[5]}
             """)
-            
-            details = get_response_details(selected_response_id)
+
+            # الإجابات المؤرشفة للقراءة فقط: التعديل عليها لا يُحفظ
+            if response_info[8]:
+                st.info("هذه الإجابة مؤرشفة ولا يمكن تعديلها")
+                st.table(pd.DataFrame({"الحقل": [d[2] for d in details], "القيمة": [d[5] for d in details]}))
+                return
+
+            plan = get_survey_plan(survey_id, response_info[7])
             updates = {}
             
             with st.form(key=f"edit_response_{survey_id}_{governorate_id}_{selected_response_id}"):
@@ -182,11 +268,11 @@ def view_survey_responses(survey_id, governorate_id):
                         st.markdown(f"**{label}**")
                     with col2:
                         if field_type == 'dropdown':
-                            options_list = json.loads(options) if options else []
+                            field = plan.by_id.get(field_id) or compile_field((field_id, label, field_type, options, False, 0))
                             new_value = st.selectbox(
                                 f"تعديل {label}",
-                                options_list,
-                                index=options_list.index(answer) if answer in options_list else 0,
+                                field.options,
+                                index=field.option_index.get(answer, 0),
                                 key=f"edit_dropdown_{detail_id}_{selected_response_id}"
                             )
                         else:
@@ -203,10 +289,8 @@ def view_survey_responses(survey_id, governorate_id):
                 with col1:
                     if st.form_submit_button("💾 حفظ جميع التعديلات"):
                         if updates:
-                            success_count = 0
-                            for detail_id, new_value in updates.items():
-                                if update_response_detail(detail_id, new_value):
-                                    success_count += 1
+                            results = update_response_details(selected_response_id, updates)
+                            success_count = sum(1 for ok in results.values() if ok)
                             
                             if success_count == len(updates):
                                 st.success("تم تحديث جميع التعديلات بنجاح")
@@ -222,27 +306,72 @@ def view_survey_responses(survey_id, governorate_id):
 def manage_governorate_employees(governorate_id, governorate_name):
     st.header(f"إدارة موظفي محافظة {governorate_name}")
     
-    employees = get_governorate_employees(governorate_id)
+    # عوامل التصفية والترقيم (تُطبق في قاعدة البيانات)
+    health_admins = get_health_admins(governorate_id)
+    col1, col2 = st.columns(2)
+    with col1:
+        username_filter = st.text_input(
+            "بحث باسم المستخدم", key="employees_filter_username", on_change=reset_page, args=("employees_page",)
+        )
+    with col2:
+        admin_filter = st.selectbox(
+            "الإدارة الصحية",
+            options=[None] + [a[0] for a in health_admins],
+            format_func=lambda x: "الكل" if x is None else next(a[1] for a in health_admins if a[0] == x),
+            key="employees_filter_admin",
+            on_change=reset_page,
+            args=("employees_page",)
+        )
+    
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page_size = st.selectbox(
+            "عدد الصفوف", [25, 50, 100], index=1, key="employees_page_size",
+            on_change=reset_page, args=("employees_page",)
+        )
+    with col2:
+        page = page_input("employees_page")
+    
+    employees, total = get_governorate_employees(
+        governorate_id,
+        page=page,
+        page_size=page_size,
+        username=username_filter,
+        health_admin_id=admin_filter
+    )
     
-    if not employees:
-        st.info("لا يوجد موظفون مسجلون لهذه المحافظة")
-        return
+    total_pages = max(1, -(-total // page_size))
+    clamp_page("employees_page", page, total_pages)
+    st.caption(f"إجمالي الموظفين: {total} — الصفحة {page} من {total_pages}")
     
-    for emp in employees:
-        user_id, username, admin_name = emp
+    if not employees:
+        st.info("لا يوجد موظفون مطابقون")
+    else:
+        df = pd.DataFrame(employees)
+        df.insert(0, "select", False)
+        df["last_submission"] = pd.to_datetime(df["last_submission"])
         
-        with st.expander(f"{username} - {admin_name}"):
-            col1, col2 = st.columns([4, 1])
-            
-            with col1:
-                st.markdown(f"""
-                **اسم المستخدم:** {username}  
-                **الإدارة الصحية:** {admin_name}
-                """)
-            
-            with col2:
-                if st.button("تعديل", key=f"edit_btn_{user_id}"):
-                    st.session_state.editing_employee = user_id
+        edited = st.data_editor(
+            df,
+            column_config={
+                "select": st.column_config.CheckboxColumn("تحديد"),
+                "user_id": None,
+                "username": "اسم المستخدم",
+                "admin_name": "الإدارة الصحية",
+                "last_submission": st.column_config.DatetimeColumn("آخر إرسال", format="YYYY-MM-DD HH:mm"),
+                "completed_7d": st.column_config.NumberColumn("مكتملة (7 أيام)"),
+                "completed_30d": st.column_config.NumberColumn("مكتملة (30 يوماً)"),
+                "allowed_surveys": st.column_config.NumberColumn("الاستبيانات المسموحة")
+            },
+            disabled=["username", "admin_name", "last_submission", "completed_7d", "completed_30d", "allowed_surveys"],
+            hide_index=True,
+            use_container_width=True,
+            key=f"employees_grid_{page}_{page_size}"
+        )
+        selected_ids = edited.loc[edited["select"], "user_id"].tolist()
+        
+        if st.button("تعديل المحدد", key="edit_selected_employee", disabled=len(selected_ids) != 1):
+            st.session_state.editing_employee = selected_ids[0]
     
     if 'editing_employee' in st.session_state:
         edit_employee(st.session_state.editing_employee, governorate_id)
@@ -274,6 +403,7 @@ def edit_employee(user_id, governorate_id):
             options=[a[0] for a in health_admins],
             index=[a[0] for a in health_admins].index(employee[1]) if health_admins else 0,
             format_func=lambda x: next(a[1] for a in health_admins if a[0] == x)
+        )
         
         if surveys:
             selected_surveys = st.multiselect(
@@ -281,6 +411,7 @@ def edit_employee(user_id, governorate_id):
                 options=[s[0] for s in surveys],
                 default=valid_allowed_survey_ids,
                 format_func=lambda x: next(s[1] for s in surveys if s[0] == x)
+            )
         else:
             st.info("لا توجد استبيانات متاحة لهذه المحافظة")
             selected_surveys = []
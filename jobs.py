@@ -0,0 +1,93 @@
+import sys
+import logging
+import argparse
+from snowflake.snowpark.exceptions import SnowparkSQLException
+from database import (
+    init_db, refresh_response_rollups, archive_audit_logs, archive_responses, migrate_response_details_to_documents,
+    cluster_responses_table
+)
+from submission_queue import flush_submissions, get_submission_queue_stats
+
+# المهام المجدولة (تُشغَّل من cron أو Snowflake Task خارجي).
+# كل مهمة تُرجع رمز الخروج؛ أخطاء Snowflake تُرفع من دوال المهام فتنتهي العملية برمز 1
+def run_init_db(args):
+    if not init_db():
+        return 1
+    print("تم إنشاء الجداول وتطبيق الترحيلات")
+
+def run_refresh_rollups(args):
+    processed = refresh_response_rollups(settle_seconds=args.settle_seconds, reconcile_seconds=args.reconcile_seconds)
+    print(f"تم تجميع {processed} إجابة جديدة")
+
+def run_archive_audit(args):
+    archived = archive_audit_logs(retention_days=args.retention_days)
+    print(f"تم نقل {archived} سجل إلى الأرشيف")
+
+def run_archive_responses(args):
+    archived = archive_responses(retention_days=args.retention_days, batch_size=args.batch_size)
+    print(f"تم نقل {archived} إجابة إلى الأرشيف")
+
+def run_migrate_responses(args):
+    migrated = migrate_response_details_to_documents(batch_size=args.batch_size)
+    print(f"تم ترحيل {migrated} إجابة إلى عمود ANSWERS")
+
+def run_cluster_responses(args):
+    cluster_responses_table()
+    print("تم ضبط مفتاح تجميع جدول الإجابات")
+
+def run_flush_submissions(args):
+    delivered = 0
+    while True:
+        batch = flush_submissions()
+        delivered += batch
+        if not batch:
+            break
+    print(f"تم تسليم {delivered} إرسال من السجل المحلي")
+    # الدفعات التي فشل تسليمها تبقى في السجل لإعادة المحاولة لاحقاً
+    remaining = get_submission_queue_stats()
+    if remaining['pending'] or remaining['failed']:
+        print(f"لم يُسلَّم {remaining['pending']} إرسال، وفشل {remaining['failed']} نهائياً", file=sys.stderr)
+        return 1
+
+def main():
+    parser = argparse.ArgumentParser(description="مهام نظام إدارة الاستبيانات")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    init = subparsers.add_parser("init-db", help="إنشاء الجداول وتطبيق الترحيلات (قبل نشر نسخة جديدة)")
+    init.set_defaults(func=run_init_db)
+
+    rollups = subparsers.add_parser("refresh-rollups", help="تحديث جداول تجميع الإجابات")
+    rollups.add_argument("--settle-seconds", type=int, default=60)
+    rollups.add_argument("--reconcile-seconds", type=int, default=3600)
+    rollups.set_defaults(func=run_refresh_rollups)
+
+    audit = subparsers.add_parser("archive-audit", help="أرشفة سجل التعديلات القديم")
+    audit.add_argument("--retention-days", type=int, default=365)
+    audit.set_defaults(func=run_archive_audit)
+
+    submissions = subparsers.add_parser("flush-submissions", help="تسليم سجل الإرسال المحلي إلى Snowflake")
+    submissions.set_defaults(func=run_flush_submissions)
+
+    responses = subparsers.add_parser("archive-responses", help="أرشفة المسودات المكتملة لاحقاً والإجابات القديمة")
+    responses.add_argument("--retention-days", type=int, default=365)
+    responses.add_argument("--batch-size", type=int, default=10000)
+    responses.set_defaults(func=run_archive_responses)
+
+    migrate = subparsers.add_parser("migrate-responses", help="ترحيل تفاصيل الإجابات إلى وضع document")
+    migrate.add_argument("--batch-size", type=int, default=1000)
+    migrate.set_defaults(func=run_migrate_responses)
+
+    cluster = subparsers.add_parser("cluster-responses", help="ضبط مفتاح تجميع جدول الإجابات (مرة واحدة)")
+    cluster.set_defaults(func=run_cluster_responses)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        sys.exit(args.func(args) or 0)
+    except (SnowparkSQLException, RuntimeError) as e:
+        # التفاصيل سُجلت في دالة المهمة؛ رمز الخروج يُبلغ cron بالفشل
+        print(f"فشلت المهمة {args.command}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
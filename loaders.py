@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# تجميع الاستعلامات النقطية (على نمط DataLoader): كل الطلبات لنفس النوع التي تُسجل في نفس
+# دورة حلقة asyncio، مع المفاتيح المؤجلة بـ defer في نفس التشغيل، تُحل باستعلام واحد WHERE ... IN،
+# والنتائج تُحفظ حتى نهاية تشغيل السكربت
+LOADER_MAX_BATCH_SIZE = 1000
+
+_SCOPE_KEY = "_batch_loader_scope"
+
+def begin_request():
+    # يُستدعى في بداية كل تشغيل كامل للسكربت (app.main) فتبدأ النتائج المحفوظة من جديد.
+    # إعادة تشغيل جزء (fragment) تستخدم نطاق آخر تشغيل كامل، والكتابات تمسح مفاتيحها بـ clear()
+    st.session_state[_SCOPE_KEY] = {}
+
+def _request_scope(name):
+    if get_script_run_ctx(suppress_warning=True) is None:
+        # خيوط الخلفية ليست جزءاً من طلب: تجميع بلا حفظ للنتائج
+        return None
+    scope = st.session_state.get(_SCOPE_KEY)
+    if scope is None:
+        return None
+    return scope.setdefault(name, {'memo': {}, 'deferred': set()})
+
+class BatchLoader:
+    # batch_fn دالة غير متزامنة تستقبل قائمة معرفات وتُرجع قاموساً {المعرف: القيمة}؛
+    # المعرفات غير الموجودة تُرجع None ولا تُحفظ
+    def __init__(self, name, batch_fn, max_batch_size=LOADER_MAX_BATCH_SIZE):
+        self.name = name
+        self._batch_fn = batch_fn
+        self._max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    async def load(self, key):
+        scope = _request_scope(self.name)
+        if scope is not None and key in scope['memo']:
+            return scope['memo'][key]
+
+        # المفاتيح المؤجلة في هذا التشغيل تنضم إلى نفس الدفعة. هذا ما يجمع الاستدعاءات المتزامنة
+        # (get_survey_info وغيرها) التي تُنفذ كل منها في حلقة asyncio جديدة عبر run_sync
+        deferred = []
+        if scope is not None:
+            deferred = [k for k in scope['deferred'] if k != key and k not in scope['memo']]
+            scope['deferred'].clear()
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            batch = self._pending.get(loop)
+            if batch is None:
+                # التنفيذ مؤجل إلى الدورة التالية حتى تنضم بقية الطلبات المتزامنة
+                batch = self._pending[loop] = {}
+                loop.call_soon(self._dispatch, loop)
+            future = self._future(batch, key, loop)
+            deferred_futures = {k: self._future(batch, k, loop) for k in deferred}
+
+        try:
+            value = await asyncio.shield(future)
+        finally:
+            for k, deferred_future in deferred_futures.items():
+                if not deferred_future.done() or deferred_future.cancelled():
+                    continue
+                if deferred_future.exception() is None and scope is not None:
+                    self._remember(scope, k, deferred_future.result())
+        if scope is not None:
+            self._remember(scope, key, value)
+        return value
+
+    async def load_many(self, keys):
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def defer(self, keys):
+        # تسجيل مفاتيح معروفة مسبقاً ستُطلب لاحقاً في هذا التشغيل؛ أول load يجلبها كلها معاً
+        scope = _request_scope(self.name)
+        if scope is not None:
+            scope['deferred'].update(key for key in keys if key not in scope['memo'])
+
+    def prime(self, key, value):
+        scope = _request_scope(self.name)
+        if scope is not None:
+            self._remember(scope, key, value)
+
+    def clear(self, key):
+        # بعد تعديل السجل حتى لا تُقرأ قيمته القديمة في بقية التشغيل
+        scope = _request_scope(self.name)
+        if scope is not None:
+            scope['memo'].pop(key, None)
+
+    @staticmethod
+    def _remember(scope, key, value):
+        if value is not None:
+            scope['memo'][key] = value
+
+    @staticmethod
+    def _future(batch, key, loop):
+        future = batch.get(key)
+        if future is None:
+            future = batch[key] = loop.create_future()
+        return future
+
+    def _dispatch(self, loop):
+        with self._lock:
+            batch = self._pending.pop(loop, {})
+        keys = list(batch)
+        for i in range(0, len(keys), self._max_batch_size):
+            chunk = {key: batch[key] for key in keys[i:i + self._max_batch_size]}
+            loop.create_task(self._resolve(chunk))
+
+    async def _resolve(self, batch):
+        try:
+            values = await self._batch_fn(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(values.get(key))
@@ -0,0 +1,672 @@
+import os
+import re
+import json
+import time
+import logging
+import random
+import argparse
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# سجل الإرسال المحلي لاختبار الحمل في مجلد مؤقت حتى لا يختلط بسجل التطبيق الفعلي
+os.environ.setdefault(
+    "SUBMISSION_JOURNAL_PATH",
+    os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "submissions_journal.db")
+)
+
+import pandas as pd
+import streamlit
+from snowflake.snowpark import Row
+from streamlit.testing.v1 import AppTest
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import database
+from auth import hash_password
+from submission_queue import get_submission_queue_stats
+
+# اختبار الحمل: موظفون ومسؤولو محافظات افتراضيون يشغّلون التطبيق الفعلي (app.py) عبر AppTest
+# مقابل بديل محلي لـ Snowflake ببيانات مولّدة وزمن استجابة قابل للضبط
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+ACTOR_KEY = "_loadtest_actor"
+BACKGROUND_ACTOR = "background"
+LOADTEST_PASSWORD = "loadtest"
+FIELD_TYPES = ["text", "number", "dropdown", "checkbox", "date"]
+PERCENTILES = (50, 95, 99)
+# concurrent_apptest يعتمد على تفاصيل داخلية في Streamlit (Runtime._instance) جُربت على هذا الإصدار
+STREAMLIT_TESTED_VERSION = "1.66"
+
+# تحذيرات Streamlit عن الخيوط الخلفية والخيارات المهجورة تغرق التقرير
+logging.disable(logging.WARNING)
+
+def named_row(columns, values):
+    # صفوف بأسماء أعمدة مثل نتائج Snowflake الفعلية
+    return Row(**dict(zip(columns.split(), values)))
+
+USER_COLUMNS = "USER_ID USERNAME PASSWORD_HASH ROLE ASSIGNED_REGION CREATED_AT LAST_LOGIN LAST_ACTIVITY"
+FIELD_COLUMNS = "FIELD_ID FIELD_LABEL FIELD_TYPE FIELD_OPTIONS IS_REQUIRED FIELD_ORDER"
+
+class StandInData:
+    def __init__(self, employees, gov_admins, governorates=4, admins_per_governorate=5, surveys=6,
+                 fields_per_survey=12, surveys_per_employee=3, responses_per_survey=500, seed=1):
+        rng = random.Random(seed)
+        now = datetime.now()
+
+        self.governorates = {g: (g, f"محافظة {g}", f"وصف محافظة {g}") for g in range(1, governorates + 1)}
+        self.health_admins = {}
+        for g in self.governorates:
+            for i in range(admins_per_governorate):
+                admin_id = len(self.health_admins) + 1
+                self.health_admins[admin_id] = (admin_id, f"إدارة {admin_id}", g)
+
+        self.surveys = {s: (s, f"استبيان {s}", now - timedelta(days=30), True, 1) for s in range(1, surveys + 1)}
+        self.fields = {}
+        for s in self.surveys:
+            self.fields[s] = []
+            for i in range(fields_per_survey):
+                field_type = FIELD_TYPES[i % len(FIELD_TYPES)]
+                options = json.dumps(["أ", "ب", "ج"], ensure_ascii=False) if field_type == 'dropdown' else None
+                self.fields[s].append((s * 1000 + i, f"حقل {i + 1}", field_type, options, i % 3 == 0, i + 1))
+
+        password_hash = hash_password(LOADTEST_PASSWORD)
+        self.users = {}
+        self.user_surveys = {}
+        self.user_governorate = {}
+        for i in range(1, employees + 1):
+            region = rng.choice(list(self.health_admins))
+            self._add_user(f"emp{i}", password_hash, "employee", region, now)
+            self.user_surveys[self.users[f"emp{i}"][0]] = rng.sample(list(self.surveys), surveys_per_employee)
+        for i in range(1, gov_admins + 1):
+            self._add_user(f"gov{i}", password_hash, "governorate_admin", None, now)
+            self.user_governorate[self.users[f"gov{i}"][0]] = (i - 1) % governorates + 1
+        self.users_by_id = {user[0]: user for user in self.users.values()}
+
+        employee_ids = [user[0] for user in self.users.values() if user[3] == "employee"] or [0]
+        self.responses = {}
+        for s in self.surveys:
+            for i in range(responses_per_survey):
+                response_id = s * 100000 + i
+                region = rng.choice(list(self.health_admins))
+                self.responses[response_id] = (
+                    response_id, s, rng.choice(employee_ids), region,
+                    now - timedelta(minutes=rng.randint(0, 60 * 24 * 30)), rng.random() < 0.8
+                )
+
+    def _add_user(self, username, password_hash, role, region, now):
+        user_id = len(self.users) + 1
+        self.users[username] = (user_id, username, password_hash, role, region, now, None, None)
+
+    def username(self, user_id):
+        user = self.users_by_id.get(user_id)
+        return user[1] if user else "غير معروف"
+
+    def response_governorate(self, response):
+        return self.health_admins[response[3]][2]
+
+class StandInBackend:
+    # يطابق كل استعلام بنمط ثابت ويُرجع صفوفاً بنفس شكل نتائج Snowflake
+    def __init__(self, data, latency_ms=50, jitter_ms=20, max_concurrent_queries=0, seed=1):
+        self.data = data
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._slots = threading.BoundedSemaphore(max_concurrent_queries) if max_concurrent_queries else None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._current = threading.local()
+        self.query_counts = defaultdict(int)
+        self.unmatched = defaultdict(int)
+        self.handlers = [(re.compile(pattern), handler) for pattern, handler in [
+            (r"^(CREATE|ALTER|BEGIN|COMMIT|ROLLBACK)\b", self._empty),
+            (r"^MERGE INTO ENTITY_VERSIONS", self._empty),
+            (r"^MERGE INTO ARCHIVE_STATE", self._empty),
+            (r"^SELECT ARCHIVED_BEFORE FROM ARCHIVE_STATE", lambda p: [named_row("ARCHIVED_BEFORE", (None,))]),
+            (r"^SELECT COUNT\(\*\) FROM USERS WHERE ROLE='ADMIN'", lambda p: [named_row("COUNT", (1,))]),
+            (r"^SELECT ENTITY, VERSION FROM ENTITY_VERSIONS", self._entity_versions),
+            (r"^UPDATE ENTITY_VERSIONS", self._updated),
+            (r"^SELECT \* FROM USERS WHERE USERNAME=\?", self._user_by_username),
+            (r"^UPDATE USERS SET LAST_(LOGIN|ACTIVITY)", self._updated),
+            (r"^SELECT ROLE FROM USERS WHERE USER_ID=\?", self._user_role),
+            (r"^SELECT LAST_LOGIN FROM USERS", self._last_login),
+            (r"FROM HEALTH_ADMINISTRATIONS HA JOIN GOVERNORATES G .* WHERE HA.ADMIN_ID = \?", self._region_info),
+            (r"JOIN USER_SURVEYS US ON S.SURVEY_ID = US.SURVEY_ID WHERE US.USER_ID = \?", self._allowed_surveys),
+            (r"^SELECT SURVEY_NAME, CREATED_AT, IS_ACTIVE, CURRENT_VERSION, SURVEY_ID FROM SURVEYS", self._survey_info),
+            (r"^SELECT ADMIN_ID, ADMIN_NAME FROM HEALTH_ADMINISTRATIONS WHERE ADMIN_ID IN", self._health_admin_names),
+            (r"^SELECT USERNAME, ASSIGNED_REGION, USER_ID FROM USERS WHERE USER_ID IN", self._employee_details),
+            (r"FROM SURVEY_FIELDS WHERE SURVEY_ID = \?", self._survey_fields),
+            (r"^SELECT 1 FROM RESPONSES WHERE USER_ID = \?", self._empty),
+            (r"^INSERT INTO RESPONSES\b", self._payload_count),
+            (r"^MERGE INTO RESPONSES T\b", self._payload_count),
+            (r"^SELECT S.VALUE:KEY::VARCHAR FROM TABLE\(FLATTEN", self._empty),
+            (r"^INSERT INTO RESPONSE_DETAILS\b", self._payload_count),
+            (r"^INSERT INTO AUDIT_LOG\b", self._payload_count),
+            (r"^SELECT G.GOVERNORATE_ID, G.GOVERNORATE_NAME, G.DESCRIPTION FROM GOVERNORATE_ADMINS", self._governorate_admin_data),
+            (r"JOIN SURVEY_GOVERNORATE SG ON S.SURVEY_ID = SG.SURVEY_ID WHERE SG.GOVERNORATE_ID = \?", self._governorate_surveys),
+            (r"^SELECT ADMIN_ID, ADMIN_NAME FROM HEALTH_ADMINISTRATIONS WHERE GOVERNORATE_ID=\?", self._health_admins),
+            (r"^SELECT R.RESPONSE_ID, U.USERNAME, HA.ADMIN_NAME, R.SUBMISSION_DATE, R.IS_COMPLETED FROM RESPONSES", self._governorate_responses),
+            (r"FROM RESPONSE_ROLLUPS", self._response_stats),
+            (r"^WITH PAGE AS \( SELECT U.USER_ID, U.USERNAME, HA.ADMIN_NAME", self._governorate_employees),
+            (r"^SELECT R.RESPONSE_ID, S.SURVEY_NAME, U.USERNAME", self._response_info),
+            (r"FROM RESPONSE_DETAILS RD JOIN SURVEY_FIELDS SF", self._response_details),
+            (r"^MERGE INTO RESPONSE_DETAILS", self._payload_count),
+        ]]
+
+    def execute(self, query, params):
+        normalized = " ".join(query.split()).upper()
+        self._record(normalized)
+        if self._slots:
+            self._slots.acquire()
+        try:
+            time.sleep(max(self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000)
+        finally:
+            if self._slots:
+                self._slots.release()
+        # بعض المعالجات تحتاج نص الاستعلام لمعرفة عوامل التصفية الاختيارية الموجودة فيه
+        self._current.query = normalized
+        for pattern, handler in self.handlers:
+            if pattern.search(normalized):
+                return handler(params or ())
+        with self._lock:
+            self.unmatched[normalized[:120]] += 1
+        return []
+
+    def _record(self, normalized):
+        # نسب الاستعلام إلى المستخدم الافتراضي الذي يشغّل السكربت الحالي
+        ctx = get_script_run_ctx(suppress_warning=True)
+        actor = BACKGROUND_ACTOR
+        if ctx is not None:
+            try:
+                actor = ctx.session_state[ACTOR_KEY]
+            except KeyError:
+                pass
+        with self._lock:
+            self.query_counts[actor] += 1
+
+    def queries_for(self, actor):
+        with self._lock:
+            return self.query_counts[actor]
+
+    def _empty(self, params):
+        return []
+
+    def _updated(self, params):
+        return [named_row("number_of_rows_updated", (1,))]
+
+    def _payload_count(self, params):
+        count = len(json.loads(params[0])) if params else 1
+        return [named_row("number_of_rows_inserted", (count,))]
+
+    def _entity_versions(self, params):
+        return [named_row("ENTITY VERSION", (entity, 1)) for entity in database.ENTITIES]
+
+    def _user_by_username(self, params):
+        user = self.data.users.get(params[0])
+        return [named_row(USER_COLUMNS, user)] if user else []
+
+    def _user_role(self, params):
+        user = self.data.users_by_id.get(params[0])
+        return [named_row("ROLE", (user[3],))] if user else []
+
+    def _last_login(self, params):
+        return [named_row("LAST_LOGIN", (datetime.now() - timedelta(days=1),))]
+
+    def _region_info(self, params):
+        admin = self.data.health_admins.get(params[0])
+        if not admin:
+            return []
+        governorate = self.data.governorates[admin[2]]
+        return [named_row("ADMIN_ID ADMIN_NAME GOVERNORATE_ID GOVERNORATE_NAME",
+                          (admin[0], admin[1], governorate[0], governorate[1]))]
+
+    def _allowed_surveys(self, params):
+        return [named_row("SURVEY_ID SURVEY_NAME", (s, self.data.surveys[s][1]))
+                for s in self.data.user_surveys.get(params[0], [])]
+
+    def _survey_info(self, params):
+        return [named_row("SURVEY_NAME CREATED_AT IS_ACTIVE CURRENT_VERSION SURVEY_ID", survey[1:] + survey[:1])
+                for survey in (self.data.surveys.get(s) for s in json.loads(params[0])) if survey]
+
+    def _health_admin_names(self, params):
+        return [named_row("ADMIN_ID ADMIN_NAME", admin[:2])
+                for admin in (self.data.health_admins.get(a) for a in json.loads(params[0])) if admin]
+
+    def _employee_details(self, params):
+        return [named_row("USERNAME ASSIGNED_REGION USER_ID", (user[1], user[4], user[0]))
+                for user in (self.data.users_by_id.get(u) for u in json.loads(params[0])) if user]
+
+    def _survey_fields(self, params):
+        return [named_row(FIELD_COLUMNS, field) for field in self.data.fields.get(params[0], [])]
+
+    def _governorate_admin_data(self, params):
+        governorate_id = self.data.user_governorate.get(params[0])
+        if not governorate_id:
+            return []
+        return [named_row("GOVERNORATE_ID GOVERNORATE_NAME DESCRIPTION", self.data.governorates[governorate_id])]
+
+    def _governorate_surveys(self, params):
+        return [named_row("SURVEY_ID SURVEY_NAME CREATED_AT IS_ACTIVE", s[:4]) for s in self.data.surveys.values()]
+
+    def _health_admins(self, params):
+        return [named_row("ADMIN_ID ADMIN_NAME", a[:2]) for a in self.data.health_admins.values() if a[2] == params[0]]
+
+    def _scoped_responses(self, survey_id, governorate_id):
+        return [r for r in self.data.responses.values()
+                if r[1] == survey_id and self.data.response_governorate(r) == governorate_id]
+
+    def _governorate_responses(self, params):
+        # عوامل التصفية بنفس ترتيب شروطها في الاستعلام
+        filters = list(params[2:])
+        query = self._current.query
+        responses = self._scoped_responses(params[0], params[1])
+        if "R.REGION_ID = ?" in query:
+            region = filters.pop(0)
+            responses = [r for r in responses if r[3] == region]
+        if "U.USERNAME ILIKE" in query:
+            username = re.sub(r"!(.)", r"\1", filters.pop(0)[1:-1]).lower()
+            responses = [r for r in responses if username in self.data.username(r[2]).lower()]
+        if "R.SUBMISSION_DATE >= ?" in query:
+            start = filters.pop(0)
+            responses = [r for r in responses if r[4].date() >= start]
+        if "DATEADD(DAY, 1, ?::DATE)" in query:
+            end = filters.pop(0)
+            responses = [r for r in responses if r[4].date() <= end]
+        if "R.IS_COMPLETED = ?" in query:
+            completed = filters.pop(0)
+            responses = [r for r in responses if r[5] == completed]
+        responses = sorted(responses, key=lambda r: r[4], reverse=True)
+        return [named_row("RESPONSE_ID USERNAME ADMIN_NAME SUBMISSION_DATE IS_COMPLETED",
+                          (r[0], self.data.username(r[2]), self.data.health_admins[r[3]][1], r[4], r[5]))
+                for r in responses]
+
+    def _response_stats(self, params):
+        if len(params) > 3:
+            responses = self._scoped_responses(params[0], params[1])
+        else:
+            responses = [r for r in self.data.responses.values() if r[1] == params[0]]
+        completed = sum(1 for r in responses if r[5])
+        return [named_row("TOTAL COMPLETED DRAFTS REGIONS",
+                          (len(responses), completed, len(responses) - completed, len({r[3] for r in responses})))]
+
+    def _governorate_employees(self, params):
+        # المعاملات: المحافظة، ثم عوامل التصفية الاختيارية (نص للاسم، رقم للإدارة)، ثم LIMIT و OFFSET
+        filters = params[1:-2]
+        username = next((f for f in filters if isinstance(f, str)), None)
+        admin_id = next((f for f in filters if isinstance(f, int)), None)
+        employees = sorted(
+            (u for u in self.data.users.values()
+             if u[3] == "employee" and self.data.health_admins[u[4]][2] == params[0]
+             and (username is None or username.lower() in u[1].lower())
+             and (admin_id is None or u[4] == admin_id)),
+            key=lambda u: (u[1], u[0])
+        )
+        limit, offset = params[-2:]
+        since_7d, since_30d = datetime.now() - timedelta(days=7), datetime.now() - timedelta(days=30)
+        rows = []
+        for u in employees[offset:offset + limit]:
+            completed = [r[4] for r in self.data.responses.values() if r[2] == u[0] and r[5]]
+            rows.append(named_row(
+                "USER_ID USERNAME ADMIN_NAME LAST_SUBMISSION COMPLETED_7D COMPLETED_30D ALLOWED_SURVEYS TOTAL_COUNT",
+                (u[0], u[1], self.data.health_admins[u[4]][1], max(completed, default=None),
+                 sum(d >= since_7d for d in completed), sum(d >= since_30d for d in completed),
+                 len(self.data.user_surveys.get(u[0], [])), len(employees))
+            ))
+        return rows
+
+    def _response_info(self, params):
+        rows = []
+        for r in (self.data.responses.get(r) for r in json.loads(params[0])):
+            if r:
+                admin = self.data.health_admins[r[3]]
+                rows.append(named_row(
+                    "RESPONSE_ID SURVEY_NAME USERNAME ADMIN_NAME GOVERNORATE_NAME SUBMISSION_DATE SURVEY_ID SURVEY_VERSION "
+                    "IS_ARCHIVED",
+                    (r[0], self.data.surveys[r[1]][1], self.data.username(r[2]), admin[1],
+                     self.data.governorates[admin[2]][1], r[4], r[1], 1, False)
+                ))
+        return rows
+
+    def _response_details(self, params):
+        r = self.data.responses.get(params[0])
+        if not r:
+            return []
+        return [named_row("DETAIL_ID FIELD_ID FIELD_LABEL FIELD_TYPE FIELD_OPTIONS ANSWER_VALUE",
+                          (r[0] * 100 + i, f[0], f[1], f[2], f[3], "أ" if f[2] == 'dropdown' else f"قيمة {i}"))
+                for i, f in enumerate(self.data.fields[r[1]])]
+
+class StandInJob:
+    def __init__(self, backend, query, params):
+        self._rows = None
+        self._error = None
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(backend, query, params), daemon=True).start()
+
+    def _run(self, backend, query, params):
+        try:
+            self._rows = backend.execute(query, params)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def is_done(self):
+        return self._done.is_set()
+
+    def result(self):
+        self._done.wait()
+        if self._error:
+            raise self._error
+        return self._rows
+
+    def cancel(self):
+        pass
+
+class StandInQuery:
+    def __init__(self, backend, query, params):
+        self._backend = backend
+        self._query = query
+        self._params = params
+
+    def collect(self):
+        return self._backend.execute(self._query, self._params)
+
+    def collect_nowait(self):
+        return StandInJob(self._backend, self._query, self._params)
+
+    def to_pandas(self):
+        return pd.DataFrame([row.as_dict() for row in self.collect()])
+
+class StandInSession:
+    def __init__(self, backend):
+        self._backend = backend
+        self.query_tag = None
+
+    def sql(self, query, params=None):
+        return StandInQuery(self._backend, query, params)
+
+    def close(self):
+        pass
+
+@contextmanager
+def concurrent_apptest():
+    # AppTest يضبط حالة عامة لكل تشغيل ثم يعيدها في نهايته، فتتسابق التشغيلات المتزامنة عليها:
+    # خيار global.appTest يُثبّت مرة واحدة، وتُحفظ آخر نسخة من Runtime لتُعاد بدلاً من الخطأ.
+    # التعديل يقتصر على مدة الاختبار ويُعاد كل شيء كما كان عند الخروج
+    if not streamlit.__version__.startswith(STREAMLIT_TESTED_VERSION + "."):
+        print(f"تنبيه: اختبار الحمل جُرّب مع Streamlit {STREAMLIT_TESTED_VERSION} والمثبت {streamlit.__version__}")
+    original_option = config.get_option("global.appTest")
+    original_instance = Runtime.__dict__["instance"]
+    original_exists = Runtime.__dict__["exists"]
+    last = []
+
+    def current(cls):
+        runtime = cls._instance
+        if runtime is not None:
+            last[:] = [runtime]
+            return runtime
+        return last[0] if last else None
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    config.set_option("global.appTest", True)
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+    try:
+        yield
+    finally:
+        Runtime.instance = original_instance
+        Runtime.exists = original_exists
+        config.set_option("global.appTest", original_option)
+
+def install_stand_in(backend):
+    # كل جلسات المجمعات تُنشأ من البديل المحلي بدلاً من Snowflake
+    database._create_session = lambda workload: StandInSession(backend)
+
+class ActionFailed(Exception):
+    pass
+
+class LoadTestResults:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, action, elapsed, queries, error=None):
+        with self._lock:
+            if error:
+                self.errors[action][error] += 1
+            else:
+                self.latencies[action].append(elapsed)
+                self.queries[action].append(queries)
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+class VirtualUser(ABC):
+    def __init__(self, harness, actor, username):
+        self.harness = harness
+        self.actor = actor
+        self.username = username
+        self.rng = random.Random(actor)
+        self.at = None
+
+    def run_app(self):
+        self.at.run(timeout=self.harness.timeout)
+        if self.at.exception:
+            raise ActionFailed(self.at.exception[0].message.splitlines()[0])
+        if self.at.error:
+            raise ActionFailed(self.at.error[0].value.splitlines()[0])
+
+    def timed(self, action, step):
+        before = self.harness.backend.queries_for(self.actor)
+        start = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)[:80]}"
+        elapsed = time.perf_counter() - start
+        self.harness.results.record(action, elapsed, self.harness.backend.queries_for(self.actor) - before, error)
+        return error is None
+
+    def think(self):
+        if self.harness.think_ms:
+            time.sleep(self.rng.uniform(0, 2 * self.harness.think_ms) / 1000)
+
+    def button(self, label):
+        return next(b for b in self.at.button if b.label == label)
+
+    def login(self):
+        self.at = AppTest.from_file(APP_PATH, default_timeout=self.harness.timeout)
+        self.at.session_state[ACTOR_KEY] = self.actor
+        self.run_app()
+        self.at.text_input[0].input(self.username)
+        self.at.text_input[1].input(LOADTEST_PASSWORD)
+        self.button("تسجيل الدخول").click()
+        self.run_app()
+        if not self.at.session_state["authenticated"]:
+            raise ActionFailed("فشل تسجيل الدخول")
+
+    @abstractmethod
+    def session(self):
+        # جلسة استخدام واحدة (تسجيل الدخول ثم سلسلة إجراءات) يكررها loop حتى نهاية المرحلة
+        pass
+
+    def loop(self, deadline):
+        while time.monotonic() < deadline:
+            self.session()
+
+class VirtualEmployee(VirtualUser):
+    def open_survey(self):
+        surveys = self.harness.data.user_surveys[self.harness.data.users[self.username][0]]
+        self.at.multiselect(key="selected_surveys").set_value([self.rng.choice(surveys)])
+        self.run_app()
+
+    def fill_form(self):
+        for widget in self.at.text_input:
+            if widget.key and widget.key.startswith("text_"):
+                widget.input(f"إجابة {self.actor}")
+        for widget in self.at.checkbox:
+            if widget.key and widget.key.startswith("checkbox_"):
+                widget.check()
+
+    def save_draft(self):
+        self.fill_form()
+        self.button("💾 حفظ مسودة").click()
+        self.run_app()
+
+    def submit(self):
+        self.fill_form()
+        self.button("🚀 إرسال النموذج").click()
+        self.run_app()
+
+    def session(self):
+        if not self.timed("login", self.login):
+            return self.think()
+        self.think()
+        if not self.timed("open_survey", self.open_survey):
+            return self.think()
+        # الاستبيان أُكمل اليوم بالفعل: لا يوجد نموذج للإرسال في هذه الجلسة
+        if not any(b.label == "🚀 إرسال النموذج" for b in self.at.button):
+            return self.think()
+        self.think()
+        self.timed("save_draft", self.save_draft)
+        self.think()
+        self.timed("submit", self.submit)
+        self.think()
+
+class VirtualGovernorateAdmin(VirtualUser):
+    def browse_responses(self):
+        # AppTest يعرض الخيارات بعد format_func، لذا تُختار القيم الأصلية (المعرفات) مباشرة
+        self.at.selectbox(key="survey_select").set_value(self.rng.choice(list(self.harness.data.surveys)))
+        self.run_app()
+        responses = next(s for s in self.at.selectbox if s.key and s.key.startswith("response_select_"))
+        response_id = int(self.rng.choice(responses.options).split("#")[-1])
+        responses.set_value(response_id)
+        self.run_app()
+
+    def edit_details(self):
+        inputs = [w for w in self.at.text_input if w.key and w.key.startswith("edit_input_")]
+        self.rng.choice(inputs).input(f"تعديل {self.rng.randrange(1000)}")
+        self.button("💾 حفظ جميع التعديلات").click()
+        self.run_app()
+
+    def session(self):
+        if not self.timed("gov_login", self.login):
+            return self.think()
+        for _ in range(3):
+            self.think()
+            if not self.timed("browse_responses", self.browse_responses):
+                return self.think()
+            self.think()
+            self.timed("edit_details", self.edit_details)
+
+class LoadTestHarness:
+    def __init__(self, data, backend, timeout=30, think_ms=500):
+        self.data = data
+        self.backend = backend
+        self.timeout = timeout
+        self.think_ms = think_ms
+        self.results = None
+
+    def run_stage(self, employees, gov_admins, duration):
+        self.results = LoadTestResults()
+        users = [VirtualEmployee(self, f"emp{i}", f"emp{i}") for i in range(1, employees + 1)]
+        users += [VirtualGovernorateAdmin(self, f"gov{i}", f"gov{i}") for i in range(1, gov_admins + 1)]
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=user.loop, args=(deadline,), daemon=True) for user in users]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.results, time.monotonic() - start
+
+def print_report(employees, gov_admins, results, elapsed, slo_p99_ms):
+    print(f"\n=== {employees} موظف، {gov_admins} مسؤول محافظة، {elapsed:.0f} ثانية ===")
+    print(f"{'الإجراء':<18}{'العدد':>8}{'أخطاء':>8}{'/ثانية':>9}"
+          + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + f"{'استعلام/إجراء':>15}")
+    healthy = True
+    total = 0
+    for action in sorted(set(results.latencies) | set(results.errors)):
+        latencies = results.latencies.get(action, [])
+        errors = sum(results.errors[action].values())
+        total += len(latencies)
+        row = f"{action:<18}{len(latencies):>8}{errors:>8}{len(latencies) / elapsed:>9.2f}"
+        if latencies:
+            values = [percentile(latencies, p) * 1000 for p in PERCENTILES]
+            row += "".join(f"{v:>10.0f}" for v in values)
+            row += f"{sum(results.queries[action]) / len(latencies):>15.1f}"
+            if slo_p99_ms and values[-1] > slo_p99_ms:
+                healthy = False
+        else:
+            row += "".join(f"{'-':>10}" for _ in PERCENTILES) + f"{'-':>15}"
+        if errors > 0.01 * (len(latencies) + errors):
+            healthy = False
+        print(row)
+        for error, count in sorted(results.errors[action].items(), key=lambda item: -item[1])[:3]:
+            print(f"    {count} × {error}")
+    print(f"الإنتاجية الكلية: {total / elapsed:.2f} إجراء/ثانية")
+    return healthy
+
+def parse_counts(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="اختبار حمل نظام إدارة الاستبيانات")
+    parser.add_argument("--employees", type=parse_counts, default=[10],
+                        help="عدد الموظفين المتزامنين، أو عدة مراحل مفصولة بفواصل (10,50,100)")
+    parser.add_argument("--gov-admins", type=parse_counts, default=[2],
+                        help="عدد مسؤولي المحافظات لكل مرحلة (قيمة واحدة تُطبق على كل المراحل)")
+    parser.add_argument("--duration", type=float, default=60, help="مدة كل مرحلة بالثواني")
+    parser.add_argument("--latency-ms", type=float, default=50, help="زمن استجابة كل استعلام في البديل المحلي")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--max-concurrent-queries", type=int, default=0,
+                        help="حد الاستعلامات المتزامنة في المستودع (0 = بلا حد)")
+    parser.add_argument("--think-ms", type=float, default=500, help="متوسط زمن التفكير بين الإجراءات")
+    parser.add_argument("--timeout", type=float, default=30, help="أقصى زمن لتشغيل سكربت واحد")
+    parser.add_argument("--slo-p99-ms", type=float, default=2000,
+                        help="تُعتبر المرحلة فاشلة إذا تجاوز p99 لأي إجراء هذا الحد أو زادت الأخطاء عن 1%%")
+    parser.add_argument("--responses-per-survey", type=int, default=500)
+    args = parser.parse_args()
+    if len(args.gov_admins) not in (1, len(args.employees)):
+        parser.error("--gov-admins يجب أن يكون قيمة واحدة أو بعدد مراحل --employees")
+
+    stages = list(zip(args.employees, args.gov_admins * len(args.employees)
+                      if len(args.gov_admins) == 1 else args.gov_admins))
+    data = StandInData(max(e for e, _ in stages), max(g for _, g in stages),
+                       responses_per_survey=args.responses_per_survey)
+    backend = StandInBackend(data, args.latency_ms, args.jitter_ms, args.max_concurrent_queries)
+    install_stand_in(backend)
+    harness = LoadTestHarness(data, backend, timeout=args.timeout, think_ms=args.think_ms)
+
+    capacity = None
+    with concurrent_apptest():
+        for employees, gov_admins in stages:
+            results, elapsed = harness.run_stage(employees, gov_admins, args.duration)
+            if print_report(employees, gov_admins, results, elapsed, args.slo_p99_ms):
+                capacity = (employees, gov_admins)
+            else:
+                print("تجاوزت هذه المرحلة حدود الأداء المحددة")
+                break
+
+    queue_stats = get_submission_queue_stats()
+    print(f"\nسجل الإرسال: {queue_stats['pending']} في الانتظار، تأخير {queue_stats['lag_seconds']:.1f} ثانية")
+    print(f"استعلامات الخلفية: {backend.queries_for(BACKGROUND_ACTOR)}")
+    if backend.unmatched:
+        print("استعلامات لم يتعرف عليها البديل المحلي (أُرجعت نتيجة فارغة):")
+        for query, count in sorted(backend.unmatched.items(), key=lambda item: -item[1])[:10]:
+            print(f"    {count} × {query}")
+    if capacity:
+        print(f"\nأعلى حمل ضمن الحدود: {capacity[0]} موظف، {capacity[1]} مسؤول محافظة")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import os
+import mmap
+import time
+import fcntl
+import pickle
+import struct
+import hashlib
+import secrets
+import tempfile
+from urllib.parse import urlparse
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# طبقة ذاكرة مؤقتة مشتركة بين نسخ التطبيق (اختيارية)
+# SHARED_CACHE_URL: redis://host:6379/0 لعدة خوادم، أو file:///path/to/dir لعدة عمليات على خادم واحد
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "")
+SHARED_CACHE_TTL_SECONDS = int(os.getenv("SHARED_CACHE_TTL_SECONDS", "3600"))
+SHARED_CACHE_LOCK_SECONDS = int(os.getenv("SHARED_CACHE_LOCK_SECONDS", "30"))
+SHARED_CACHE_WAIT_SECONDS = float(os.getenv("SHARED_CACHE_WAIT_SECONDS", "10"))
+SHARED_CACHE_POLL_SECONDS = 0.05
+SHARED_CACHE_PREFIX = "snowflakesurvey:cache:"
+
+# القيم تُخزن بصيغة pickle، لذا يجب أن تكون الذاكرة المشتركة خاصة بهذا التطبيق فقط
+MISS = object()
+
+class RedisCacheBackend:
+    def __init__(self, client):
+        self._client = client
+        self._tokens = {}
+
+    def get(self, key):
+        try:
+            data = self._client.get(SHARED_CACHE_PREFIX + key)
+        except redis.RedisError:
+            return MISS
+        return MISS if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        try:
+            self._client.set(SHARED_CACHE_PREFIX + key, pickle.dumps(value), ex=ttl)
+        except (redis.RedisError, pickle.PicklingError, TypeError):
+            pass
+
+    def acquire_lock(self, key, ttl):
+        token = secrets.token_hex(16)
+        try:
+            acquired = self._client.set(SHARED_CACHE_PREFIX + "lock:" + key, token, nx=True, ex=ttl)
+        except redis.RedisError:
+            return None
+        if acquired:
+            self._tokens[key] = token
+            return True
+        return False
+
+    def is_locked(self, key):
+        try:
+            return bool(self._client.exists(SHARED_CACHE_PREFIX + "lock:" + key))
+        except redis.RedisError:
+            return False
+
+    def release_lock(self, key):
+        # حذف القفل فقط إن كان ما زال لنا (لم ينتهِ ويأخذه غيرنا)
+        token = self._tokens.pop(key, None)
+        lock_key = SHARED_CACHE_PREFIX + "lock:" + key
+        try:
+            with self._client.pipeline() as pipe:
+                pipe.watch(lock_key)
+                current = pipe.get(lock_key)
+                if isinstance(current, bytes):
+                    current = current.decode()
+                if current is not None and current == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    pipe.execute()
+                else:
+                    pipe.unwatch()
+        except redis.RedisError:
+            pass
+
+class FileCacheBackend:
+    # كل مفتاح في ملف مستقل: 8 بايت لوقت الانتهاء ثم القيمة؛ القراءة عبر mmap والقفل عبر flock
+    _HEADER = struct.Struct("d")
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._locks = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix):
+        return os.path.join(self._directory, hashlib.sha256(key.encode()).hexdigest() + suffix)
+
+    def get(self, key):
+        try:
+            with open(self._path(key, ".cache"), "rb") as f:
+                if os.fstat(f.fileno()).st_size <= self._HEADER.size:
+                    return MISS
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    expires_at, = self._HEADER.unpack_from(data)
+                    if expires_at < time.time():
+                        return MISS
+                    return pickle.loads(data[self._HEADER.size:])
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            return MISS
+
+    def set(self, key, value, ttl):
+        # الكتابة في ملف مؤقت ثم استبداله حتى لا يقرأ أحد ملفاً ناقصاً
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._HEADER.pack(time.time() + ttl))
+                f.write(pickle.dumps(value))
+            os.replace(tmp_path, self._path(key, ".cache"))
+        except (OSError, pickle.PicklingError, TypeError):
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def acquire_lock(self, key, ttl):
+        try:
+            f = open(self._path(key, ".lock"), "a")
+        except OSError:
+            return None
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._locks[key] = f
+        return True
+
+    def is_locked(self, key):
+        try:
+            with open(self._path(key, ".lock"), "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                return False
+        except OSError:
+            return True
+
+    def release_lock(self, key):
+        f = self._locks.pop(key, None)
+        if f is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            f.close()
+
+def create_backend(url):
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme in ("redis", "rediss", "unix"):
+        if redis is None:
+            raise RuntimeError("SHARED_CACHE_URL يتطلب تثبيت مكتبة redis")
+        return RedisCacheBackend(redis.Redis.from_url(url))
+    if parsed.scheme == "file":
+        return FileCacheBackend(parsed.path)
+    raise ValueError(f"نوع الذاكرة المشتركة غير مدعوم: {parsed.scheme}")
+
+_backend = create_backend(SHARED_CACHE_URL)
+
+def set_shared_cache_backend(backend):
+    global _backend
+    _backend = backend
+
+def get_shared_cache_backend():
+    return _backend
+
+def get_or_compute(key, compute, ttl=SHARED_CACHE_TTL_SECONDS):
+    # دمج الطلبات: عند غياب المفتاح تنفذ نسخة واحدة فقط الاستعلام وتنتظر البقية النتيجة
+    backend = _backend
+    if backend is None:
+        return compute()
+
+    value = backend.get(key)
+    if value is not MISS:
+        return value
+
+    acquired = backend.acquire_lock(key, SHARED_CACHE_LOCK_SECONDS)
+    if acquired is None:
+        # الذاكرة المشتركة غير متاحة: نكمل مباشرة من Snowflake
+        return compute()
+
+    if acquired:
+        try:
+            # قد تكون نسخة أخرى أكملت التحميل بين القراءة وأخذ القفل
+            value = backend.get(key)
+            if value is not MISS:
+                return value
+            value = compute()
+            # النتائج الفارغة قد تكون ناتجة عن خطأ فلا تُشارك
+            if value:
+                backend.set(key, value, ttl)
+            return value
+        finally:
+            backend.release_lock(key)
+
+    deadline = time.monotonic() + SHARED_CACHE_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(SHARED_CACHE_POLL_SECONDS)
+        value = backend.get(key)
+        if value is not MISS:
+            return value
+        if not backend.is_locked(key):
+            # انتهى صاحب القفل دون تخزين نتيجة (خطأ أو نتيجة فارغة)
+            break
+    return compute()
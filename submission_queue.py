@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, date, timezone
+from database import deliver_submissions
+
+# إعدادات سجل الإرسال المحلي (يُكتب فوراً ثم يُسلَّم إلى Snowflake في الخلفية)
+SUBMISSION_JOURNAL_PATH = os.getenv("SUBMISSION_JOURNAL_PATH", "submissions_journal.db")
+SUBMISSION_BATCH_SIZE = int(os.getenv("SUBMISSION_BATCH_SIZE", "100"))
+SUBMISSION_FLUSH_SECONDS = float(os.getenv("SUBMISSION_FLUSH_SECONDS", "1"))
+SUBMISSION_MAX_ATTEMPTS = int(os.getenv("SUBMISSION_MAX_ATTEMPTS", "20"))
+SUBMISSION_MAX_BACKOFF_SECONDS = float(os.getenv("SUBMISSION_MAX_BACKOFF_SECONDS", "300"))
+SUBMISSION_LEASE_SECONDS = float(os.getenv("SUBMISSION_LEASE_SECONDS", "120"))
+
+logger = logging.getLogger(__name__)
+
+_flusher = None
+_flusher_lock = threading.Lock()
+_wake = threading.Event()
+
+def _connect():
+    conn = sqlite3.connect(SUBMISSION_JOURNAL_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS SUBMISSIONS (
+            IDEMPOTENCY_KEY TEXT PRIMARY KEY,
+            USER_ID INTEGER NOT NULL,
+            SURVEY_ID INTEGER NOT NULL,
+            IS_COMPLETED INTEGER NOT NULL,
+            PAYLOAD TEXT NOT NULL,
+            STATUS TEXT NOT NULL DEFAULT 'pending',
+            ATTEMPTS INTEGER NOT NULL DEFAULT 0,
+            NEXT_ATTEMPT_AT REAL NOT NULL,
+            CREATED_AT REAL NOT NULL,
+            DELIVERED_AT REAL,
+            LAST_ERROR TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS IDX_SUBMISSIONS_STATUS ON SUBMISSIONS (STATUS, NEXT_ATTEMPT_AT)")
+    return conn
+
+def enqueue_submission(idempotency_key, survey_id, user_id, region_id, is_completed, survey_version, answers):
+    # حفظ الإرسال محلياً بشكل دائم؛ تكرار نفس المفتاح لا ينشئ إرسالاً جديداً
+    now = time.time()
+    payload = {
+        'key': idempotency_key,
+        'survey_id': survey_id,
+        'user_id': user_id,
+        'region_id': region_id,
+        'is_completed': bool(is_completed),
+        'survey_version': survey_version,
+        # وقت الإدخال عند العميل بتوقيت UTC مع الإزاحة؛ SUBMISSION_DATE يضبطه الخادم عند التسليم
+        'submitted_at': datetime.fromtimestamp(now, timezone.utc).isoformat(sep=' '),
+        'answers': {str(field_id): str(answer) for field_id, answer in answers.items() if answer is not None}
+    }
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute('''
+                INSERT OR IGNORE INTO SUBMISSIONS
+                    (IDEMPOTENCY_KEY, USER_ID, SURVEY_ID, IS_COMPLETED, PAYLOAD, NEXT_ATTEMPT_AT, CREATED_AT)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (idempotency_key, user_id, survey_id, int(bool(is_completed)),
+                  json.dumps(payload, ensure_ascii=False), now, now))
+    finally:
+        conn.close()
+
+    start_submission_flusher()
+    _wake.set()
+    return idempotency_key
+
+def has_pending_completion(user_id, survey_id):
+    # إرسال مكتمل اليوم لم يصل بعد إلى Snowflake
+    start_of_day = datetime.combine(date.today(), datetime.min.time()).timestamp()
+    conn = _connect()
+    try:
+        row = conn.execute('''
+            SELECT 1 FROM SUBMISSIONS
+            WHERE USER_ID = ? AND SURVEY_ID = ? AND IS_COMPLETED = 1
+            AND STATUS NOT IN ('delivered', 'dropped') AND CREATED_AT >= ?
+            LIMIT 1
+        ''', (user_id, survey_id, start_of_day)).fetchone()
+        return row is not None
+    finally:
+        conn.close()
+
+@contextmanager
+def _hold_lease(keys, lease_until):
+    # تجديد حجز الدفعة أثناء التسليم: تسليم بطيء يتجاوز SUBMISSION_LEASE_SECONDS لا يسمح
+    # لعملية أخرى بحجز نفس الصفوف. التجديد مشروط بأن الحجز ما زال لنا (نفس NEXT_ATTEMPT_AT)
+    stop = threading.Event()
+
+    def renew():
+        current = lease_until
+        while not stop.wait(SUBMISSION_LEASE_SECONDS / 3):
+            renewed = time.time() + SUBMISSION_LEASE_SECONDS
+            try:
+                conn = _connect()
+                try:
+                    with conn:
+                        conn.execute("BEGIN")
+                        conn.executemany('''
+                            UPDATE SUBMISSIONS SET NEXT_ATTEMPT_AT = ?
+                            WHERE IDEMPOTENCY_KEY = ? AND STATUS = 'inflight' AND NEXT_ATTEMPT_AT = ?
+                        ''', [(renewed, key, current) for key in keys])
+                finally:
+                    conn.close()
+                current = renewed
+            except sqlite3.Error as e:
+                logger.warning("تعذر تجديد حجز دفعة سجل الإرسال: %s", e)
+
+    renewer = threading.Thread(target=renew, name="submission-lease", daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        renewer.join()
+
+def flush_submissions(limit=SUBMISSION_BATCH_SIZE):
+    # تسليم دفعة واحدة؛ التسليم في Snowflake يتجاهل المفاتيح المسلَّمة سابقاً (مرة واحدة بالضبط)
+    now = time.time()
+    conn = _connect()
+    try:
+        # حجز الدفعة حتى لا تُسلّمها عملية أخرى تشارك نفس الملف؛ الحجز المنتهي يُعاد تلقائياً
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute('''
+            SELECT IDEMPOTENCY_KEY, PAYLOAD, ATTEMPTS FROM SUBMISSIONS
+            WHERE STATUS IN ('pending', 'inflight') AND NEXT_ATTEMPT_AT <= ?
+            ORDER BY CREATED_AT
+            LIMIT ?
+        ''', (now, limit)).fetchall()
+        lease_until = now + SUBMISSION_LEASE_SECONDS
+        conn.executemany(
+            "UPDATE SUBMISSIONS SET STATUS = 'inflight', NEXT_ATTEMPT_AT = ? WHERE IDEMPOTENCY_KEY = ?",
+            [(lease_until, row[0]) for row in rows]
+        )
+        conn.commit()
+        if not rows:
+            return 0
+
+        error = "فشل التسليم إلى Snowflake"
+        try:
+            with _hold_lease([row[0] for row in rows], lease_until):
+                dropped = deliver_submissions([json.loads(row[1]) for row in rows])
+        except Exception as e:
+            # تعذر الاتصال بـ Snowflake أصلاً: نفس مسار الفشل حتى لا يبقى الحجز معلقاً
+            logger.warning("تعذر تسليم دفعة من سجل الإرسال: %s", e)
+            dropped = None
+            error = f"{error}: {e}"[:2000]
+
+        if dropped is not None:
+            # الإرسالات التي حُذف استبيانها تُعلَّم dropped ولا يُعاد تسليمها
+            dropped = set(dropped)
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "UPDATE SUBMISSIONS SET STATUS = 'delivered', DELIVERED_AT = ?, LAST_ERROR = NULL WHERE IDEMPOTENCY_KEY = ?",
+                    [(time.time(), row[0]) for row in rows if row[0] not in dropped]
+                )
+                conn.executemany(
+                    "UPDATE SUBMISSIONS SET STATUS = 'dropped', LAST_ERROR = ? WHERE IDEMPOTENCY_KEY = ?",
+                    [("الاستبيان محذوف", key) for key in dropped]
+                )
+            return len(rows)
+
+        with conn:
+            conn.execute("BEGIN")
+            for key, _, attempts in rows:
+                attempts += 1
+                backoff = min(2 ** attempts, SUBMISSION_MAX_BACKOFF_SECONDS)
+                status = 'failed' if attempts >= SUBMISSION_MAX_ATTEMPTS else 'pending'
+                conn.execute('''
+                    UPDATE SUBMISSIONS
+                    SET ATTEMPTS = ?, NEXT_ATTEMPT_AT = ?, STATUS = ?, LAST_ERROR = ?
+                    WHERE IDEMPOTENCY_KEY = ?
+                ''', (attempts, now + backoff, status, error, key))
+        return 0
+    finally:
+        conn.close()
+
+def retry_failed_submissions():
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("BEGIN")
+            return conn.execute(
+                "UPDATE SUBMISSIONS SET STATUS = 'pending', ATTEMPTS = 0, NEXT_ATTEMPT_AT = ? WHERE STATUS = 'failed'",
+                (time.time(),)
+            ).rowcount
+    finally:
+        conn.close()
+
+def get_submission_queue_stats():
+    conn = _connect()
+    try:
+        pending, failed, oldest_pending, delivered_last_hour = conn.execute('''
+            SELECT
+                SUM(STATUS IN ('pending', 'inflight')),
+                SUM(STATUS = 'failed'),
+                MIN(CASE WHEN STATUS IN ('pending', 'inflight') THEN CREATED_AT END),
+                SUM(STATUS = 'delivered' AND DELIVERED_AT >= ?)
+            FROM SUBMISSIONS
+        ''', (time.time() - 3600,)).fetchone()
+        return {
+            'pending': pending or 0,
+            'failed': failed or 0,
+            'lag_seconds': time.time() - oldest_pending if oldest_pending else 0,
+            'delivered_last_hour': delivered_last_hour or 0
+        }
+    finally:
+        conn.close()
+
+def _flusher_loop():
+    failures = 0
+    while True:
+        _wake.wait(SUBMISSION_FLUSH_SECONDS)
+        _wake.clear()
+        try:
+            # الاستمرار ما دامت هناك دفعات كاملة جاهزة
+            while flush_submissions() == SUBMISSION_BATCH_SIZE:
+                pass
+            failures = 0
+        except Exception as e:
+            # أي خطأ (الملف المحلي أو الاتصال) لا يوقف الخيط؛ ننتظر مدة متزايدة ثم نعيد المحاولة
+            failures += 1
+            logger.warning("خطأ في تسليم سجل الإرسال: %s", e)
+            time.sleep(min(SUBMISSION_FLUSH_SECONDS * 2 ** failures, SUBMISSION_MAX_BACKOFF_SECONDS))
+
+def start_submission_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flusher_loop, name="submission-flusher", daemon=True)
+            _flusher.start()
@@ -0,0 +1,75 @@
+import json
+from types import MappingProxyType
+from typing import NamedTuple, Optional, Tuple, Callable, Mapping
+import streamlit as st
+from database import get_survey_fields, get_survey_current_version
+
+# دوال التحقق من الحقول المطلوبة حسب نوع الحقل
+REQUIRED_VALIDATORS = {
+    'text': lambda value: value is not None and bool(str(value).strip()),
+    'number': lambda value: value is not None,
+    'dropdown': lambda value: bool(value),
+    'checkbox': lambda value: bool(value),
+    'date': lambda value: value is not None,
+}
+
+class FieldPlan(NamedTuple):
+    field_id: int
+    label: str
+    field_type: str
+    options: Tuple[str, ...]
+    option_index: Mapping[str, int]
+    is_required: bool
+    order: int
+    validator: Optional[Callable]
+
+class SurveyPlan(NamedTuple):
+    survey_id: int
+    version: int
+    fields: Tuple[FieldPlan, ...]
+    by_id: Mapping[int, FieldPlan]
+    required: Tuple[FieldPlan, ...]
+
+def compile_field(field):
+    field_id, label, field_type, options, is_required, order = field
+    options_list = tuple(json.loads(options)) if options else ()
+    return FieldPlan(
+        field_id=field_id,
+        label=label,
+        field_type=field_type,
+        options=options_list,
+        option_index=MappingProxyType({option: i for i, option in enumerate(options_list)}),
+        is_required=bool(is_required),
+        order=order,
+        validator=REQUIRED_VALIDATORS.get(field_type, bool) if is_required else None
+    )
+
+def compile_survey(survey_id, version, fields):
+    compiled = tuple(compile_field(field) for field in fields)
+    return SurveyPlan(
+        survey_id=survey_id,
+        version=version,
+        fields=compiled,
+        by_id=MappingProxyType({f.field_id: f for f in compiled}),
+        required=tuple(f for f in compiled if f.is_required)
+    )
+
+@st.cache_resource(max_entries=1000, show_spinner=False)
+def _load_survey_plan(survey_id, version):
+    # نسخ الاستبيان لا تتغير، لذا تُخزن الخطة بلا مدة صلاحية وتُشارك بين جميع الجلسات
+    fields = get_survey_fields(survey_id, version)
+    if not fields:
+        # لا نخزن نتيجة فارغة قد تكون ناتجة عن خطأ اتصال
+        raise LookupError((survey_id, version))
+    return compile_survey(survey_id, version, fields)
+
+def get_survey_plan(survey_id, version=None):
+    if version is None:
+        version = get_survey_current_version(survey_id)
+    try:
+        return _load_survey_plan(survey_id, version)
+    except LookupError:
+        return compile_survey(survey_id, version, ())
+
+def missing_required_fields(plan, answers):
+    return [f.label for f in plan.required if not f.validator(answers.get(f.field_id))]
@@ -0,0 +1,111 @@
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import loaders
+from loaders import BatchLoader, begin_request
+
+
+@pytest.fixture
+def script_run(monkeypatch):
+    # تشغيل سكربت وهمي: حالة جلسة عادية وسياق تشغيل موجود
+    monkeypatch.setattr(loaders, "st", SimpleNamespace(session_state={}))
+    monkeypatch.setattr(loaders, "get_script_run_ctx", lambda suppress_warning=False: object())
+    begin_request()
+
+
+@pytest.fixture
+def no_script_run(monkeypatch):
+    monkeypatch.setattr(loaders, "st", SimpleNamespace(session_state={}))
+    monkeypatch.setattr(loaders, "get_script_run_ctx", lambda suppress_warning=False: None)
+
+
+def make_loader(max_batch_size=loaders.LOADER_MAX_BATCH_SIZE):
+    calls = []
+
+    async def load_names(ids):
+        calls.append(sorted(ids))
+        return {i: f"name-{i}" for i in ids if i != 404}
+
+    return BatchLoader("names", load_names, max_batch_size), calls
+
+
+async def gather(loader, *keys):
+    return await asyncio.gather(*(loader.load(key) for key in keys))
+
+
+def test_concurrent_loads_share_one_batch(no_script_run):
+    loader, calls = make_loader()
+
+    assert asyncio.run(gather(loader, 1, 2, 1, 404)) == ["name-1", "name-2", "name-1", None]
+    assert calls == [[1, 2, 404]]
+
+
+def test_batches_are_split_by_max_size(no_script_run):
+    loader, calls = make_loader(max_batch_size=2)
+
+    assert asyncio.run(loader.load_many([1, 2, 3])) == ["name-1", "name-2", "name-3"]
+    assert calls == [[1, 2], [3]]
+
+
+def test_results_are_memoized_for_the_script_run(script_run):
+    loader, calls = make_loader()
+
+    assert asyncio.run(loader.load(1)) == "name-1"
+    assert asyncio.run(loader.load(1)) == "name-1"
+    # القيم غير الموجودة لا تُحفظ
+    assert asyncio.run(loader.load(404)) is None
+    assert asyncio.run(loader.load(404)) is None
+    assert calls == [[1], [404], [404]]
+
+    loader.clear(1)
+    asyncio.run(loader.load(1))
+    begin_request()
+    asyncio.run(loader.load(1))
+    assert calls[3:] == [[1], [1]]
+
+
+def test_deferred_keys_join_the_first_load(script_run):
+    loader, calls = make_loader()
+    loader.defer([1, 2, 3])
+
+    # كل load في حلقة مستقلة كما في run_sync، والمؤجل منها يُجلب مع أول طلب
+    assert asyncio.run(loader.load(2)) == "name-2"
+    assert asyncio.run(loader.load(1)) == "name-1"
+    assert asyncio.run(loader.load(3)) == "name-3"
+    assert calls == [[1, 2, 3]]
+
+
+def test_prime_skips_the_query(script_run):
+    loader, calls = make_loader()
+    loader.prime(5, "primed")
+
+    assert asyncio.run(loader.load(5)) == "primed"
+    assert calls == []
+
+
+def test_no_memo_outside_a_script_run(no_script_run):
+    loader, calls = make_loader()
+    loader.defer([1, 2])
+
+    asyncio.run(loader.load(1))
+    asyncio.run(loader.load(1))
+    assert calls == [[1], [1]]
+
+
+def test_batch_error_reaches_every_caller(no_script_run):
+    async def fail(ids):
+        raise RuntimeError("warehouse suspended")
+
+    loader = BatchLoader("names", fail)
+
+    async def run():
+        return await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(result) for result in results] == ["warehouse suspended"] * 2
@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import threading
+
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import entity_cache
+import shared_cache
+from shared_cache import MISS, RedisCacheBackend, FileCacheBackend, get_or_compute, set_shared_cache_backend
+
+
+@pytest.fixture(params=["redis", "file"])
+def backend(request, tmp_path):
+    if request.param == "redis":
+        backend = RedisCacheBackend(fakeredis.FakeRedis())
+    else:
+        backend = FileCacheBackend(str(tmp_path))
+    previous = shared_cache.get_shared_cache_backend()
+    set_shared_cache_backend(backend)
+    yield backend
+    set_shared_cache_backend(previous)
+
+
+@pytest.fixture
+def entity_versions(monkeypatch):
+    # بدون Snowflake: العدادات تُضبط يدوياً والفحص الدوري معطل
+    monkeypatch.setattr(entity_cache, "poll_entity_versions", lambda force=False: None)
+    monkeypatch.setattr(entity_cache, "_versions", {entity_cache.ENTITY_SURVEYS: 1})
+    monkeypatch.setattr(entity_cache, "_cache", {})
+    return entity_cache._versions
+
+
+def test_get_set_round_trip(backend):
+    assert backend.get("survey:1") is MISS
+    backend.set("survey:1", {"name": "استبيان", "fields": [1, 2]}, 60)
+    assert backend.get("survey:1") == {"name": "استبيان", "fields": [1, 2]}
+
+
+def test_expired_value_is_a_miss(backend):
+    backend.set("survey:1", "old", -1)
+    assert backend.get("survey:1") is MISS
+
+
+def test_lock_is_exclusive_until_released(backend):
+    assert backend.acquire_lock("survey:1", 30) is True
+    assert backend.is_locked("survey:1")
+    other = RedisCacheBackend(backend._client) if isinstance(backend, RedisCacheBackend) else FileCacheBackend(backend._directory)
+    assert other.acquire_lock("survey:1", 30) is False
+    backend.release_lock("survey:1")
+    assert not backend.is_locked("survey:1")
+    assert other.acquire_lock("survey:1", 30) is True
+    other.release_lock("survey:1")
+
+
+def test_redis_release_keeps_lock_taken_by_another_owner():
+    client = fakeredis.FakeRedis()
+    first, second = RedisCacheBackend(client), RedisCacheBackend(client)
+    assert first.acquire_lock("survey:1", 30)
+    # انتهت مدة قفل الأول وأخذه الثاني
+    client.delete(shared_cache.SHARED_CACHE_PREFIX + "lock:survey:1")
+    assert second.acquire_lock("survey:1", 30)
+    first.release_lock("survey:1")
+    assert second.is_locked("survey:1")
+
+
+def test_single_flight_computes_once(backend):
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.3)
+        return ["row"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_or_compute("survey:1", compute)))
+               for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(calls) == 1
+    assert results == [["row"]] * 5
+
+
+def test_empty_result_is_not_shared(backend):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return []
+
+    assert get_or_compute("survey:1", compute) == []
+    assert get_or_compute("survey:1", compute) == []
+    assert len(calls) == 2
+    assert not backend.is_locked("survey:1")
+
+
+def test_no_backend_computes_directly():
+    previous = shared_cache.get_shared_cache_backend()
+    set_shared_cache_backend(None)
+    try:
+        assert get_or_compute("survey:1", lambda: "value") == "value"
+    finally:
+        set_shared_cache_backend(previous)
+
+
+def test_version_bump_changes_shared_key(backend, entity_versions):
+    calls = []
+
+    @entity_cache.versioned_cache(entity_cache.ENTITY_SURVEYS)
+    def get_survey_name(survey_id):
+        calls.append(survey_id)
+        return f"survey-{survey_id}-{len(calls)}"
+
+    assert get_survey_name(1) == "survey-1-1"
+    # نسخة أخرى من التطبيق بذاكرة محلية فارغة تقرأ من الذاكرة المشتركة
+    entity_cache._cache.clear()
+    assert get_survey_name(1) == "survey-1-1"
+    assert calls == [1]
+
+    # كتابة في أي نسخة ترفع العداد فيتغير المفتاح المشترك وتُهمل القيمة القديمة
+    entity_versions[entity_cache.ENTITY_SURVEYS] = 2
+    entity_cache.invalidate_entities(entity_cache.ENTITY_SURVEYS)
+    assert get_survey_name(1) == "survey-1-2"
+    assert calls == [1, 1]
+
+
+def test_unknown_version_skips_shared_cache(backend, entity_versions):
+    entity_versions.clear()
+    calls = []
+
+    @entity_cache.versioned_cache(entity_cache.ENTITY_SURVEYS)
+    def get_survey_name(survey_id):
+        calls.append(survey_id)
+        return "name"
+
+    get_survey_name(1)
+    entity_cache._cache.clear()
+    get_survey_name(1)
+    assert calls == [1, 1]
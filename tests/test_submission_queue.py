@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import submission_queue
+from submission_queue import (
+    enqueue_submission, flush_submissions, has_pending_completion, retry_failed_submissions,
+    get_submission_queue_stats
+)
+
+
+@pytest.fixture
+def journal(monkeypatch, tmp_path):
+    # سجل مؤقت بدون خيط التسليم؛ التسليم يُستدعى يدوياً عبر flush_submissions
+    path = str(tmp_path / "journal.db")
+    monkeypatch.setattr(submission_queue, "SUBMISSION_JOURNAL_PATH", path)
+    monkeypatch.setattr(submission_queue, "start_submission_flusher", lambda: None)
+    return path
+
+
+@pytest.fixture
+def delivered(monkeypatch):
+    batches = []
+
+    def deliver(payloads):
+        batches.append(payloads)
+        return []
+
+    monkeypatch.setattr(submission_queue, "deliver_submissions", deliver)
+    return batches
+
+
+def statuses(path):
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute("SELECT IDEMPOTENCY_KEY, STATUS FROM SUBMISSIONS").fetchall())
+    finally:
+        conn.close()
+
+
+def enqueue(key, is_completed=True):
+    return enqueue_submission(key, survey_id=1, user_id=7, region_id=3, is_completed=is_completed,
+                              survey_version=2, answers={10: "نعم", 11: None, 12: 5})
+
+
+def test_enqueue_is_idempotent(journal, delivered):
+    assert enqueue("k1") == "k1"
+    enqueue("k1")
+
+    assert statuses(journal) == {"k1": "pending"}
+    assert has_pending_completion(7, 1)
+    assert get_submission_queue_stats()["pending"] == 1
+
+
+def test_flush_delivers_and_marks_rows(journal, delivered):
+    enqueue("k1")
+    enqueue("k2", is_completed=False)
+
+    assert flush_submissions() == 2
+    assert [payload["key"] for payload in delivered[0]] == ["k1", "k2"]
+    # الإجابات الفارغة لا تُرسل والقيم تُحول إلى نصوص
+    assert delivered[0][0]["answers"] == {"10": "نعم", "12": "5"}
+    assert statuses(journal) == {"k1": "delivered", "k2": "delivered"}
+    assert not has_pending_completion(7, 1)
+    assert flush_submissions() == 0
+    assert len(delivered) == 1
+
+
+def test_dropped_survey_is_not_retried(journal, monkeypatch):
+    monkeypatch.setattr(submission_queue, "deliver_submissions", lambda payloads: ["k2"])
+    enqueue("k1")
+    enqueue("k2")
+
+    assert flush_submissions() == 2
+    assert statuses(journal) == {"k1": "delivered", "k2": "dropped"}
+    assert get_submission_queue_stats()["pending"] == 0
+
+
+def test_failed_delivery_backs_off_then_fails(journal, monkeypatch):
+    monkeypatch.setattr(submission_queue, "SUBMISSION_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(submission_queue, "deliver_submissions", lambda payloads: None)
+    enqueue("k1")
+
+    assert flush_submissions() == 0
+    assert statuses(journal) == {"k1": "pending"}
+    # المحاولة التالية مؤجلة فلا تُحجز الآن
+    assert flush_submissions() == 0
+
+    conn = sqlite3.connect(journal)
+    with conn:
+        conn.execute("UPDATE SUBMISSIONS SET NEXT_ATTEMPT_AT = 0")
+    conn.close()
+    assert flush_submissions() == 0
+    assert statuses(journal) == {"k1": "failed"}
+    assert get_submission_queue_stats()["failed"] == 1
+
+    assert retry_failed_submissions() == 1
+    assert statuses(journal) == {"k1": "pending"}
+
+
+def test_delivery_error_releases_the_lease(journal, monkeypatch):
+    def deliver(payloads):
+        raise ConnectionError("no route to Snowflake")
+
+    monkeypatch.setattr(submission_queue, "deliver_submissions", deliver)
+    enqueue("k1")
+
+    assert flush_submissions() == 0
+    conn = sqlite3.connect(journal)
+    status, attempts, error = conn.execute("SELECT STATUS, ATTEMPTS, LAST_ERROR FROM SUBMISSIONS").fetchone()
+    conn.close()
+    assert (status, attempts) == ("pending", 1)
+    assert "no route to Snowflake" in error
+
+
+def test_lease_is_renewed_during_slow_delivery(journal, monkeypatch):
+    monkeypatch.setattr(submission_queue, "SUBMISSION_LEASE_SECONDS", 0.6)
+    started = threading.Event()
+    calls = []
+
+    def deliver(payloads):
+        calls.append(payloads)
+        started.set()
+        time.sleep(1.5)
+        return []
+
+    monkeypatch.setattr(submission_queue, "deliver_submissions", deliver)
+    enqueue("k1")
+
+    first = []
+    flusher = threading.Thread(target=lambda: first.append(flush_submissions()))
+    flusher.start()
+    started.wait(5)
+    # بعد انتهاء مدة الحجز الأصلية ما زالت الدفعة محجوزة للتسليم الجاري
+    time.sleep(1)
+    assert flush_submissions() == 0
+    flusher.join(10)
+
+    assert first == [1]
+    assert len(calls) == 1
+    assert statuses(journal) == {"k1": "delivered"}
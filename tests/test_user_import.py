@@ -0,0 +1,76 @@
+import io
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import hash_password
+from user_import import IMPORT_COLUMNS, read_import_file, validate_import
+
+GOVERNORATES = [(1, "القاهرة"), (2, "الجيزة")]
+# (ADMIN_ID, ADMIN_NAME, GOVERNORATE_ID, GOVERNORATE_NAME)
+REGIONS = [(10, "إدارة شرق", 1, "القاهرة"), (20, "إدارة شرق", 2, "الجيزة")]
+SURVEYS = [(100, "استبيان 1"), (200, "استبيان 2")]
+
+
+def make_import(*rows):
+    df = pd.DataFrame(rows, columns=IMPORT_COLUMNS)
+    df.index = df.index + 2
+    return df
+
+
+def test_valid_rows_resolve_ids():
+    df = make_import(
+        ("employee1", "secret", "employee", "الجيزة", "إدارة شرق", "استبيان 1; استبيان 2"),
+        ("gov_admin1", "secret", "governorate_admin", "القاهرة", "", ""),
+        ("admin1", "secret", "admin", "", "", ""),
+    )
+    errors_df, users_df, user_surveys_df = validate_import(df, GOVERNORATES, REGIONS, SURVEYS, set())
+
+    assert errors_df.empty
+    assert users_df["USERNAME"].tolist() == ["employee1", "gov_admin1", "admin1"]
+    assert users_df["PASSWORD_HASH"].tolist() == [hash_password("secret")] * 3
+    # الإدارة الصحية تُحل داخل محافظة الصف وليس بالاسم فقط
+    assert users_df["ASSIGNED_REGION"].tolist() == [20, pd.NA, pd.NA]
+    assert users_df["GOVERNORATE_ID"].tolist() == [2, 1, pd.NA]
+    assert list(user_surveys_df.itertuples(index=False, name=None)) == [("employee1", 100), ("employee1", 200)]
+
+
+def test_errors_are_reported_per_row():
+    df = make_import(
+        ("", "secret", "employee", "القاهرة", "إدارة شرق", ""),
+        ("dup", "", "manager", "", "", ""),
+        ("dup", "secret", "employee", "الإسكندرية", "", ""),
+        ("existing", "secret", "employee", "القاهرة", "إدارة غرب", "استبيان 3"),
+    )
+    errors_df, users_df, user_surveys_df = validate_import(df, GOVERNORATES, REGIONS, SURVEYS, {"existing"})
+
+    assert users_df is None and user_surveys_df is None
+    assert list(errors_df.itertuples(index=False, name=None)) == sorted([
+        (2, "اسم المستخدم فارغ"),
+        (3, "كلمة المرور فارغة"),
+        (3, "الدور غير صالح"),
+        (3, "اسم المستخدم مكرر في الملف"),
+        (4, "اسم المستخدم مكرر في الملف"),
+        (4, "المحافظة غير معروفة"),
+        (4, "الإدارة الصحية مطلوبة للموظف"),
+        (5, "اسم المستخدم موجود مسبقاً"),
+        (5, "الإدارة الصحية غير معروفة في هذه المحافظة"),
+        (5, "الاستبيان غير معروف: استبيان 3"),
+    ])
+
+
+def test_read_import_file_normalizes_columns():
+    data = "Username, Password ,ROLE,governorate,health_admin,surveys,extra\n employee1 ,secret,Employee,القاهرة,إدارة شرق,,x\n"
+    upload = io.BytesIO(data.encode("utf-8-sig"))
+    upload.name = "users.csv"
+
+    df = read_import_file(upload)
+
+    assert list(df.columns) == IMPORT_COLUMNS
+    assert df.index.tolist() == [2]
+    assert df.loc[2, "username"] == "employee1"
+    assert df.loc[2, "role"] == "employee"
+    assert df.loc[2, "surveys"] == ""
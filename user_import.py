@@ -0,0 +1,91 @@
+import pandas as pd
+from auth import hash_password
+
+# أعمدة ملف استيراد المستخدمين
+IMPORT_COLUMNS = ["username", "password", "role", "governorate", "health_admin", "surveys"]
+VALID_ROLES = ["admin", "governorate_admin", "employee"]
+SURVEYS_SEPARATOR = ";"
+
+def import_template():
+    return pd.DataFrame([
+        {"username": "employee1", "password": "secret", "role": "employee",
+         "governorate": "القاهرة", "health_admin": "إدارة شرق", "surveys": "استبيان 1;استبيان 2"},
+        {"username": "gov_admin1", "password": "secret", "role": "governorate_admin",
+         "governorate": "القاهرة", "health_admin": "", "surveys": ""},
+    ], columns=IMPORT_COLUMNS)
+
+def read_import_file(uploaded_file):
+    if uploaded_file.name.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(uploaded_file, dtype=str)
+    else:
+        df = pd.read_csv(uploaded_file, dtype=str, encoding="utf-8-sig")
+
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    missing = [c for c in IMPORT_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"الأعمدة التالية مفقودة من الملف: {', '.join(missing)}")
+
+    df = df[IMPORT_COLUMNS].fillna("")
+    for column in IMPORT_COLUMNS:
+        df[column] = df[column].str.strip()
+    df["role"] = df["role"].str.lower()
+    df.index = df.index + 2  # رقم الصف كما يظهر في الملف (بعد سطر العناوين)
+    return df
+
+def validate_import(df, governorates, regions, surveys, existing_usernames):
+    # جميع الفحوص تتم على الأعمدة دفعة واحدة وتُرجع (رقم الصف، الخطأ)
+    errors = []
+
+    def flag(mask, message):
+        for row in df.index[mask]:
+            errors.append((row, message))
+
+    flag(df["username"] == "", "اسم المستخدم فارغ")
+    flag(df["password"] == "", "كلمة المرور فارغة")
+    flag(~df["role"].isin(VALID_ROLES), "الدور غير صالح")
+    flag(df["username"].duplicated(keep=False) & (df["username"] != ""), "اسم المستخدم مكرر في الملف")
+    flag(df["username"].isin(existing_usernames), "اسم المستخدم موجود مسبقاً")
+
+    gov_ids = {g[1]: g[0] for g in governorates}
+    needs_gov = df["role"].isin(["governorate_admin", "employee"])
+    flag(needs_gov & (df["governorate"] == ""), "المحافظة مطلوبة")
+    flag(needs_gov & (df["governorate"] != "") & ~df["governorate"].isin(gov_ids), "المحافظة غير معروفة")
+
+    regions_df = pd.DataFrame(
+        [(r[0], r[1], r[3]) for r in regions],
+        columns=["admin_id", "health_admin", "governorate"]
+    )
+    resolved = df[["governorate", "health_admin"]].reset_index().merge(
+        regions_df, on=["governorate", "health_admin"], how="left"
+    ).set_index("index")["admin_id"]
+    is_employee = df["role"] == "employee"
+    flag(is_employee & (df["health_admin"] == ""), "الإدارة الصحية مطلوبة للموظف")
+    flag(is_employee & (df["health_admin"] != "") & resolved.isna(), "الإدارة الصحية غير معروفة في هذه المحافظة")
+
+    survey_ids = {s[1]: s[0] for s in surveys}
+    user_surveys = df.loc[df["role"] != "admin", ["username", "surveys"]].copy()
+    user_surveys["survey_name"] = user_surveys["surveys"].str.split(SURVEYS_SEPARATOR)
+    user_surveys = user_surveys.explode("survey_name")
+    user_surveys["survey_name"] = user_surveys["survey_name"].str.strip()
+    user_surveys = user_surveys[user_surveys["survey_name"] != ""]
+    unknown = user_surveys[~user_surveys["survey_name"].isin(survey_ids)]
+    for row, name in unknown["survey_name"].items():
+        errors.append((row, f"الاستبيان غير معروف: {name}"))
+
+    errors_df = pd.DataFrame(sorted(errors), columns=["الصف", "الخطأ"])
+    if not errors_df.empty:
+        return errors_df, None, None
+
+    users_df = pd.DataFrame({
+        "USERNAME": df["username"],
+        # SHA-256 واحدة لكل كلمة مرور، تمريرة واحدة تكفي ولا حاجة لمجمع عمليات
+        "PASSWORD_HASH": df["password"].map(hash_password),
+        "ROLE": df["role"],
+        "ASSIGNED_REGION": resolved.where(is_employee).astype("Int64"),
+        "GOVERNORATE_ID": df["governorate"].map(gov_ids).astype("Int64"),
+    })
+    user_surveys_df = pd.DataFrame({
+        "USERNAME": user_surveys["username"].astype(str),
+        "SURVEY_ID": user_surveys["survey_name"].map(survey_ids).astype("int64"),
+    })
+    return errors_df, users_df, user_surveys_df